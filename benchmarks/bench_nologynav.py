@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import random
+import inspect
+import argparse
+import platform
+import tracemalloc
+import subprocess
+
+# Benchmarks for the extraction functions and the /get_summary request path.
+#
+#   python benchmarks/bench_nologynav.py --output benchmarks/results/baseline.json
+#   python benchmarks/bench_nologynav.py --compare benchmarks/results/baseline.json
+#
+# The Directions API is never called: the upstream session is replaced by one
+# that replays the recorded payloads in test/routes/.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "server"))
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.pop("ROUTE_STORE_PATH", None)
+
+import Google_API_Handler
+import NologyNav_Methods
+import Payload_Stream
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Route_Proximity import ProximityIndex
+
+ROUTES_DIR = os.path.join(ROOT, "test", "routes")
+ROUTE_FILES = sorted(name for name in os.listdir(ROUTES_DIR) if name.endswith(".json"))
+
+class ReplayResponse:
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+class ReplaySession:
+    """Answers every request with the recorded payload whose name (lowercased, as requests are sent) is in the origin."""
+
+    def __init__(self, bodies):
+        self.bodies = bodies
+
+    def post(self, url, **kwargs):
+        for name, body in self.bodies.items():
+            if "origin=" + name.lower() + "&" in url:
+                return ReplayResponse(body)
+        raise KeyError("No recorded payload for " + url)
+
+def measure(fn, min_time, min_rounds=20):
+    # Warm up, then time every call individually so percentiles are real.
+    for _ in range(3):
+        fn()
+
+    timings = []
+    clock = time.perf_counter_ns
+    deadline = clock() + int(min_time * 1e9)
+    while len(timings) < min_rounds or clock() < deadline:
+        started = clock()
+        fn()
+        timings.append(clock() - started)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    fn()
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename") if stat.size_diff > 0)
+
+    timings.sort()
+    mean = sum(timings) / len(timings)
+    return {
+        "rounds": len(timings),
+        "ops_per_sec": round(1e9 / mean, 1) if mean else None,
+        "mean_us": round(mean / 1000, 3),
+        "p50_us": round(timings[len(timings) // 2] / 1000, 3),
+        "p99_us": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] / 1000, 3),
+        "max_us": round(timings[-1] / 1000, 3),
+        "alloc_peak_bytes": peak,
+        "alloc_retained_bytes": allocated
+    }
+
+def extraction_cases(payloads):
+    # Every helper that reads a Directions payload is benchmarked against every
+    # fixture, so new helpers are picked up without touching this file.
+    cases = []
+    for module in (NologyNav_Methods, Google_API_Handler):
+        for name, fn in inspect.getmembers(module, inspect.isfunction):
+            if fn.__module__ != module.__name__:
+                continue
+            parameters = list(inspect.signature(fn).parameters)
+            if not parameters or parameters[0] not in ("route_data", "navigation_data"):
+                continue
+            extraArgs = tuple(0 for parameter in parameters[1:] if parameter == "legNumber")
+            for routeName, payload in payloads.items():
+                cases.append((f"{module.__name__}.{name}[{routeName}]", lambda fn=fn, payload=payload, extraArgs=extraArgs: fn(payload, *extraArgs)))
+    return cases
+
+def parsing_cases(bodies):
+    cases = []
+    for routeName, body in bodies.items():
+        chunks = [body[start:start + Google_API_Handler.STREAM_CHUNK_SIZE] for start in range(0, len(body), Google_API_Handler.STREAM_CHUNK_SIZE)]
+        cases.append((f"json.loads[{routeName}]", lambda body=body: json.loads(body)))
+        if Payload_Stream.streaming_available():
+            cases.append((f"Payload_Stream.parse_chunks[{routeName}]", lambda chunks=chunks: Payload_Stream.parse_chunks(chunks, "summary")))
+    return cases
+
+def handler_cases(bodies):
+    options = {"origin": "London_to_Paris", "destination": "Paris", "avoid": ("ferries", "tolls")}
+    cases = [
+        ("Google_API_Handler.url_builder", lambda: Google_API_Handler.url_builder(options)),
+        ("Google_API_Handler.retrieve_navigation_payload[cache hit]", lambda: Google_API_Handler.retrieve_navigation_payload(options)),
+        ("Google_API_Handler.retrieve_navigation_payload[stubbed upstream]", lambda: Google_API_Handler.retrieve_navigation_payload(options, use_cache=False)),
+        ("Google_API_Handler.retrieve_navigation_payload[stubbed upstream, summary fields]", lambda: Google_API_Handler.retrieve_navigation_payload(options, use_cache=False, fields=Google_API_Handler.SUMMARY_FIELDS))
+    ]
+    return cases
+
+def proximity_cases(routes=200000, radius=50):
+    # Starts spread over about 30 km, as for a city's worth of cached routes.
+    randomSource = random.Random(1)
+    index = ProximityIndex(radius, max_routes=routes)
+    for number in range(routes):
+        start = (51.5 + randomSource.uniform(-0.15, 0.15), -0.12 + randomSource.uniform(-0.25, 0.25))
+        end = (48.85 + randomSource.uniform(-0.15, 0.15), 2.35 + randomSource.uniform(-0.25, 0.25))
+        index.add("summary", number, start, end)
+    start, end = (51.5072, -0.1276), (48.8564, 2.3522)
+    return [(f"Route_Proximity.ProximityIndex.nearby[{routes} routes]", lambda: index.nearby("summary", start, end))]
+
+def endpoint_cases(bodies):
+    client = create_app().test_client()
+    cases = []
+    for routeName in bodies:
+        locations = {"origin": routeName, "destination": "benchmark"}
+        cases.append((f"POST /get_summary[{routeName}, cache hit]", lambda locations=locations: client.post("/get_summary", json=locations)))
+        cases.append((f"POST /get_summary[{routeName}, stubbed upstream]", lambda locations=locations: client.post("/get_summary", json=locations, headers={"Cache-Control": "no-cache"})))
+    return cases
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baselinePath, threshold):
+    with open(baselinePath) as baselineFile:
+        baseline = json.load(baselineFile)["results"]
+
+    regressions = []
+    print(f"\n{'benchmark':<90} {'base p50':>10} {'p50':>10} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline or "p50_us" not in result or "p50_us" not in baseline[name]:
+            continue
+        before = baseline[name]["p50_us"]
+        change = (result["p50_us"] - before) / before if before else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<90} {before:>10.2f} {result['p50_us']:>10.2f} {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark NologyNav extraction functions and the /get_summary path.")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds to spend timing each benchmark")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON file to compare p50 timings against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p50 slowdown counted as a regression (default 10%%)")
+    args = parser.parse_args(argv)
+
+    bodies = {}
+    for name in ROUTE_FILES:
+        with open(os.path.join(ROUTES_DIR, name), "rb") as routeFile:
+            bodies[name[:-len(".json")]] = routeFile.read()
+    payloads = {name: json.loads(body) for name, body in bodies.items()}
+
+    Google_API_Handler.get_session = lambda: ReplaySession(bodies)
+    Google_API_Handler.ROUTE_CACHE = RouteCache()
+    Google_API_Handler.ROUTE_STORE = None
+    # The replayed routes all go to "benchmark", which Google would geocode to
+    # a different place for each; asking by place ID would merge them.
+    Google_API_Handler.PLACE_IDS = False
+
+    cases = extraction_cases(payloads) + parsing_cases(bodies) + handler_cases(bodies) + proximity_cases() + endpoint_cases(bodies)
+
+    results = {}
+    for name, fn in cases:
+        if args.filter not in name:
+            continue
+        try:
+            results[name] = measure(fn, args.min_time)
+        except Exception as error:
+            results[name] = {"skipped": f"{type(error).__name__}: {error}"}
+            print(f"{name:<90} skipped ({results[name]['skipped']})")
+            continue
+        print(f"{name:<90} {results[name]['ops_per_sec']:>12.1f} ops/s  p50 {results[name]['p50_us']:>10.2f}us  p99 {results[name]['p99_us']:>10.2f}us  peak {results[name]['alloc_peak_bytes']:>9}B")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "min_time": args.min_time
+        },
+        "results": results
+    }
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as outputFile:
+            json.dump(report, outputFile, indent=4)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slowed down by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import time
+import threading
+from collections import deque
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitOpen(Exception):
+    """Raised instead of calling upstream while the circuit is open."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"The Directions API is failing; not calling it for {retry_after:.1f}s.")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Stops calling upstream while too many recent calls fail or are too slow.
+
+    Calls are judged over a sliding window. Once at least min_calls have
+    been made and failure_ratio of them failed or took longer than
+    slow_call_seconds, the circuit opens and calls are refused for
+    open_seconds. After that a few probe calls are let through (half-open):
+    a good probe closes the circuit again, a bad one re-opens it.
+    """
+
+    def __init__(self, failure_ratio=0.5, slow_call_seconds=5.0, min_calls=20, window=30.0, open_seconds=15.0, probes=1, clock=time.monotonic):
+        self.failure_ratio = failure_ratio
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._calls = deque()
+        self._failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = 0
+
+        self.opened = 0
+        self.refused = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._advance(self._clock())
+            return self._state
+
+    def _advance(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probing = 0
+        while self._calls and now - self._calls[0][0] > self.window:
+            _, failed = self._calls.popleft()
+            self._failures -= failed
+
+    def _open(self, now):
+        self._state = OPEN
+        self._opened_at = now
+        self._calls.clear()
+        self._failures = 0
+        self.opened += 1
+
+    def allow(self):
+        """Raises CircuitOpen unless a call may be made now; every allowed call must be recorded."""
+        with self._lock:
+            now = self._clock()
+            self._advance(now)
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._probing < self.probes:
+                self._probing += 1
+                return
+            self.refused += 1
+            retry_after = self.open_seconds - (now - self._opened_at) if self._state == OPEN else self.open_seconds
+            raise CircuitOpen(max(retry_after, 0.0))
+
+    def release(self):
+        """Gives back an allowed call that was not made after all, e.g. because the rate limit refused it."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = max(0, self._probing - 1)
+
+    def record(self, succeeded, seconds):
+        failed = not succeeded or seconds >= self.slow_call_seconds
+        with self._lock:
+            now = self._clock()
+            self._advance(now)
+            if self._state == HALF_OPEN:
+                self._probing = max(0, self._probing - 1)
+                if failed:
+                    self._open(now)
+                else:
+                    self._state = CLOSED
+                return
+            if self._state == OPEN:
+                # A call let through before the circuit opened.
+                return
+
+            self._calls.append((now, failed))
+            self._failures += failed
+            if len(self._calls) >= self.min_calls and self._failures >= self.failure_ratio * len(self._calls):
+                self._open(now)
+
+    def stats(self):
+        with self._lock:
+            self._advance(self._clock())
+            return {
+                "state": self._state,
+                "calls": len(self._calls),
+                "failures": self._failures,
+                "opened": self.opened,
+                "refused": self.refused
+            }
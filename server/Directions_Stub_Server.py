@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from flask import Flask, Response, request
+
+# A local stand-in for the Google Directions API that replays the recorded
+# payloads in test/routes/, for load tests that must not cost money or hit
+# quota. Point the app at it with:
+#
+#   python server/Directions_Stub_Server.py --port 5001 --latency lognormal:150:0.4 --error-rate 0.01
+#   GOOGLE_DIRECTIONS_URL=http://127.0.0.1:5001/maps/api/directions/json npm run start
+
+DEFAULT_ROUTES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test", "routes")
+DIRECTIONS_PATH = "/maps/api/directions/json"
+
+NOT_FOUND_BODY = json.dumps({
+    "geocoded_waypoints": [{"geocoder_status": "ZERO_RESULTS"}, {"geocoder_status": "ZERO_RESULTS"}],
+    "routes": [],
+    "status": "NOT_FOUND"
+}).encode("UTF-8")
+
+OVER_QUERY_LIMIT_BODY = json.dumps({
+    "error_message": "You have exceeded your rate-limit for this API.",
+    "routes": [],
+    "status": "OVER_QUERY_LIMIT"
+}).encode("UTF-8")
+
+def normalize_location(location):
+    return " ".join((location or "").replace("_", " ").lower().split())
+
+class Latency:
+    """Samples response delays in milliseconds, e.g. "fixed:50", "uniform:20:200", "normal:100:30", "lognormal:150:0.4"."""
+
+    def __init__(self, spec="none", rng=None):
+        self.spec = spec or "none"
+        self._rng = rng or random.Random()
+        parts = self.spec.split(":")
+        self.kind = parts[0]
+        self.params = [float(part) for part in parts[1:]]
+
+        expected = {"none": 0, "fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if self.kind not in expected or len(self.params) != expected[self.kind]:
+            raise ValueError(f"Unsupported latency spec: {spec}")
+
+    def sample(self):
+        if self.kind == "none":
+            return 0.0
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return self._rng.uniform(*self.params)
+        if self.kind == "normal":
+            return max(0.0, self._rng.gauss(*self.params))
+        # lognormal:<median ms>:<sigma>
+        median, sigma = self.params
+        return median * self._rng.lognormvariate(0, sigma)
+
+def load_routes(routes_dir):
+    # Routes are found by the names in their file name (London_to_Paris.json),
+    # by the addresses Google resolved them to, and by their place IDs.
+    routes = {}
+    for name in sorted(os.listdir(routes_dir)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(routes_dir, name), "rb") as routeFile:
+            body = routeFile.read()
+
+        origin, separator, destination = name[:-len(".json")].partition("_to_")
+        if separator:
+            routes[(normalize_location(origin), normalize_location(destination))] = body
+
+        route = json.loads(body)
+        leg = route["routes"][0]["legs"][0]
+        routes[(normalize_location(leg["start_address"]), normalize_location(leg["end_address"]))] = body
+
+        placeIds = [waypoint.get("place_id") for waypoint in route.get("geocoded_waypoints", [])]
+        if len(placeIds) >= 2 and placeIds[0] and placeIds[-1]:
+            routes[(normalize_location("place_id:" + placeIds[0]), normalize_location("place_id:" + placeIds[-1]))] = body
+    return routes
+
+def create_stub_app(routes_dir=DEFAULT_ROUTES_DIR, latency="none", error_rate=0.0, over_query_limit_rate=0.0, fallback_route=None, seed=None):
+    app = Flask(__name__)
+    rng = random.Random(seed)
+    routes = load_routes(routes_dir)
+    fallback = None
+    if fallback_route:
+        with open(os.path.join(routes_dir, fallback_route + ".json"), "rb") as routeFile:
+            fallback = routeFile.read()
+
+    config = {
+        "latency": Latency(latency, rng),
+        "error_rate": error_rate,
+        "over_query_limit_rate": over_query_limit_rate
+    }
+    stats = {"requests": 0, "errors": 0, "over_query_limit": 0, "not_found": 0}
+    statsLock = threading.Lock()
+
+    def count(name):
+        with statsLock:
+            stats[name] += 1
+
+    @app.route(DIRECTIONS_PATH, methods=["GET", "POST"])
+    def directions():
+        count("requests")
+        delay = config["latency"].sample()
+        if delay:
+            time.sleep(delay / 1000)
+
+        roll = rng.random()
+        if roll < config["error_rate"]:
+            count("errors")
+            return Response("Stubbed upstream failure", status=500)
+        if roll < config["error_rate"] + config["over_query_limit_rate"]:
+            count("over_query_limit")
+            return Response(OVER_QUERY_LIMIT_BODY, mimetype="application/json")
+
+        body = routes.get((normalize_location(request.args.get("origin")), normalize_location(request.args.get("destination"))), fallback)
+        if body is None:
+            count("not_found")
+            body = NOT_FOUND_BODY
+        return Response(body, mimetype="application/json")
+
+    @app.route("/stub/config", methods=["GET", "POST"])
+    def stub_config():
+        # Lets a load test change latency and failure rates between phases.
+        if request.method == "POST":
+            changes = request.get_json()
+            try:
+                if "latency" in changes:
+                    config["latency"] = Latency(changes["latency"], rng)
+                for rate in ("error_rate", "over_query_limit_rate"):
+                    if rate in changes:
+                        config[rate] = float(changes[rate])
+            except ValueError as error:
+                return json.dumps({"error": str(error)}), 400
+        return json.dumps({
+            "latency": config["latency"].spec,
+            "error_rate": config["error_rate"],
+            "over_query_limit_rate": config["over_query_limit_rate"],
+            "routes": len(routes)
+        }, indent=4), 200
+
+    @app.route("/stub/stats")
+    def stub_stats():
+        with statsLock:
+            return json.dumps(stats, indent=4), 200
+
+    return app
+
+def main(argv=None):
+    from werkzeug.serving import run_simple
+
+    parser = argparse.ArgumentParser(description="Replay recorded Directions API responses locally.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--routes-dir", default=DEFAULT_ROUTES_DIR)
+    parser.add_argument("--latency", default=os.getenv("STUB_LATENCY", "none"), help="none, fixed:MS, uniform:MIN:MAX, normal:MEAN:SD or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--error-rate", type=float, default=float(os.getenv("STUB_ERROR_RATE", 0)), help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--over-query-limit-rate", type=float, default=float(os.getenv("STUB_OVER_QUERY_LIMIT_RATE", 0)), help="fraction of requests answered with OVER_QUERY_LIMIT")
+    parser.add_argument("--fallback-route", default=os.getenv("STUB_FALLBACK_ROUTE"), help="recorded route (e.g. London_to_Paris) served for unknown locations instead of NOT_FOUND")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    app = create_stub_app(args.routes_dir, args.latency, args.error_rate, args.over_query_limit_rate, args.fallback_route, args.seed)
+    run_simple(args.host, args.port, app, threaded=True)
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,712 @@
 import os
 import sys
 import json
+import atexit
+import time
+import random
+import asyncio
+import weakref
+import threading
+import functools
+import urllib.parse
+import httpx
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+from Route_Cache import RouteCache, cache_key
+from Route_Store import RouteStore
+from Single_Flight import SingleFlight
+from Payload_Stream import streaming_available, parse_chunks, parse_chunks_async, payload_size, PARSE_ERRORS
+from Rate_Limiter import RateLimiter, RateLimitExceeded, INTERACTIVE, PREFETCH, PRIORITY_NAMES
+from Circuit_Breaker import CircuitBreaker, CircuitOpen, STATE_VALUES
+from Route_Prefetcher import RoutePrefetcher
+from Travel_Time_History import TravelTimeHistory, route_key
+from Route_Proximity import LocationMemo, ProximityIndex
+from Location_Canonicalizer import LocationCanonicalizer, load_aliases, option_values, parse_coordinates, PLACE_ID_PREFIX
+from Tracing import traced
+from Metrics import REGISTRY, UPSTREAM_RESPONSES, UPSTREAM_ERRORS, DIRECTIONS_STATUS, UPSTREAM_QUEUE_SECONDS, UPSTREAM_THROTTLED, STALE_RESPONSES, ROUTE_REFRESHES, PROXIMITY_HITS, stage, observe_stage
+
 load_dotenv()
 
 API_KEY = os.getenv("GOOGLE_API_KEY")
 
-def retrieve_navigation_payload(options):
+# Overridable so load tests can point at server/Directions_Stub_Server.py.
+DIRECTIONS_URL = os.getenv("GOOGLE_DIRECTIONS_URL", "https://maps.googleapis.com/maps/api/directions/json")
+
+ROUTE_CACHE = RouteCache(
+    max_entries=int(os.getenv("ROUTE_CACHE_MAX_ENTRIES", 1024)),
+    max_bytes=int(os.getenv("ROUTE_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    ttl=float(os.getenv("ROUTE_CACHE_TTL", 300)),
+    # Expired routes are kept this much longer to answer with while the
+    # Directions API is down.
+    stale_ttl=float(os.getenv("ROUTE_CACHE_STALE_TTL", 3600))
+)
+
+# A cached route this close to expiring is still served, and refreshed in the
+# background so the next request does not wait on the Directions API.
+REFRESH_AHEAD = float(os.getenv("ROUTE_CACHE_REFRESH_AHEAD", 30))
+REFRESH_WORKERS = int(os.getenv("ROUTE_CACHE_REFRESH_WORKERS", 2))
+
+# The ROUTE_PREFETCH_TOP most requested routes are refreshed before they
+# expire, through the same refresh workers, rate limit and circuit as any
+# other request. At startup the cache is prewarmed from a list of routes
+# and from the counts the previous run saved.
+PREFETCH_TOP = int(os.getenv("ROUTE_PREFETCH_TOP", 0))
+PREFETCH_INTERVAL = float(os.getenv("ROUTE_PREFETCH_INTERVAL", 30))
+PREFETCH_ROUTES_PATH = os.getenv("ROUTE_PREFETCH_ROUTES")
+PREFETCH_STATS_PATH = os.getenv("ROUTE_PREFETCH_STATS")
+
+# Optional second tier on disk, shared by every worker and kept across restarts.
+ROUTE_STORE_PATH = os.getenv("ROUTE_STORE_PATH")
+ROUTE_STORE = RouteStore(ROUTE_STORE_PATH, ttl=float(os.getenv("ROUTE_STORE_TTL", 3600))) if ROUTE_STORE_PATH else None
+
+# Only answers that will not change on a retry are worth keeping around.
+CACHEABLE_STATUSES = ("OK", "ZERO_RESULTS", "NOT_FOUND")
+
+HTTP_POOL_SIZE = int(os.getenv("GOOGLE_API_POOL_SIZE", 20))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("GOOGLE_API_CONNECT_TIMEOUT", 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv("GOOGLE_API_READ_TIMEOUT", 10))
+HTTP_MAX_RETRIES = int(os.getenv("GOOGLE_API_MAX_RETRIES", 3))
+HTTP_BACKOFF_BASE = float(os.getenv("GOOGLE_API_BACKOFF_BASE", 0.25))
+HTTP_BACKOFF_MAX = float(os.getenv("GOOGLE_API_BACKOFF_MAX", 4))
+ASYNC_POOL_SIZE = int(os.getenv("GOOGLE_API_ASYNC_POOL_SIZE", 200))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# When enabled, callers that only need a route summary have the response body
+# parsed incrementally and everything else (polylines, html_instructions, ...)
+# thrown away as it arrives. This trades CPU for memory: cached summaries are
+# several times smaller, but parsing is slower than json.loads, so it is off
+# unless memory is the constraint.
+STREAM_PARSE = os.getenv("GOOGLE_API_STREAM_PARSE", "false").lower() in ("1", "true", "yes") and streaming_available()
+SUMMARY_FIELDS = "summary" if STREAM_PARSE else None
+
+# Directions statuses that are worth asking again for after a short wait.
+RETRYABLE_STATUSES = ("OVER_QUERY_LIMIT", "UNKNOWN_ERROR")
+
+# Keeps upstream calls under the Directions API quota (off when GOOGLE_API_QPS
+# is 0). With GOOGLE_API_RATE_LIMIT_PATH set, every worker process shares one
+# budget through that file.
+UPSTREAM_QPS = float(os.getenv("GOOGLE_API_QPS", 0))
+UPSTREAM_BURST = float(os.getenv("GOOGLE_API_BURST", 0)) or UPSTREAM_QPS
+UPSTREAM_MAX_QUEUE_WAIT = float(os.getenv("GOOGLE_API_MAX_QUEUE_WAIT", 2))
+RATE_LIMIT_PATH = os.getenv("GOOGLE_API_RATE_LIMIT_PATH")
+RATE_LIMITER = RateLimiter(UPSTREAM_QPS, UPSTREAM_BURST, UPSTREAM_MAX_QUEUE_WAIT, RATE_LIMIT_PATH) if UPSTREAM_QPS > 0 else None
+
+PREFETCHER = RoutePrefetcher(
+    lambda key, options, fields: refresh_in_background(key, options, fields),
+    lambda key: ROUTE_CACHE.expires_in(key),
+    top_n=PREFETCH_TOP,
+    interval=PREFETCH_INTERVAL,
+    horizon=REFRESH_AHEAD
+) if PREFETCH_TOP > 0 else None
+
+# Stops calling the Directions API while it is failing or too slow, instead
+# of tying up every worker on it.
+CIRCUIT = CircuitBreaker(
+    failure_ratio=float(os.getenv("CIRCUIT_FAILURE_RATIO", 0.5)),
+    slow_call_seconds=float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", 5)),
+    min_calls=int(os.getenv("CIRCUIT_MIN_CALLS", 20)),
+    window=float(os.getenv("CIRCUIT_WINDOW", 30)),
+    open_seconds=float(os.getenv("CIRCUIT_OPEN_SECONDS", 15))
+)
+
+# Every route Google answers is also recorded by hour of the week, so
+# /get_eta can answer from history instead of asking again.
+TRAVEL_HISTORY = TravelTimeHistory(
+    path=os.getenv("TRAVEL_HISTORY_PATH"),
+    min_samples=int(os.getenv("TRAVEL_HISTORY_MIN_SAMPLES", 5)),
+    max_spread=float(os.getenv("TRAVEL_HISTORY_MAX_SPREAD", 0.15)),
+    max_age=float(os.getenv("TRAVEL_HISTORY_MAX_AGE_DAYS", 28)) * 86400
+) if os.getenv("TRAVEL_HISTORY", "true").lower() in ("1", "true", "yes") else None
+
+# Where Google placed every origin and destination it has answered for, and
+# the place ID it geocoded each one to.
+LOCATION_MEMO = LocationMemo(max_entries=int(os.getenv("LOCATION_MEMO_MAX_ENTRIES", 100000)))
+
+# Requests are keyed and sent in canonical form, so spellings of the same
+# place share one cache entry and one upstream call.
+LOCATION_ALIASES_PATH = os.getenv("LOCATION_ALIASES")
+CANONICALIZER = LocationCanonicalizer(load_aliases(LOCATION_ALIASES_PATH) if LOCATION_ALIASES_PATH else None)
+# Once Google has geocoded a location, ask for its place ID instead.
+PLACE_IDS = os.getenv("LOCATION_PLACE_IDS", "true").lower() in ("1", "true", "yes")
+
+# With a radius, a request whose origin and destination are known to be
+# within that many meters of a cached route's start and end is answered
+# with that route.
+PROXIMITY_RADIUS = float(os.getenv("ROUTE_PROXIMITY_RADIUS", 0))
+PROXIMITY_INDEX = ProximityIndex(PROXIMITY_RADIUS, max_routes=int(os.getenv("ROUTE_PROXIMITY_MAX_ROUTES", 500000))) if PROXIMITY_RADIUS > 0 else None
+
+# Concurrent requests for the same route share one upstream call.
+INFLIGHT = SingleFlight()
+
+_session = None
+_session_lock = threading.Lock()
+_request_stats = {"requests": 0, "retries": 0, "failures": 0}
+_async_clients = weakref.WeakKeyDictionary()
+_refresh_executor = None
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+# Read at scrape time, so these always describe the current ROUTE_CACHE.
+REGISTRY.callback("nologynav_route_cache_entries", "Routes held in the in-memory cache.", lambda: ROUTE_CACHE.stats()["entries"])
+REGISTRY.callback("nologynav_route_cache_bytes", "Approximate size of the routes held in the in-memory cache.", lambda: ROUTE_CACHE.stats()["bytes"])
+REGISTRY.callback("nologynav_route_cache_hits_total", "In-memory cache lookups that found a route.", lambda: ROUTE_CACHE.stats()["hits"], "counter")
+REGISTRY.callback("nologynav_route_cache_misses_total", "In-memory cache lookups that did not find a route.", lambda: ROUTE_CACHE.stats()["misses"], "counter")
+REGISTRY.callback("nologynav_route_cache_evictions_total", "Routes evicted from the in-memory cache to make room.", lambda: ROUTE_CACHE.stats()["evictions"], "counter")
+REGISTRY.callback("nologynav_upstream_in_flight", "Distinct Directions API calls currently in flight.", lambda: INFLIGHT.stats()["in_flight"])
+REGISTRY.callback("nologynav_upstream_coalesced_total", "Requests that shared another request's Directions API call.", lambda: INFLIGHT.stats()["coalesced"], "counter")
+REGISTRY.callback("nologynav_upstream_queued", "Requests waiting for the upstream rate limit.", lambda: RATE_LIMITER.queued if RATE_LIMITER else 0)
+REGISTRY.callback("nologynav_prefetch_routes", "Routes whose request counts the prefetcher is tracking.", lambda: len(PREFETCHER) if PREFETCHER else 0)
+REGISTRY.callback("nologynav_prefetch_refreshes_total", "Hot routes the prefetcher has refreshed.", lambda: PREFETCHER.refreshes if PREFETCHER else 0, "counter")
+REGISTRY.callback("nologynav_travel_history_buckets", "Route and hour-of-week travel time buckets held in memory.", lambda: len(TRAVEL_HISTORY) if TRAVEL_HISTORY else 0)
+REGISTRY.callback("nologynav_proximity_routes", "Cached routes indexed by where they start and end.", lambda: len(PROXIMITY_INDEX) if PROXIMITY_INDEX else 0)
+REGISTRY.callback("nologynav_upstream_circuit_state", "Directions API circuit: 0 closed, 1 half-open, 2 open.", lambda: STATE_VALUES[CIRCUIT.state])
+REGISTRY.callback("nologynav_upstream_circuit_opened_total", "Times the Directions API circuit has opened.", lambda: CIRCUIT.opened, "counter")
+
+def canonical_key(options, fields=None):
+    return cache_key(canonical_options(options), fields)
+
+def canonical_options(options):
+    return CANONICALIZER.canonical_options(options, LOCATION_MEMO if PLACE_IDS else None)
+
+def retrieve_navigation_payload(options, use_cache=True, fields=None, priority=INTERACTIVE):
+    options = canonical_options(options)
+    key = cache_key(options, fields)
+    if use_cache:
+        record_request(key, options, fields, priority)
+        cached = lookup_fresh_payload(key, options, fields)
+        if cached is None:
+            cached = lookup_nearby_payload(options, fields)
+        if cached is not None:
+            return cached
+
+    return INFLIGHT.do(key, lambda: fetch_navigation_payload(key, options, fields, priority))
+
+async def retrieve_navigation_payload_async(options, use_cache=True, fields=None, priority=INTERACTIVE):
+    options = canonical_options(options)
+    key = cache_key(options, fields)
+    if use_cache:
+        record_request(key, options, fields, priority)
+        cached = await off_loop(lookup_fresh_payload, key, options, fields)
+        if cached is None:
+            cached = await off_loop(lookup_nearby_payload, options, fields)
+        if cached is not None:
+            return cached
+
+    return await INFLIGHT.do_async(key, lambda: fetch_navigation_payload_async(key, options, fields, priority))
+
+def fetch_navigation_payload(key, options, fields=None, priority=INTERACTIVE):
     url = url_builder(options)
 
-    response = requests.post(url)
-    result = response.json()
+    try:
+        result, size = request_payload(url, fields, priority)
+    except (requests.ConnectionError, requests.Timeout):
+        stale = lookup_stale_payload(key)
+        if stale is None:
+            raise
+        return stale
 
-    return result
+    payload = keep_or_fall_back(key, result, size)
+    learn_places(key, options, fields, payload, size)
+    # Recorded under the place IDs just learned, so a route's first answer
+    # counts towards the same history as the ones after it.
+    observe_travel_time(canonical_options(options), result)
+    return payload
 
-def url_builder(options):
-    urlOptions = ""
-    urlPrefix = "https://maps.googleapis.com/maps/api/directions/json"
+async def fetch_navigation_payload_async(key, options, fields=None, priority=INTERACTIVE):
+    url = url_builder(options)
+
+    try:
+        result, size = await request_payload_async(url, fields, priority)
+    except httpx.TransportError:
+        stale = lookup_stale_payload(key)
+        if stale is None:
+            raise
+        return stale
+
+    payload = await off_loop(keep_or_fall_back, key, result, size)
+    await off_loop(learn_places, key, options, fields, payload, size)
+    # Recorded under the place IDs just learned, so a route's first answer
+    # counts towards the same history as the ones after it.
+    observe_travel_time(canonical_options(options), result)
+    return payload
+
+async def off_loop(fn, *args):
+    # The route store is SQLite, whose reads and writes block (up to its busy
+    # timeout when another worker is writing). With a store configured, the
+    # calls that may reach it run in a thread so the event loop keeps serving.
+    if ROUTE_STORE is None:
+        return fn(*args)
+    return await asyncio.to_thread(fn, *args)
+
+def observe_travel_time(options, result):
+    # Transit routes planned by arrival time do not say when they leave.
+    if TRAVEL_HISTORY is None or result.get("status") != "OK" or "arrival_time" in options:
+        return
+    departure = str(options.get("departure_time", ""))
+    when = int(departure) if departure.isdigit() else None
+    route = route_key(options)
+
+    duration, durationInTraffic = route_durations(result)
+    TRAVEL_HISTORY.observe(route, "duration", duration, when)
+    if durationInTraffic is not None:
+        TRAVEL_HISTORY.observe(route, "duration_in_traffic", durationInTraffic, when)
+
+def learn_places(key, options, fields, result, size):
+    if learn_locations(key, options, fields, result):
+        # Later requests for these places are keyed on their place IDs; keep
+        # this route where they will look for it.
+        placeKey = canonical_key(options, fields)
+        if placeKey != key:
+            store_payload(placeKey, result, size)
+            learn_locations(placeKey, options, fields, result)
+
+def learn_locations(key, options, fields, result):
+    """Remembers where Google placed the request's locations and their place IDs. Returns True if a place ID was new."""
+    if result.get("status") != "OK" or result.get("_stale"):
+        return False
+    places = [options["origin"], *option_values(options.get("waypoints", ())), options["destination"]]
+    # Google geocodes the origin, each waypoint and the destination, in that order.
+    geocoded = result.get("geocoded_waypoints", ())
+    placeIds = [waypoint.get("place_id") for waypoint in geocoded] if len(geocoded) == len(places) else [None] * len(places)
+
+    learned = False
+    for place, placeId in zip(places, placeIds):
+        if placeId and not place.startswith(PLACE_ID_PREFIX) and parse_coordinates(place) is None:
+            learned = LOCATION_MEMO.learn(place, place_id=placeId) or learned
+
+    legs = result["routes"][0]["legs"]
+    start, end = legs[0].get("start_location"), legs[-1].get("end_location")
+    if start is None or end is None:
+        return learned
+    for place, placeId, point in ((places[0], placeIds[0], start), (places[-1], placeIds[-1], end)):
+        LOCATION_MEMO.learn(place, point)
+        if placeId:
+            LOCATION_MEMO.learn(PLACE_ID_PREFIX + placeId, point)
+    if PROXIMITY_INDEX is not None and nearby_allowed(options):
+        PROXIMITY_INDEX.add(fields, key, (start["lat"], start["lng"]), (end["lat"], end["lng"]))
+    return learned
+
+def nearby_allowed(options):
+    # Anything beyond the two places (waypoints, mode, departure time, ...)
+    # would have to match as well, so only plain requests share routes.
+    return len(options) == 2 and "origin" in options and "destination" in options
+
+def lookup_nearby_payload(options, fields=None):
+    if PROXIMITY_INDEX is None or not nearby_allowed(options):
+        return None
+    start, end = LOCATION_MEMO.get(options["origin"]), LOCATION_MEMO.get(options["destination"])
+    if start is None or end is None:
+        return None
+
+    for key in PROXIMITY_INDEX.nearby(fields, start, end):
+        entry = lookup_cached_entry(key)
+        if entry is None:
+            # Evicted or expired since it was indexed.
+            PROXIMITY_INDEX.discard(key)
+            continue
+        PROXIMITY_HITS.inc()
+        return entry[0]
+    return None
+
+def estimate_travel_time(options, when=None):
+    """A travel time for options from history, preferring one in traffic, or None when history cannot say."""
+    if TRAVEL_HISTORY is None:
+        return None
+    route = route_key(canonical_options(options))
+    for metric in ("duration_in_traffic", "duration"):
+        estimate = TRAVEL_HISTORY.estimate(route, metric, when)
+        if estimate is not None:
+            return estimate
+    return None
+
+def route_durations(route_data, routeNumber=0):
+    """Returns the duration of the whole route, and its duration in traffic (None unless Google gave one for every leg)."""
+    legCount = len(route_data["routes"][routeNumber]["legs"])
+    duration = sum(get_duration_value(route_data, legNumber, routeNumber) for legNumber in range(legCount))
+    inTraffic = [get_duration_in_traffic_value(route_data, legNumber, routeNumber) for legNumber in range(legCount)]
+    return duration, sum(inTraffic) if all(value is not False for value in inTraffic) else None
+
+def keep_or_fall_back(key, result, size):
+    if result.get("status") in CACHEABLE_STATUSES:
+        store_payload(key, result, size)
+        return result
 
-    for optionName in options: 
-        charToAdd = "?" if len(urlOptions) == 0 else "&"
-        if(type(options[optionName]) != tuple):
-            urlOptions += charToAdd + optionName + "=" + options[optionName]
+    # Over quota, circuit open, Google having trouble: the last answer for
+    # this route is more use than an error.
+    stale = lookup_stale_payload(key)
+    return stale if stale is not None else result
+
+def lookup_cached_entry(key):
+    entry = ROUTE_CACHE.get_entry(key)
+    if entry is not None or ROUTE_STORE is None:
+        return entry
+
+    entry = ROUTE_STORE.get_entry(key)
+    if entry is None:
+        return None
+
+    payload, expires_at = entry
+    ROUTE_CACHE.put(key, payload, payload_size(payload), ttl=min(ROUTE_CACHE.ttl, expires_at - time.time()))
+    return payload, expires_at - time.time()
+
+def lookup_cached_payload(key):
+    entry = lookup_cached_entry(key)
+    return entry[0] if entry is not None else None
+
+def lookup_fresh_payload(key, options, fields=None):
+    entry = lookup_cached_entry(key)
+    if entry is None:
+        return None
+
+    payload, expires_in = entry
+    if expires_in < REFRESH_AHEAD:
+        refresh_in_background(key, options, fields)
+    return payload
+
+def lookup_stale_payload(key):
+    payload = ROUTE_CACHE.get_stale(key)
+    if payload is None:
+        return None
+    STALE_RESPONSES.inc()
+    # Marked on a copy, so the cached payload stays as Google sent it.
+    return dict(payload, _stale=True)
+
+def record_request(key, options, fields, priority):
+    # Prefetching is driven by what callers ask for, not by its own refreshes.
+    if PREFETCHER is not None and priority != PREFETCH:
+        PREFETCHER.record(key, options, fields)
+
+def start_prefetcher():
+    """Prewarms the cache and starts refreshing hot routes; does nothing unless ROUTE_PREFETCH_TOP is set."""
+    if PREFETCHER is None or PREFETCHER.running:
+        return
+    for path in (PREFETCH_STATS_PATH, PREFETCH_ROUTES_PATH):
+        if path and os.path.exists(path):
+            PREFETCHER.load(path, canonical_key, SUMMARY_FIELDS)
+    PREFETCHER.prewarm()
+    PREFETCHER.start()
+    if PREFETCH_STATS_PATH:
+        atexit.register(PREFETCHER.save, PREFETCH_STATS_PATH)
+
+def prepare_fork():
+    """Stops the background threads (prefetching, refreshes) so the process can fork safely."""
+    global _refresh_executor
+    if PREFETCHER is not None:
+        PREFETCHER.stop()
+        # Only one process should write the request counts on exit.
+        atexit.unregister(PREFETCHER.save)
+    with _refresh_lock:
+        executor, _refresh_executor = _refresh_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def reset_after_fork():
+    """Gives a forked worker its own connections and locks instead of sharing its parent's."""
+    global _session, _session_lock, _async_clients, _refresh_executor, _refreshing, _refresh_lock, INFLIGHT
+    _session = None
+    _session_lock = threading.Lock()
+    _async_clients = weakref.WeakKeyDictionary()
+    _refresh_executor = None
+    _refreshing = set()
+    _refresh_lock = threading.Lock()
+    INFLIGHT = SingleFlight()
+
+def get_refresh_executor():
+    global _refresh_executor
+    with _refresh_lock:
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="route-refresh")
+        return _refresh_executor
+
+def refresh_in_background(key, options, fields=None):
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    # A thread rather than a task even for the ASGI app, so a refresh never
+    # holds up the event loop it was started from.
+    get_refresh_executor().submit(refresh_payload, key, options, fields)
+
+def refresh_payload(key, options, fields=None):
+    try:
+        INFLIGHT.do(key, lambda: fetch_navigation_payload(key, options, fields, PREFETCH))
+        ROUTE_REFRESHES.inc("ok")
+    except Exception:
+        ROUTE_REFRESHES.inc("failed")
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(key)
+
+def store_payload(key, result, size):
+    ROUTE_CACHE.put(key, result, size)
+    if ROUTE_STORE is not None:
+        ROUTE_STORE.put(key, result)
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def backoff_delay(attempt):
+    # "Full jitter": spreads retries from many workers instead of having them
+    # all come back at the same moment.
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+def over_quota_payload(error):
+    # Answered the way Google answers a client over its quota, so callers
+    # handle the local limit and Google's the same way.
+    return {"status": "OVER_QUERY_LIMIT", "error_message": str(error), "retry_after": error.retry_after}
+
+def unavailable_payload(error):
+    return {"status": "UNKNOWN_ERROR", "error_message": str(error), "retry_after": error.retry_after}
+
+def upstream_failure_payload(message):
+    # A 5xx after the last retry, or a body that is not JSON (e.g. an HTML
+    # error page): Google is failing, so callers fall back to a stale route
+    # or ask to try again shortly, as for an open circuit.
+    return {"status": "UNKNOWN_ERROR", "error_message": message, "retry_after": HTTP_BACKOFF_MAX}
+
+def record_queue_time(priority, seconds):
+    UPSTREAM_QUEUE_SECONDS.observe(seconds, PRIORITY_NAMES[priority])
+    observe_stage("queue", seconds)
+
+def request_payload(url, fields=None, priority=INTERACTIVE):
+    session = get_session()
+    stream = fields is not None and STREAM_PARSE
+    attempt = 0
+
+    while True:
+        # Checked before the rate limit, so requests do not queue for (or
+        # spend) quota while the circuit is open.
+        try:
+            CIRCUIT.allow()
+        except CircuitOpen as error:
+            return unavailable_payload(error), 0
+
+        # Retries count against the quota too.
+        if RATE_LIMITER is not None:
+            try:
+                record_queue_time(priority, RATE_LIMITER.acquire(priority))
+            except RateLimitExceeded as error:
+                CIRCUIT.release()
+                UPSTREAM_THROTTLED.inc(PRIORITY_NAMES[priority])
+                return over_quota_payload(error), 0
+
+        _request_stats["requests"] += 1
+        started = time.perf_counter()
+        try:
+            response = session.post(url, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), stream=stream)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            CIRCUIT.record(False, time.perf_counter() - started)
+            UPSTREAM_ERRORS.inc(type(error).__name__)
+            if attempt >= HTTP_MAX_RETRIES:
+                _request_stats["failures"] += 1
+                raise
+        except BaseException:
+            CIRCUIT.record(False, time.perf_counter() - started)
+            raise
         else:
-            optionList = ""
-            for optionSubsection in options[optionName]: 
-                optionList += optionSubsection + "|"
-            optionList = optionList[:-1]
-            urlOptions += charToAdd + optionName + "=" + optionList
+            elapsed = time.perf_counter() - started
+            observe_stage("upstream", elapsed, code=response.status_code, attempt=attempt)
+            UPSTREAM_RESPONSES.inc(str(response.status_code))
+            if response.status_code >= 500:
+                CIRCUIT.record(False, elapsed)
+                if stream:
+                    response.close()
+                if attempt >= HTTP_MAX_RETRIES:
+                    _request_stats["failures"] += 1
+                    return upstream_failure_payload(f"The Directions API answered {response.status_code}."), 0
+            else:
+                try:
+                    with stage("parse"):
+                        result, size = read_payload(response, fields if stream else None)
+                except PARSE_ERRORS as error:
+                    CIRCUIT.record(False, elapsed)
+                    UPSTREAM_ERRORS.inc("UnreadableResponse")
+                    if attempt >= HTTP_MAX_RETRIES:
+                        _request_stats["failures"] += 1
+                        return upstream_failure_payload(f"The Directions API response could not be read: {error}"), 0
+                except BaseException:
+                    CIRCUIT.record(False, elapsed)
+                    raise
+                else:
+                    CIRCUIT.record(True, elapsed)
+                    DIRECTIONS_STATUS.inc(str(result.get("status")))
+                    if result.get("status") not in RETRYABLE_STATUSES or attempt >= HTTP_MAX_RETRIES:
+                        return result, size
+
+        _request_stats["retries"] += 1
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
+
+def read_payload(response, fields=None):
+    if fields is None:
+        return response.json(), len(response.content)
+
+    try:
+        result, _ = parse_chunks(response.iter_content(STREAM_CHUNK_SIZE), fields)
+    finally:
+        response.close()
+    return result, payload_size(result)
+
+def get_async_client():
+    # httpx clients are bound to the event loop they were first used on.
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=ASYNC_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        )
+        _async_clients[loop] = client
+    return client
+
+async def close_async_client():
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+async def request_payload_async(url, fields=None, priority=INTERACTIVE):
+    client = get_async_client()
+    stream = fields is not None and STREAM_PARSE
+    attempt = 0
+
+    while True:
+        try:
+            CIRCUIT.allow()
+        except CircuitOpen as error:
+            return unavailable_payload(error), 0
+
+        if RATE_LIMITER is not None:
+            try:
+                record_queue_time(priority, await RATE_LIMITER.acquire_async(priority))
+            except RateLimitExceeded as error:
+                CIRCUIT.release()
+                UPSTREAM_THROTTLED.inc(PRIORITY_NAMES[priority])
+                return over_quota_payload(error), 0
+            except BaseException:
+                CIRCUIT.release()
+                raise
 
-    urlOptions += "&key=" + API_KEY
+        _request_stats["requests"] += 1
+        started = time.perf_counter()
+        recorded = False
+        try:
+            async with client.stream("POST", url) as response:
+                elapsed = time.perf_counter() - started
+                observe_stage("upstream", elapsed, code=response.status_code, attempt=attempt)
+                UPSTREAM_RESPONSES.inc(str(response.status_code))
+                if response.status_code >= 500:
+                    CIRCUIT.record(False, elapsed)
+                    recorded = True
+                    if attempt >= HTTP_MAX_RETRIES:
+                        _request_stats["failures"] += 1
+                        return upstream_failure_payload(f"The Directions API answered {response.status_code}."), 0
+                else:
+                    try:
+                        with stage("parse"):
+                            result, size = await read_payload_async(response, fields if stream else None)
+                    except PARSE_ERRORS as error:
+                        CIRCUIT.record(False, elapsed)
+                        recorded = True
+                        UPSTREAM_ERRORS.inc("UnreadableResponse")
+                        if attempt >= HTTP_MAX_RETRIES:
+                            _request_stats["failures"] += 1
+                            return upstream_failure_payload(f"The Directions API response could not be read: {error}"), 0
+                    else:
+                        CIRCUIT.record(True, elapsed)
+                        recorded = True
+                        DIRECTIONS_STATUS.inc(str(result.get("status")))
+                        if result.get("status") not in RETRYABLE_STATUSES or attempt >= HTTP_MAX_RETRIES:
+                            return result, size
+        except httpx.TransportError as error:
+            if not recorded:
+                CIRCUIT.record(False, time.perf_counter() - started)
+            UPSTREAM_ERRORS.inc(type(error).__name__)
+            if attempt >= HTTP_MAX_RETRIES:
+                _request_stats["failures"] += 1
+                raise
+        except BaseException:
+            if not recorded:
+                CIRCUIT.record(False, time.perf_counter() - started)
+            raise
 
-    return urlPrefix + urlOptions
+        _request_stats["retries"] += 1
+        await asyncio.sleep(backoff_delay(attempt))
+        attempt += 1
+
+async def read_payload_async(response, fields=None):
+    if fields is None:
+        content = await response.aread()
+        return json.loads(content), len(content)
+
+    result, _ = await parse_chunks_async(response.aiter_bytes(STREAM_CHUNK_SIZE), fields)
+    return result, payload_size(result)
+
+def get_pool_stats():
+    adapter = get_session().get_adapter("https://")
+    pools = []
+    for poolKey in adapter.poolmanager.pools.keys():
+        pool = adapter.poolmanager.pools.get(poolKey)
+        if pool is None:
+            continue
+        idle = sum(1 for connection in list(pool.pool.queue) if connection is not None) if pool.pool else 0
+        pools.append({
+            "host": pool.host,
+            "port": pool.port,
+            "maxsize": pool.pool.maxsize if pool.pool else 0,
+            "connections_opened": pool.num_connections,
+            "requests": pool.num_requests,
+            "idle": idle
+        })
+
+    stats = dict(_request_stats)
+    stats["pool_size"] = HTTP_POOL_SIZE
+    stats["pools"] = pools
+    return stats
+
+@traced
+def url_builder(options):
+    # Option values are strings or tuples of strings, so the items can key the
+    # memo; the URL and key are part of it in case they are changed at runtime.
+    return build_url(DIRECTIONS_URL, API_KEY or "", tuple(options.items()))
+
+@functools.lru_cache(maxsize=int(os.getenv("URL_CACHE_SIZE", 4096)))
+def build_url(prefix, apiKey, items):
+    # Every value is percent-encoded ("San Diego" -> San%20Diego, and the "|"
+    # joining a list -> %7C), so "&", "#" or "+" in a location cannot cut
+    # the query short or change what Google reads.
+    query = "&".join(
+        optionName + "=" + urllib.parse.quote("|".join(value) if type(value) == tuple else value, safe="")
+        for optionName, value in items
+    )
+    return prefix + "?" + query + "&key=" + urllib.parse.quote(apiKey, safe="")
 
 def getNumberOfRoutes(route_data):
     return len(route_data["routes"])
 
-def get_steps(route_data, legNumber):
-    return route_data["routes"][0]["legs"][legNumber]["steps"]
+def get_steps(route_data, legNumber, routeNumber=0):
+    return route_data["routes"][routeNumber]["legs"][legNumber]["steps"]
 
-def get_arrival_time(route_data, legNumber):
-    if "arrival_time" in route_data["routes"][0]["legs"][legNumber]:
-        return route_data["routes"][0]["legs"][legNumber]["arrival_time"]
+def get_arrival_time(route_data, legNumber, routeNumber=0):
+    if "arrival_time" in route_data["routes"][routeNumber]["legs"][legNumber]:
+        return route_data["routes"][routeNumber]["legs"][legNumber]["arrival_time"]
     else:
         return False
 
-def get_departure_time(route_data, legNumber):
-    if "departure_time" in route_data["routes"][0]["legs"][legNumber]:
-        return route_data["routes"][0]["legs"][legNumber]["departure_time"]
+def get_departure_time(route_data, legNumber, routeNumber=0):
+    if "departure_time" in route_data["routes"][routeNumber]["legs"][legNumber]:
+        return route_data["routes"][routeNumber]["legs"][legNumber]["departure_time"]
     else:
         return False
 
@@ -62,17 +719,17 @@ def verify_route_found(route_data):
 def get_num_routes(route_data):
     return len(route_data["routes"])
 
-def get_duration_value(route_data, legNumber=0):
-    return route_data["routes"][0]["legs"][legNumber]["duration"]["value"]
+def get_duration_value(route_data, legNumber=0, routeNumber=0):
+    return route_data["routes"][routeNumber]["legs"][legNumber]["duration"]["value"]
 
-def get_duration_in_traffic_value(route_data, legNumber=0):
-    if "duration_in_traffic" in route_data["routes"][0]["legs"][legNumber]:
-        return route_data["routes"][0]["legs"][legNumber]["duration_in_traffic"]["value"]
+def get_duration_in_traffic_value(route_data, legNumber=0, routeNumber=0):
+    if "duration_in_traffic" in route_data["routes"][routeNumber]["legs"][legNumber]:
+        return route_data["routes"][routeNumber]["legs"][legNumber]["duration_in_traffic"]["value"]
     else:
         return False
 
-def getUnit(route_data):
-    return route_data["routes"][0]["legs"][0]["distance"]["text"]
+def getUnit(route_data, routeNumber=0):
+    return route_data["routes"][routeNumber]["legs"][0]["distance"]["text"]
 
 def get_waypoints(route_data):
     if "error_message" in route_data:
@@ -80,28 +737,26 @@ def get_waypoints(route_data):
     else:
         return len(route_data["geocoded_waypoints"])
 
-def get_start_address(route_data):
-    return route_data["routes"][0]["legs"][0]["start_address"]
+def get_start_address(route_data, routeNumber=0):
+    return route_data["routes"][routeNumber]["legs"][0]["start_address"]
+
+def get_transit_mode(route_data, routeNumber=0):
+    steps = get_steps(route_data, 0, routeNumber)
 
-def get_transit_mode(route_data):
-    steps = get_steps(route_data,0)
-    
     for step in steps:
         if "transit_details" in step:
             if "line" in step["transit_details"]:
-                print("******************************")
-                print(step["transit_details"]["line"]["vehicle"]["name"])
-                return  step["transit_details"]["line"]["vehicle"]["name"]
-    return route_data["routes"][0]["legs"][0]["steps"][0]["transit_details"]["line"]["vehicle"]["name"]
-
-def get_travel_mode(route_data):
-    if "fare" in route_data["routes"][0]:
-        return {"travel_mode": "TRANSIT", "duration": route_data["routes"][0]["legs"][0]["duration"]["value"]}
+                return step["transit_details"]["line"]["vehicle"]["name"]
+    return route_data["routes"][routeNumber]["legs"][0]["steps"][0]["transit_details"]["line"]["vehicle"]["name"]
+
+def get_travel_mode(route_data, routeNumber=0):
+    if "fare" in route_data["routes"][routeNumber]:
+        return {"travel_mode": "TRANSIT", "duration": route_data["routes"][routeNumber]["legs"][0]["duration"]["value"]}
     else:
-        return {"travel_mode": route_data["routes"][0]["legs"][0]["steps"][0]["travel_mode"], "duration": route_data["routes"][0]["legs"][0]["duration"]["value"]}
+        return {"travel_mode": route_data["routes"][routeNumber]["legs"][0]["steps"][0]["travel_mode"], "duration": route_data["routes"][routeNumber]["legs"][0]["duration"]["value"]}
     
-def get_transit_route_preferences(route_data):
-    steps = get_steps(route_data,0)
+def get_transit_route_preferences(route_data, routeNumber=0):
+    steps = get_steps(route_data, 0, routeNumber)
     walking_duration = 0
     transit_duration = 0
 
@@ -110,5 +765,5 @@ def get_transit_route_preferences(route_data):
             walking_duration += steps[index]["duration"]["value"]
         if "transit_details" in steps[index]:
             transit_duration += steps[index]["duration"]["value"]
-        
-    return {"duration": route_data["routes"][0]["legs"][0]["duration"]["value"], "walking_duration": walking_duration, "transit_duration": transit_duration}
\ No newline at end of file
+
+    return {"duration": route_data["routes"][routeNumber]["legs"][0]["duration"]["value"], "walking_duration": walking_duration, "transit_duration": transit_duration}
\ No newline at end of file
@@ -0,0 +1,88 @@
+import re
+import json
+
+# "London", "london " and "London, UK" are the same request to Google, and
+# should be one cache entry and one upstream call. Requests are rewritten to a
+# canonical form before they are keyed or sent:
+#
+#   - whitespace collapsed and letters lowercased (Google ignores both),
+#   - "lat,lng" written without spaces,
+#   - known aliases replaced by the name they stand for,
+#   - a place Google has already geocoded replaced by its place ID, so every
+#     spelling that found the same place shares its routes.
+
+COORDINATES = re.compile(r"^\s*(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+PLACE_ID_PREFIX = "place_id:"
+
+# Options holding one location, and a list of them, in the order Google geocodes them.
+LOCATION_OPTIONS = ("origin", "destination")
+LOCATION_LIST_OPTIONS = ("waypoints",)
+# Options whose values are order-independent keywords.
+KEYWORD_LIST_OPTIONS = ("avoid",)
+KEYWORD_OPTIONS = ("mode", "units", "traffic_model", "transit_routing_preference")
+
+def normalize_location(location):
+    # Place IDs are case sensitive.
+    if location.startswith(PLACE_ID_PREFIX):
+        return location
+    return " ".join(location.split()).lower()
+
+def parse_coordinates(location):
+    """Returns (lat, lng) for a location written as "lat,lng", otherwise None."""
+    match = COORDINATES.match(location)
+    if match is None:
+        return None
+    lat, lng = float(match.group(1)), float(match.group(2))
+    if abs(lat) > 90 or abs(lng) > 180:
+        return None
+    return lat, lng
+
+def option_values(value):
+    """The values of a multi-valued option (avoid, waypoints), given as a tuple or list, or as one string joined with "|"."""
+    if isinstance(value, str):
+        return tuple(value.split("|"))
+    return tuple(value)
+
+def load_aliases(path):
+    """Reads a JSON object of alias -> location, e.g. {"nyc": "New York, NY"}."""
+    with open(path) as aliasFile:
+        return json.load(aliasFile)
+
+class LocationCanonicalizer:
+    """Rewrites request options to their canonical form.
+
+    A memo, if given, is anything with place_id(location), returning the
+    place ID Google found for a location (or None); the aliases are applied
+    before it is asked.
+    """
+
+    def __init__(self, aliases=None):
+        self.aliases = {normalize_location(alias): normalize_location(location) for alias, location in (aliases or {}).items()}
+
+    def canonical_location(self, location, memo=None):
+        location = location.strip()
+        # Place IDs are case sensitive.
+        if location.startswith(PLACE_ID_PREFIX):
+            return location
+        coordinates = COORDINATES.match(location)
+        if coordinates is not None:
+            return coordinates.group(1) + "," + coordinates.group(2)
+
+        location = normalize_location(location)
+        location = self.aliases.get(location, location)
+        placeId = memo.place_id(location) if memo is not None else None
+        return PLACE_ID_PREFIX + placeId if placeId else location
+
+    def canonical_options(self, options, memo=None):
+        canonical = {}
+        for name, value in options.items():
+            if name in LOCATION_OPTIONS:
+                value = self.canonical_location(value, memo)
+            elif name in LOCATION_LIST_OPTIONS:
+                value = tuple(self.canonical_location(location, memo) for location in option_values(value))
+            elif name in KEYWORD_LIST_OPTIONS:
+                value = tuple(sorted({keyword.strip().lower() for keyword in option_values(value)}))
+            elif name in KEYWORD_OPTIONS:
+                value = value.strip().lower()
+            canonical[name] = value
+        return canonical
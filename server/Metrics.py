@@ -0,0 +1,206 @@
+import time
+import bisect
+import threading
+
+from Request_Profiler import record_stage
+from Tracing import span, record_span
+
+# A small in-process metrics registry rendered in the Prometheus text
+# exposition format. Recording a sample is a dict lookup and an add under a
+# lock, cheap enough for every request.
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+def format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, format_labels(self.labelnames, labels), value) for labels, value in items]
+
+class CallbackMetric:
+    """A gauge or counter whose value is read from another object at scrape time."""
+
+    def __init__(self, name, documentation, kind, callback):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.callback = callback
+
+    def value(self):
+        return self.callback()
+
+    def samples(self):
+        return [(self.name, "", self.callback())]
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "started")
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+        return False
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labelvalues):
+        return _Timer(self, labelvalues)
+
+    def count(self, *labelvalues):
+        series = self._series.get(labelvalues)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, (list(series[0]), series[1], series[2])) for labels, series in self._series.items())
+
+        samples = []
+        for labels, (bucketCounts, total, count) in items:
+            cumulative = 0
+            for bound, bucketCount in zip(self.buckets + (float("inf"),), bucketCounts):
+                cumulative += bucketCount
+                samples.append((self.name + "_bucket", format_labels(self.labelnames, labels, [("le", format_value(bound))]), cumulative))
+            samples.append((self.name + "_sum", format_labels(self.labelnames, labels), total))
+            samples.append((self.name + "_count", format_labels(self.labelnames, labels), count))
+        return samples
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Modules can be imported twice (server.X and X), so registering a name
+            # that already exists hands back the metric registered first.
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def callback(self, name, documentation, callback, kind="gauge"):
+        metric = self.register(CallbackMetric(name, documentation, kind, callback))
+        metric.callback = callback
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            samples = metric.samples()
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("nologynav_stage_seconds", "Time spent in each stage of handling a route request.", ("stage",))
+REQUEST_SECONDS = REGISTRY.histogram("nologynav_request_seconds", "Time to handle an HTTP request.", ("endpoint", "code"))
+RESPONSE_BYTES = REGISTRY.histogram("nologynav_response_bytes", "Size of response bodies.", ("endpoint",), SIZE_BUCKETS)
+UPSTREAM_RESPONSES = REGISTRY.counter("nologynav_upstream_responses_total", "Directions API responses by HTTP status code.", ("code",))
+UPSTREAM_ERRORS = REGISTRY.counter("nologynav_upstream_errors_total", "Directions API requests that failed without a response.", ("error",))
+DIRECTIONS_STATUS = REGISTRY.counter("nologynav_directions_status_total", "Directions API responses by their status field.", ("status",))
+UPSTREAM_QUEUE_SECONDS = REGISTRY.histogram("nologynav_upstream_queue_seconds", "Time spent waiting for the upstream rate limit.", ("priority",))
+STALE_RESPONSES = REGISTRY.counter("nologynav_stale_responses_total", "Expired cached routes served because the Directions API could not be used.")
+ROUTE_REFRESHES = REGISTRY.counter("nologynav_route_refreshes_total", "Background refreshes of cached routes about to expire.", ("outcome",))
+PROXIMITY_HITS = REGISTRY.counter("nologynav_proximity_hits_total", "Requests answered with a cached route starting and ending within ROUTE_PROXIMITY_RADIUS of theirs.")
+ETA_ANSWERS = REGISTRY.counter("nologynav_eta_answers_total", "/get_eta answers by where the travel time came from.", ("source",))
+UPSTREAM_THROTTLED = REGISTRY.counter("nologynav_upstream_throttled_total", "Requests turned away because the upstream rate limit could not let them through in time.", ("priority",))
+
+class _StageTimer:
+    __slots__ = ("name", "started", "span")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.span = span(self.name)
+        self.span.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _observe(self.name, time.perf_counter() - self.started)
+        self.span.__exit__(*exc_info)
+        return False
+
+def stage(name):
+    return _StageTimer(name)
+
+def observe_stage(name, seconds, **attributes):
+    # For stages timed by the caller; they are traced as just finished.
+    _observe(name, seconds)
+    record_span(name, seconds, **attributes)
+
+def _observe(name, seconds):
+    # Feeds both the process-wide histogram and the current request's
+    # Server-Timing header.
+    STAGE_SECONDS.observe(seconds, name)
+    record_stage(name, seconds)
+
+def render():
+    return REGISTRY.render()
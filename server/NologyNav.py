@@ -1,40 +1,155 @@
 import os
 import sys
 import json
+import time
 import requests
 from dotenv import load_dotenv
-from flask import Flask, request, render_template
+from flask import Flask, Response, g, request, render_template
 
-from NologyNav_Methods import retrieve_data_from_google, count_waypoints, distance_travelled, total_time, lat_lng, avg_speed, modes_of_transportation, summary
+from NologyNav_Methods import retrieve_data_from_google, summarize_locations, summarize_speed_profile, summarize_alternatives, parse_alternatives_request, summarize_batch, parse_batch_request, summarize_eta, parse_eta_request, count_waypoints, distance_travelled, total_time, lat_lng, avg_speed, modes_of_transportation, summary
+from Google_API_Handler import start_prefetcher
+from Metrics import REQUEST_SECONDS, RESPONSE_BYTES, render as render_metrics
+from Response_Encoding import encode_json, wants_pretty
+from Route_Matrix import parse_matrix_request, build_matrix, iter_matrix
+from Request_Profiler import start_timings, stop_timings, server_timing, profile_requested, profile_allowed, profile_call
+from Tracing import start_trace, span, recent_spans
+
+def json_response(data, status):
+    body, status, headers = encode_json(
+        data, status,
+        pretty=wants_pretty(request.args.get("pretty")),
+        accept_encoding=request.headers.get("Accept-Encoding"),
+        if_none_match=request.headers.get("If-None-Match")
+    )
+    return Response(body, status, headers)
 
 def create_app():
     app = Flask(__name__, static_folder="../static", template_folder='../templates/')
 
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.timings_token = start_timings()
+        g.trace = start_trace(request.endpoint or "unmatched", request.headers.get("traceparent"), request.headers.get("X-Trace-Id"))
+        g.trace.__enter__()
+
+    @app.after_request
+    def record_request(response):
+        elapsed = time.perf_counter() - g.request_started
+        response.headers["Server-Timing"] = server_timing(stop_timings(g.timings_token), elapsed)
+
+        # Label by endpoint rather than path so unknown URLs share one series.
+        endpoint = request.endpoint or "unmatched"
+        REQUEST_SECONDS.observe(elapsed, endpoint, str(response.status_code))
+        if response.content_length is not None:
+            RESPONSE_BYTES.observe(response.content_length, endpoint)
+
+        g.trace.set("status", response.status_code)
+        if g.trace.trace_id is not None:
+            response.headers["X-Trace-Id"] = g.trace.trace_id
+        return response
+
+    @app.teardown_request
+    def finish_trace(error):
+        # Also runs when a view raises, so the request's span is still ended.
+        trace = g.pop("trace", None)
+        if trace is not None:
+            trace.__exit__(type(error) if error else None, error, None)
+
     @app.route("/")
     def index():
         return render_template('index.html')
     
     @app.route("/get_summary", methods=["POST"], endpoint='get_summary')
     def get_summary():
+        with span("parse_request"):
+            locations = request.get_json()
+        use_cache = not request.cache_control.no_cache
+
+        if profile_requested(request.args, request.headers):
+            if not profile_allowed(request.remote_addr, request.headers):
+                return json_response({"error": "Profiling is not enabled for this caller."}, 403)
+            (navigation_response, status), report = profile_call(summarize_locations, locations, use_cache=use_cache)
+            navigation_response = dict(navigation_response, profile=report or {"error": "Another request is already being profiled."})
+        else:
+            navigation_response, status = summarize_locations(locations, use_cache=use_cache)
+
+        return json_response(navigation_response, status)
+
+    @app.route("/get_speed_profile", methods=["POST"], endpoint='get_speed_profile')
+    def get_speed_profile():
         locations = request.get_json()
-        navigation_data = retrieve_data_from_google(locations) 
-        navigation_response = {}
-
-        if "error" in navigation_data:
-            return json.dumps(navigation_data, indent=4), 406
-        
-        navigation_response["origin"] = locations["origin"]
-        navigation_response["destination"] = locations["destination"]
-        navigation_response["waypoints"] = count_waypoints(navigation_data)
-        navigation_response["distance_travelled"] = distance_travelled(navigation_data)
-        navigation_response["total_time"] = total_time(navigation_data)
-        navigation_response["lat_lng"] = lat_lng(navigation_data)
-        navigation_response["avg_speed"] = avg_speed(navigation_data)
-        navigation_response["modes_of_transportation"] = modes_of_transportation(navigation_data)
-        navigation_response["summary"] = summary(navigation_response)
-
-        return json.dumps(navigation_response, indent=4), 200        
+        use_cache = not request.cache_control.no_cache
+        profile_response, status = summarize_speed_profile(locations, use_cache=use_cache)
+
+        return json_response(profile_response, status)
+
+    @app.route("/get_alternatives", methods=["POST"], endpoint='get_alternatives')
+    def get_alternatives():
+        locations, error = parse_alternatives_request(request.get_json())
+        if error:
+            return json_response(error[0], error[1])
+
+        use_cache = not request.cache_control.no_cache
+        alternatives_response, status = summarize_alternatives(locations, use_cache=use_cache)
+
+        return json_response(alternatives_response, status)
+
+    @app.route("/get_eta", methods=["POST"], endpoint='get_eta')
+    def get_eta():
+        locations, error = parse_eta_request(request.get_json())
+        if error:
+            return json_response(error[0], error[1])
+
+        use_cache = not request.cache_control.no_cache
+        eta_response, status = summarize_eta(locations, use_cache=use_cache)
+
+        return json_response(eta_response, status)
+
+    @app.route("/get_matrix", methods=["POST"], endpoint='get_matrix')
+    def get_matrix():
+        matrix_request, error = parse_matrix_request(request.get_json())
+        if error:
+            return json_response(error[0], error[1])
+
+        origins, destinations, concurrency, departure_time = matrix_request
+        use_cache = not request.cache_control.no_cache
+
+        # NDJSON sends each cell as soon as its route is in, instead of
+        # waiting for the slowest one.
+        if wants_pretty(request.args.get("stream")) or request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"]) == "application/x-ndjson":
+            def generate_cells():
+                for i, j, element in iter_matrix(origins, destinations, concurrency, use_cache, departure_time=departure_time):
+                    yield json.dumps(dict(element, origin=i, destination=j), separators=(",", ":")) + "\n"
+            return Response(generate_cells(), mimetype="application/x-ndjson")
+
+        return json_response(build_matrix(origins, destinations, concurrency, use_cache, departure_time), 200)
+
+    @app.route("/get_summaries", methods=["POST"], endpoint='get_summaries')
+    def get_summaries():
+        batch, error = parse_batch_request(request.get_json())
+        if error:
+            return json_response(error[0], error[1])
+
+        location_list, concurrency = batch
+        use_cache = not request.cache_control.no_cache
+        results = summarize_batch(location_list, concurrency=concurrency, use_cache=use_cache)
+
+        return json_response({"results": results}, 200)
+
+    @app.route("/traces", endpoint='traces')
+    def traces():
+        # Only shown to the callers allowed to profile, like the profiler's reports.
+        if not profile_allowed(request.remote_addr, request.headers):
+            return json_response({"error": "Traces are not available to this caller."}, 403)
+        limit = request.args.get("limit", type=int)
+        return json_response({"spans": recent_spans(request.args.get("trace_id"), limit)}, 200)
+
+    @app.route("/metrics", endpoint='metrics')
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
 
+    start_prefetcher()
     return app
 
 app = create_app()
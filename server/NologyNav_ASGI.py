@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import time
+import asyncio
+from urllib.parse import parse_qs
+from asgiref.wsgi import WsgiToAsgi
+
+from NologyNav import app as flask_app
+from NologyNav_Methods import summarize_locations, summarize_locations_async, summarize_batch_async, parse_batch_request
+from Google_API_Handler import close_async_client
+from Metrics import REQUEST_SECONDS, RESPONSE_BYTES
+from Response_Encoding import encode_json, wants_pretty
+from Request_Profiler import start_timings, stop_timings, server_timing, profile_requested, profile_allowed, profile_call
+from Tracing import start_trace
+
+# Run with: uvicorn --app-dir server NologyNav_ASGI:app
+#
+# /get_summary and /get_summaries are served natively on the event loop so a
+# worker can hold many upstream Directions calls in flight at once. Every other
+# route is handed to the Flask app unchanged.
+wsgi_app = WsgiToAsgi(flask_app)
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/get_summary" and scope["method"] == "POST":
+        await record_request("get_summary", get_summary, scope, receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/get_summaries" and scope["method"] == "POST":
+        await record_request("get_summaries", get_summaries, scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def record_request(endpoint, handler, scope, receive, send):
+    # The same request metrics and Server-Timing header the Flask app adds to
+    # the routes it serves.
+    started = time.perf_counter()
+    token = start_timings()
+    response = {}
+    trace = start_trace(endpoint, header_value(scope, b"traceparent"), header_value(scope, b"x-trace-id"))
+
+    async def send_and_record(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            timing = server_timing(stop_timings(token), time.perf_counter() - started)
+            headers = list(message.get("headers", [])) + [(b"server-timing", timing.encode("latin-1"))]
+            if trace.trace_id is not None:
+                headers.append((b"x-trace-id", trace.trace_id.encode("latin-1")))
+            message = dict(message, headers=headers)
+        elif message["type"] == "http.response.body":
+            RESPONSE_BYTES.observe(len(message.get("body", b"")), endpoint)
+        await send(message)
+
+    with trace:
+        await handler(scope, receive, send_and_record)
+        trace.set("status", response.get("status"))
+    REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, str(response.get("status")))
+
+async def get_summary(scope, receive, send):
+    try:
+        locations = json.loads(await read_body(receive))
+    except ValueError:
+        await send_json(scope, send, {"error": "Request body must be JSON."}, 400)
+        return
+
+    use_cache = "no-cache" not in header_value(scope, b"cache-control").lower()
+    headers = header_map(scope)
+
+    if profile_requested({"profile": query_value(scope, "profile")}, headers):
+        client = scope.get("client")
+        if not profile_allowed(client[0] if client else None, headers):
+            await send_json(scope, send, {"error": "Profiling is not enabled for this caller."}, 403)
+            return
+        # cProfile follows the calls of one thread, so a profiled request takes
+        # the synchronous path in a worker thread, as it does under Flask.
+        (navigation_response, status), report = await asyncio.to_thread(profile_call, summarize_locations, locations, use_cache=use_cache)
+        navigation_response = dict(navigation_response, profile=report or {"error": "Another request is already being profiled."})
+    else:
+        navigation_response, status = await summarize_locations_async(locations, use_cache=use_cache)
+
+    await send_json(scope, send, navigation_response, status)
+
+async def get_summaries(scope, receive, send):
+    try:
+        batch, error = parse_batch_request(json.loads(await read_body(receive)))
+    except ValueError:
+        batch, error = None, ({"error": "Request body must be JSON."}, 400)
+    if error:
+        await send_json(scope, send, error[0], error[1])
+        return
+
+    location_list, concurrency = batch
+    use_cache = "no-cache" not in header_value(scope, b"cache-control").lower()
+    results = await summarize_batch_async(location_list, concurrency=concurrency, use_cache=use_cache)
+
+    await send_json(scope, send, {"results": results}, 200)
+
+async def read_body(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+def header_value(scope, name):
+    for headerName, value in scope["headers"]:
+        if headerName.lower() == name:
+            return value.decode("latin-1")
+    return ""
+
+def header_map(scope):
+    # Header names spelled as Flask spells them, for the helpers both apps share.
+    return {"-".join(part.capitalize() for part in name.decode("latin-1").split("-")): value.decode("latin-1") for name, value in scope["headers"]}
+
+def query_value(scope, name):
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True).get(name)
+    return values[0] if values else None
+
+async def send_json(scope, send, data, status):
+    body, status, headers = encode_json(
+        data, status,
+        pretty=wants_pretty(query_value(scope, "pretty")),
+        accept_encoding=header_value(scope, b"accept-encoding"),
+        if_none_match=header_value(scope, b"if-none-match")
+    )
+    headers.append(("Content-Length", str(len(body))))
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -1,36 +1,91 @@
 import os
 import sys
 import json
+import math
+import time
+import asyncio
 import requests
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-from Google_API_Handler import retrieve_navigation_payload
+from Google_API_Handler import retrieve_navigation_payload, retrieve_navigation_payload_async, estimate_travel_time, route_durations, SUMMARY_FIELDS, HTTP_BACKOFF_MAX
+from Rate_Limiter import INTERACTIVE, BATCH
+from Metrics import ETA_ANSWERS, stage
+from Tracing import traced
+from Polyline import decode_polylines, path_lengths
+from Step_Table import StepTable
+from Route_Aggregator import RANKINGS, aggregate_routes, rank_routes
 
 load_dotenv()
 
 API_KEY = os.getenv("GOOGLE_API_KEY")
 
-def count_waypoints(navigation_data):
-    return len(navigation_data["routes"][0]["legs"][0]["steps"])
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 100))
 
-def distance_travelled(navigation_data):
-    if "km" in (navigation_data["routes"][0]["legs"][0]["distance"]["text"]):
-        miles = '{:.1f}'.format((navigation_data["routes"][0]["legs"][0]["distance"]["value"]/1000)/1.609)
-        return (f"{miles} mi")
-    return (navigation_data["routes"][0]["legs"][0]["distance"]["text"])
+# Whether /get_eta answers from travel time history when it is confident
+# enough, for requests that do not say themselves.
+ESTIMATE_ETA = os.getenv("TRAVEL_HISTORY_ESTIMATE", "false").lower() in ("1", "true", "yes")
 
-def total_time(navigation_data):
-    return (navigation_data["routes"][0]["legs"][0]["duration"]["text"])
+TRAVEL_MODES = ("driving", "walking", "bicycling", "transit")
 
-def lat_lng(navigation_data):
-    lat_long_locations = ({"lat": navigation_data["routes"][0]["legs"][0]["start_location"]["lat"], "lng": navigation_data["routes"][0]["legs"][0]["start_location"]["lng"]}, 
-                          { "lat": navigation_data["routes"][0]["legs"][0]["end_location"]["lat"], "lng": navigation_data["routes"][0]["legs"][0]["end_location"]["lng"] })
-    return lat_long_locations
+METERS_PER_SECOND_TO_MPH = 2.2369363
+METERS_PER_MILE = 1609.344
 
-def avg_speed(navigation_data):
-    distanceInMeters = navigation_data["routes"][0]["legs"][0]["distance"]["value"]
-    timeInSeconds = navigation_data["routes"][0]["legs"][0]["duration"]["value"]
+class RouteSummary:
+    """Everything /get_summary reports about a route, read from the payload in one pass."""
+    __slots__ = ("waypoints", "distance_text", "distance_value", "duration_text", "duration_value", "start_location", "end_location", "modes")
+
+    def __init__(self, waypoints, distance_text, distance_value, duration_text, duration_value, start_location, end_location, modes):
+        self.waypoints = waypoints
+        self.distance_text = distance_text
+        self.distance_value = distance_value
+        self.duration_text = duration_text
+        self.duration_value = duration_value
+        self.start_location = start_location
+        self.end_location = end_location
+        self.modes = modes
+
+    def distance_travelled(self):
+        return format_distance(self.distance_text, self.distance_value)
+
+    def total_time(self):
+        return self.duration_text
+
+    def lat_lng(self):
+        return format_lat_lng(self.start_location, self.end_location)
+
+    def avg_speed(self):
+        return format_avg_speed(self.distance_value, self.duration_value)
 
+@traced
+def extract_route_summary(navigation_data):
+    leg = first_leg(navigation_data)
+    steps = leg["steps"]
+    distance = leg["distance"]
+    duration = leg["duration"]
+
+    return RouteSummary(len(steps), distance["text"], distance["value"], duration["text"], duration["value"],
+                        leg["start_location"], leg["end_location"], collect_modes(steps))
+
+def first_leg(navigation_data):
+    return navigation_data["routes"][0]["legs"][0]
+
+@traced
+def format_distance(distance_text, distance_value):
+    if "km" in distance_text:
+        miles = '{:.1f}'.format((distance_value/1000)/1.609)
+        return (f"{miles} mi")
+    return distance_text
+
+@traced
+def format_lat_lng(start_location, end_location):
+    return ({"lat": start_location["lat"], "lng": start_location["lng"]},
+            {"lat": end_location["lat"], "lng": end_location["lng"]})
+
+@traced
+def format_avg_speed(distanceInMeters, timeInSeconds):
     distanceInMiles = float('{:.1f}'.format(distanceInMeters * 0.0006213712))
     timeInHours = float('{:.1f}'.format(timeInSeconds/60/60))
 
@@ -38,17 +93,46 @@ def avg_speed(navigation_data):
 
     return averageMph
 
-def modes_of_transportation(navigation_data):
-    steps = navigation_data["routes"][0]["legs"][0]["steps"]
+@traced
+def collect_modes(steps):
     travelTypes = []
+    seen = set()
     for step in steps: 
-        if step["travel_mode"].lower() not in travelTypes:
-            travelTypes.append(step["travel_mode"].lower())
-        if "maneuver" in step and "ferry" in step["maneuver"].lower() and step["maneuver"].lower() not in travelTypes:
-            travelTypes.append(step["maneuver"].lower())
+        travelMode = step["travel_mode"].lower()
+        if travelMode not in seen:
+            seen.add(travelMode)
+            travelTypes.append(travelMode)
+        maneuver = step.get("maneuver")
+        if maneuver:
+            maneuver = maneuver.lower()
+            if "ferry" in maneuver and maneuver not in seen:
+                seen.add(maneuver)
+                travelTypes.append(maneuver)
 
     return travelTypes
 
+def count_waypoints(navigation_data):
+    return len(first_leg(navigation_data)["steps"])
+
+def distance_travelled(navigation_data):
+    distance = first_leg(navigation_data)["distance"]
+    return format_distance(distance["text"], distance["value"])
+
+def total_time(navigation_data):
+    return first_leg(navigation_data)["duration"]["text"]
+
+def lat_lng(navigation_data):
+    leg = first_leg(navigation_data)
+    return format_lat_lng(leg["start_location"], leg["end_location"])
+
+def avg_speed(navigation_data):
+    leg = first_leg(navigation_data)
+    return format_avg_speed(leg["distance"]["value"], leg["duration"]["value"])
+
+def modes_of_transportation(navigation_data):
+    return collect_modes(first_leg(navigation_data)["steps"])
+
+@traced
 def summary(navigation_data):
     outputStr = "This journey will take " + str(navigation_data["total_time"]) + " over " + str(navigation_data["distance_travelled"])
     outputStr += ", covering " + str(navigation_data["waypoints"]) + " waypoints at an average speed of " + str(navigation_data["avg_speed"]) + ". "
@@ -63,26 +147,300 @@ def summary(navigation_data):
     outputStr += ", at a starting (Lat/Long) of (" + str(navigation_data["lat_lng"][0]['lat']) + ", " + str(navigation_data["lat_lng"][0]['lng']) +  "), and ending at (" + str(navigation_data["lat_lng"][1]['lat']) + ", " + str(navigation_data["lat_lng"][1]['lng']) + ")"
     return outputStr
 
-def retrieve_data_from_google(locations):
-    requestOptions = {
+def build_navigation_response(locations, navigation_data):
+    with stage("extract"):
+        route_summary = extract_route_summary(navigation_data)
+
+        navigation_response = {}
+        navigation_response["origin"] = locations["origin"]
+        navigation_response["destination"] = locations["destination"]
+        navigation_response["waypoints"] = route_summary.waypoints
+        navigation_response["distance_travelled"] = route_summary.distance_travelled()
+        navigation_response["total_time"] = route_summary.total_time()
+        navigation_response["lat_lng"] = route_summary.lat_lng()
+        navigation_response["avg_speed"] = route_summary.avg_speed()
+        navigation_response["modes_of_transportation"] = route_summary.modes
+        navigation_response["summary"] = summary(navigation_response)
+        if navigation_data.get("_stale"):
+            # Served from cache while the Directions API could not be used.
+            navigation_response["stale"] = True
+
+        return navigation_response
+
+def speed_profile(navigation_data):
+    # Distances come from the step polylines rather than the rounded figures
+    # Google reports, so every step gets a speed even when it is "0.1 mi".
+    steps = first_leg(navigation_data)["steps"]
+    points, pointCounts = decode_polylines([step["polyline"]["points"] for step in steps])
+    distances = path_lengths(points, pointCounts)
+    stepTable = StepTable(steps)
+    durations = stepTable.duration.astype(float)
+    speeds = np.divide(distances, durations, out=np.zeros_like(distances), where=durations > 0) * METERS_PER_SECOND_TO_MPH
+    totalDuration = durations.sum()
+
+    return {
+        "distance_travelled": f"{distances.sum() / METERS_PER_MILE:.1f} mi",
+        "avg_speed": round(float(distances.sum() / totalDuration * METERS_PER_SECOND_TO_MPH), 1) if totalDuration else 0.0,
+        "max_speed": round(float(speeds.max()), 1) if len(steps) else 0.0,
+        "modes_of_transportation": stepTable.modes(),
+        "duration_by_mode": stepTable.duration_by_mode(),
+        "distance_by_mode": stepTable.distance_by_mode(),
+        "steps": [{
+            "travel_mode": stepTable.travel_modes[modeCode],
+            "distance": round(float(distance), 1),
+            "duration": int(duration),
+            "avg_speed": round(float(speed), 1),
+            "points": int(pointCount)
+        } for modeCode, distance, duration, speed, pointCount in zip(stepTable.travel_mode.tolist(), distances, durations, speeds, pointCounts)],
+        # Miles travelled by the end of each step, and the speed during it.
+        "speed_profile": {
+            "distance": np.round(np.cumsum(distances) / METERS_PER_MILE, 2).tolist(),
+            "speed": np.round(speeds, 1).tolist()
+        }
+    }
+
+def build_speed_profile_response(locations, navigation_data):
+    with stage("extract"):
+        profile_response = {"origin": locations["origin"], "destination": locations["destination"]}
+        profile_response.update(speed_profile(navigation_data))
+        if navigation_data.get("_stale"):
+            profile_response["stale"] = True
+        return profile_response
+
+def summarize_speed_profile(locations, use_cache=True):
+    # Needs the step polylines, which the summary field set leaves out.
+    navigation_data = retrieve_data_from_google(locations, use_cache=use_cache, fields=None)
+
+    if "error" in navigation_data:
+        return navigation_data, error_status(navigation_data)
+
+    return build_speed_profile_response(locations, navigation_data), 200
+
+def parse_alternatives_request(body):
+    if not valid_locations(body):
+        return None, ({"error": "An origin and a destination are required."}, 400)
+    waypoints = body.get("waypoints", [])
+    if not isinstance(waypoints, list) or not all(isinstance(waypoint, str) for waypoint in waypoints):
+        return None, ({"error": "waypoints must be a list of locations."}, 400)
+    if body.get("mode") is not None and body["mode"] not in TRAVEL_MODES:
+        return None, ({"error": f"mode must be one of: {', '.join(TRAVEL_MODES)}."}, 400)
+    if body.get("rank_by", "fastest") not in RANKINGS:
+        return None, ({"error": f"rank_by must be one of: {', '.join(RANKINGS)}."}, 400)
+    return body, None
+
+def build_alternatives_options(locations):
+    options = build_request_options(locations)
+    if locations.get("waypoints"):
+        options["waypoints"] = tuple(locations["waypoints"])
+    if locations.get("mode"):
+        options["mode"] = locations["mode"]
+    options["alternatives"] = "true"
+    return options
+
+def summarize_alternatives(locations, use_cache=True):
+    result = retrieve_navigation_payload(build_alternatives_options(locations), use_cache=use_cache)
+
+    # e.g. transit directions cannot have waypoints.
+    if result.get("status") == "INVALID_REQUEST":
+        return {"error": result.get("error_message", "Google could not route this request.")}, 400
+
+    navigation_data = check_geocoding(locations, result)
+    if "error" in navigation_data:
+        return navigation_data, error_status(navigation_data)
+
+    rank_by = locations.get("rank_by", "fastest")
+    with stage("extract"):
+        routes, best = rank_routes(aggregate_routes(navigation_data), rank_by)
+
+    alternatives_response = {
+        "origin": locations["origin"],
+        "destination": locations["destination"],
+        "waypoints": locations.get("waypoints", []),
+        "ranked_by": rank_by,
+        "best": best,
+        "routes": routes
+    }
+    if navigation_data.get("_stale"):
+        alternatives_response["stale"] = True
+    return alternatives_response, 200
+
+def departure_error(departure):
+    """Why a request's departure_time cannot be used, or None."""
+    if type(departure) not in (int, float):
+        return "departure_time must be a Unix timestamp in seconds."
+    # A little slack for clocks that disagree.
+    if departure < time.time() - 60:
+        return "departure_time must not be in the past."
+    return None
+
+def departure_option(departure):
+    # Google only gives a duration in traffic to a request with a departure
+    # time, and refuses one in the past.
+    return str(int(departure)) if departure is not None and departure > time.time() else "now"
+
+def parse_eta_request(body):
+    if not valid_locations(body):
+        return None, ({"error": "An origin and a destination are required."}, 400)
+    departure = body.get("departure_time")
+    if departure is not None and departure_error(departure):
+        return None, ({"error": departure_error(departure)}, 400)
+    if type(body.get("estimate", False)) != bool:
+        return None, ({"error": "estimate must be true or false."}, 400)
+    return body, None
+
+def build_eta_options(locations):
+    options = build_request_options(locations)
+    options["departure_time"] = departure_option(locations.get("departure_time"))
+    return options
+
+def summarize_eta(locations, use_cache=True):
+    departure = max(locations.get("departure_time") or 0, time.time())
+    options = build_eta_options(locations)
+
+    if locations.get("estimate", ESTIMATE_ETA):
+        estimate = estimate_travel_time(options, departure)
+        if estimate is not None:
+            ETA_ANSWERS.inc("history")
+            return build_eta_response(locations, departure, estimate["duration"], "history", samples=estimate["samples"], stddev=estimate["stddev"]), 200
+
+    navigation_data = check_geocoding(locations, retrieve_navigation_payload(options, use_cache=use_cache, fields=SUMMARY_FIELDS))
+    if "error" in navigation_data:
+        return navigation_data, error_status(navigation_data)
+
+    ETA_ANSWERS.inc("google")
+    duration, durationInTraffic = route_durations(navigation_data)
+    eta_response = build_eta_response(locations, departure, duration if durationInTraffic is None else durationInTraffic, "google")
+    if navigation_data.get("_stale"):
+        eta_response["stale"] = True
+    return eta_response, 200
+
+def build_eta_response(locations, departure, duration, source, **details):
+    return dict({
+        "origin": locations["origin"],
+        "destination": locations["destination"],
+        "departure_time": int(departure),
+        "duration": duration,
+        "arrival_time": int(departure + duration),
+        "source": source
+    }, **details)
+
+def summarize_locations(locations, use_cache=True, priority=INTERACTIVE):
+    navigation_data = retrieve_data_from_google(locations, use_cache=use_cache, priority=priority)
+
+    if "error" in navigation_data:
+        return navigation_data, error_status(navigation_data)
+
+    return build_navigation_response(locations, navigation_data), 200
+
+async def summarize_locations_async(locations, use_cache=True, priority=INTERACTIVE):
+    navigation_data = await retrieve_data_from_google_async(locations, use_cache=use_cache, priority=priority)
+
+    if "error" in navigation_data:
+        return navigation_data, error_status(navigation_data)
+
+    return build_navigation_response(locations, navigation_data), 200
+
+def summarize_batch(location_list, concurrency=None, use_cache=True):
+    concurrency = concurrency or BATCH_CONCURRENCY
+    workers = max(1, min(concurrency, len(location_list)))
+
+    def summarize_item(locations):
+        if not valid_locations(locations):
+            return batch_error(400, "Each item needs an origin and a destination.")
+        try:
+            return batch_result(*summarize_locations(locations, use_cache=use_cache, priority=BATCH))
+        except Exception as error:
+            return batch_error(502, f"Unable to retrieve this route from Google: {error}")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(summarize_item, location_list))
+
+async def summarize_batch_async(location_list, concurrency=None, use_cache=True):
+    semaphore = asyncio.Semaphore(concurrency or BATCH_CONCURRENCY)
+
+    async def summarize_item(locations):
+        if not valid_locations(locations):
+            return batch_error(400, "Each item needs an origin and a destination.")
+        async with semaphore:
+            try:
+                return batch_result(*await summarize_locations_async(locations, use_cache=use_cache, priority=BATCH))
+            except Exception as error:
+                return batch_error(502, f"Unable to retrieve this route from Google: {error}")
+
+    return await asyncio.gather(*[summarize_item(locations) for locations in location_list])
+
+def parse_batch_request(body):
+    location_list = body.get("locations") if isinstance(body, dict) else body
+    if not isinstance(location_list, list):
+        return None, ({"error": "Expected a list of locations."}, 400)
+    if len(location_list) > BATCH_MAX_ITEMS:
+        return None, ({"error": f"A batch may contain at most {BATCH_MAX_ITEMS} locations."}, 413)
+
+    concurrency = body.get("concurrency") if isinstance(body, dict) else None
+    if concurrency is not None:
+        if type(concurrency) != int or concurrency < 1:
+            return None, ({"error": "concurrency must be a positive integer."}, 400)
+        concurrency = min(concurrency, BATCH_CONCURRENCY)
+
+    return (location_list, concurrency), None
+
+def valid_locations(locations):
+    return isinstance(locations, dict) and isinstance(locations.get("origin"), str) and isinstance(locations.get("destination"), str)
+
+def batch_result(response, status):
+    if status != 200:
+        return batch_error(status, response["error"])
+    return {"status": status, "result": response}
+
+def batch_error(status, message):
+    return {"status": status, "error": message}
+
+def build_request_options(locations):
+    return {
         "origin": locations["origin"],
         "destination": locations["destination"]
     }
-    
-    result = retrieve_navigation_payload(requestOptions)
+
+@traced
+def retrieve_data_from_google(locations, use_cache=True, fields=SUMMARY_FIELDS, priority=INTERACTIVE):
+    result = retrieve_navigation_payload(build_request_options(locations), use_cache=use_cache, fields=fields, priority=priority)
+
+    return check_geocoding(locations, result)
+
+@traced
+async def retrieve_data_from_google_async(locations, use_cache=True, priority=INTERACTIVE):
+    result = await retrieve_navigation_payload_async(build_request_options(locations), use_cache=use_cache, fields=SUMMARY_FIELDS, priority=priority)
+
+    return check_geocoding(locations, result)
+
+def error_status(navigation_data):
+    # Quota errors are worth retrying later; anything else about the route will not change.
+    return 503 if "retry_after" in navigation_data else 406
+
+@traced
+def check_geocoding(locations, result):
     error_dict = {"error": ""}
 
-    if result["geocoded_waypoints"][0]["geocoder_status"] == "OK" and result["geocoded_waypoints"][1]["geocoder_status"] == "OK" and result["status"] == "ZERO_RESULTS":
+    if result.get("status") == "OVER_QUERY_LIMIT":
+        return {"error": "Too many route requests right now; please try again shortly.", "retry_after": math.ceil(result.get("retry_after", HTTP_BACKOFF_MAX))}
+    if "retry_after" in result:
+        return {"error": "Directions are unavailable right now; please try again shortly.", "retry_after": math.ceil(result["retry_after"])}
+    if not result.get("geocoded_waypoints"):
+        # e.g. REQUEST_DENIED or UNKNOWN_ERROR, which come without geocoding results.
+        return {"error": result.get("error_message") or f"Google could not route this request ({result.get('status')})."}
+
+    if result["geocoded_waypoints"][0]["geocoder_status"] == "OK" and result["geocoded_waypoints"][-1]["geocoder_status"] == "OK" and result["status"] == "ZERO_RESULTS":
         error_dict["error"] = f"We are unable to find a driving route between {locations['origin']} and {locations['destination']}."
         
-    if result["geocoded_waypoints"][0]["geocoder_status"] == "ZERO_RESULTS" and result["geocoded_waypoints"][1]["geocoder_status"] == "ZERO_RESULTS":
+    if result["geocoded_waypoints"][0]["geocoder_status"] == "ZERO_RESULTS" and result["geocoded_waypoints"][-1]["geocoder_status"] == "ZERO_RESULTS":
         error_dict["error"] = f"We are unable to find the origin and destination."
     elif result["geocoded_waypoints"][0]["geocoder_status"] == "ZERO_RESULTS":
         error_dict["error"] = "We are unable to find that origin."
-    elif result["geocoded_waypoints"][1]["geocoder_status"] == "ZERO_RESULTS":
+    elif result["geocoded_waypoints"][-1]["geocoder_status"] == "ZERO_RESULTS":
         error_dict["error"] = "We are unable to find that destination."
+    elif any(waypoint["geocoder_status"] == "ZERO_RESULTS" for waypoint in result["geocoded_waypoints"][1:-1]):
+        error_dict["error"] = "We are unable to find one of the waypoints."
     else:
         pass
     
     return result if error_dict["error"] == "" else error_dict   
-      
\ No newline at end of file
@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import traceback
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Production entry point: binds one listening socket, imports the app once and
+# forks worker processes that all accept on that socket.
+#
+#   python server/NologyNav_Server.py --port 5000 --workers 4
+#
+# Unless ROUTE_STORE_PATH is set, the workers share a route store in shared
+# memory (/dev/shm where there is one), so a route fetched by one worker is a
+# cache hit for all of them. Routes found in the store are served as fresh,
+# so unless ROUTE_STORE_TTL is set it keeps them for ROUTE_CACHE_TTL, not the
+# store's longer default: running more than one process must not make
+# answers older.
+
+SHARED_MEMORY_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# A worker that dies sooner than this after starting is restarted only after
+# this long, so a crash at startup does not turn into a fork loop.
+RESTART_DELAY = 1.0
+
+def shared_path(name):
+    return os.path.join(SHARED_MEMORY_DIR, f"nologynav-{os.getpid()}-{name}")
+
+def configure_shared_state():
+    """Points the route store (and rate limit) at files every worker can see. Returns the files created for this run."""
+    # These are read when Google_API_Handler is imported, so this must come first.
+    created = []
+    if not os.getenv("ROUTE_STORE_PATH"):
+        os.environ["ROUTE_STORE_PATH"] = shared_path("routes.sqlite")
+        created += [os.environ["ROUTE_STORE_PATH"] + suffix for suffix in ("", "-wal", "-shm")]
+    if not os.getenv("ROUTE_STORE_TTL"):
+        os.environ["ROUTE_STORE_TTL"] = os.getenv("ROUTE_CACHE_TTL") or "300"
+    if float(os.getenv("GOOGLE_API_QPS", 0)) > 0 and not os.getenv("GOOGLE_API_RATE_LIMIT_PATH"):
+        # One quota for the host rather than one per worker.
+        os.environ["GOOGLE_API_RATE_LIMIT_PATH"] = shared_path("quota")
+        created.append(os.environ["GOOGLE_API_RATE_LIMIT_PATH"])
+    return created
+
+def bind_socket(host, port, backlog=128):
+    listener = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    # Every worker is woken for a new connection and only one gets it; the
+    # others must not block in accept() waiting for the next.
+    listener.setblocking(False)
+    return listener
+
+def worker_cache(cache, workers):
+    # The shared store holds every route once; each worker only keeps its
+    # share of the in-memory budget, so memory does not grow with workers.
+    from Route_Cache import RouteCache
+    return RouteCache(
+        max_entries=max(1, cache.max_entries // workers),
+        max_bytes=cache.max_bytes // workers,
+        ttl=cache.ttl,
+        stale_ttl=cache.stale_ttl
+    )
+
+def run_worker(number, listener, host, port, workers):
+    from werkzeug.serving import make_server
+    import Google_API_Handler
+    import Tracing
+    from NologyNav import app
+
+    Google_API_Handler.reset_after_fork()
+    Tracing.reset_after_fork()
+    Google_API_Handler.ROUTE_CACHE = worker_cache(Google_API_Handler.ROUTE_CACHE, workers)
+    # The first worker's share of the traffic is enough to find the hot routes.
+    prefetcher = Google_API_Handler.PREFETCHER if number == 0 else None
+    if prefetcher is not None:
+        prefetcher.start()
+
+    server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+
+    def shut_down(signum, frame):
+        # shutdown() waits for serve_forever() to return, which cannot happen
+        # while this handler runs on the same thread.
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, shut_down)
+    signal.signal(signal.SIGINT, shut_down)
+    server.serve_forever()
+
+    if prefetcher is not None:
+        prefetcher.stop()
+        if Google_API_Handler.PREFETCH_STATS_PATH:
+            prefetcher.save(Google_API_Handler.PREFETCH_STATS_PATH)
+
+def spawn_worker(number, listener, host, port, workers):
+    pid = os.fork()
+    if pid != 0:
+        return pid
+
+    status = 0
+    try:
+        run_worker(number, listener, host, port, workers)
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        # Skip the parent's atexit handlers and buffered output.
+        os._exit(status)
+
+def serve(host, port, workers):
+    created = configure_shared_state()
+    listener = bind_socket(host, port)
+
+    # Imported before forking so every worker shares the loaded modules.
+    import NologyNav
+    import Google_API_Handler
+    Google_API_Handler.prepare_fork()
+
+    print(f"Listening on http://{host}:{listener.getsockname()[1]} with {workers} workers", file=sys.stderr, flush=True)
+
+    children = {}
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        stopping.set()
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for number in range(workers):
+        children[spawn_worker(number, listener, host, port, workers)] = (number, time.monotonic())
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        number, started = children.pop(pid, (None, 0))
+        if number is None or stopping.is_set():
+            continue
+        print(f"Worker {number} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}; restarting", file=sys.stderr, flush=True)
+        if time.monotonic() - started < RESTART_DELAY:
+            time.sleep(RESTART_DELAY)
+        if not stopping.is_set():
+            children[spawn_worker(number, listener, host, port, workers)] = (number, time.monotonic())
+
+    listener.close()
+    for path in created:
+        if os.path.exists(path):
+            os.remove(path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve NologyNav from several pre-forked worker processes.")
+    parser.add_argument("--host", default=os.getenv("SERVER_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVER_PORT", 5000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVER_WORKERS", os.cpu_count() or 1)))
+    args = parser.parse_args(argv)
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    serve(args.host, args.port, args.workers)
+
+if __name__ == "__main__":
+    main()
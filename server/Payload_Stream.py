@@ -0,0 +1,132 @@
+import json
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# What parsing raises for a body that is not (complete) JSON.
+PARSE_ERRORS = (ValueError, ijson.JSONError) if ijson is not None else (ValueError,)
+
+# Parts of a Directions response that /get_summary and the Google_API_Handler
+# helpers read, written as ijson prefixes. Anything not on (or under) one of
+# these paths, e.g. polylines and html_instructions, is never materialized.
+FIELD_SETS = {
+    "summary": (
+        "status",
+        "error_message",
+        "geocoded_waypoints",
+        "routes.item.fare",
+        "routes.item.summary",
+        "routes.item.legs.item.distance",
+        "routes.item.legs.item.duration",
+        "routes.item.legs.item.duration_in_traffic",
+        "routes.item.legs.item.start_location",
+        "routes.item.legs.item.end_location",
+        "routes.item.legs.item.start_address",
+        "routes.item.legs.item.end_address",
+        "routes.item.legs.item.arrival_time",
+        "routes.item.legs.item.departure_time",
+        "routes.item.legs.item.steps.item.travel_mode",
+        "routes.item.legs.item.steps.item.maneuver",
+        "routes.item.legs.item.steps.item.duration",
+        "routes.item.legs.item.steps.item.distance",
+        "routes.item.legs.item.steps.item.transit_details.line.vehicle",
+        # Only the presence of sub-steps is used (walking sections of transit routes).
+        "routes.item.legs.item.steps.item.steps.item.travel_mode"
+    )
+}
+
+KEEP_ALL = 2
+KEEP_PARTIAL = 1
+DROP = 0
+
+def streaming_available():
+    return ijson is not None
+
+class PayloadParser:
+    """Incrementally parses a JSON body, building only the paths listed in a field set."""
+
+    def __init__(self, fields):
+        self._paths = FIELD_SETS[fields]
+        self._decisions = {"": KEEP_PARTIAL}
+        self._stack = []
+        self._keys = []
+        self._skip_depth = 0
+        self._root = None
+        self.bytes_read = 0
+        self._parser = ijson.parse_coro(self, use_float=True)
+
+    def feed(self, chunk):
+        self.bytes_read += len(chunk)
+        self._parser.send(chunk)
+
+    def close(self):
+        self._parser.close()
+        return self._root
+
+    def send(self, event):
+        prefix, kind, value = event
+
+        if self._skip_depth:
+            if kind == "start_map" or kind == "start_array":
+                self._skip_depth += 1
+            elif kind == "end_map" or kind == "end_array":
+                self._skip_depth -= 1
+            return
+
+        if kind == "map_key":
+            self._keys[-1] = value
+        elif kind == "start_map" or kind == "start_array":
+            if self._decide(prefix) == DROP:
+                self._skip_depth = 1
+                return
+            container = {} if kind == "start_map" else []
+            self._attach(container)
+            self._stack.append(container)
+            self._keys.append(None)
+        elif kind == "end_map" or kind == "end_array":
+            self._stack.pop()
+            self._keys.pop()
+        elif self._decide(prefix) != DROP:
+            self._attach(value)
+
+    def _attach(self, value):
+        if not self._stack:
+            self._root = value
+            return
+        parent = self._stack[-1]
+        if type(parent) is dict:
+            parent[self._keys[-1]] = value
+        else:
+            parent.append(value)
+
+    def _decide(self, prefix):
+        decision = self._decisions.get(prefix)
+        if decision is None:
+            decision = DROP
+            for path in self._paths:
+                if prefix == path or prefix.startswith(path + "."):
+                    decision = KEEP_ALL
+                    break
+                if path.startswith(prefix + "."):
+                    decision = KEEP_PARTIAL
+            self._decisions[prefix] = decision
+        return decision
+
+def parse_chunks(chunks, fields):
+    parser = PayloadParser(fields)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close(), parser.bytes_read
+
+async def parse_chunks_async(chunks, fields):
+    parser = PayloadParser(fields)
+    async for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close(), parser.bytes_read
+
+def payload_size(payload):
+    # Pruned payloads are much smaller than the body they came from; charge
+    # caches for what is actually kept.
+    return len(json.dumps(payload, separators=(",", ":")))
@@ -0,0 +1,104 @@
+import numpy as np
+
+# Vectorized decoding of Google's encoded polyline format and great-circle
+# distances along the decoded paths. Every step works on whole arrays, so a
+# route with tens of thousands of points is decoded without a Python loop per
+# point. Format: https://developers.google.com/maps/documentation/utilities/polylinealgorithm
+
+EARTH_RADIUS_METERS = 6371008.8
+PRECISION = 1e5
+
+def decode_values(encoded):
+    # Each value is a run of 5-bit chunks (offset by 63), least significant
+    # first, where every chunk but the last has the 0x20 bit set.
+    raw = np.frombuffer(encoded, dtype=np.uint8)
+    if raw.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+    if raw.min() < 63 or raw.max() > 63 + 0x3f:
+        raise ValueError("Polyline contains characters outside the encoding range.")
+
+    chunks = raw - np.uint8(63)
+    ends = chunks < 0x20
+    if not ends[-1]:
+        raise ValueError("Polyline ends in the middle of a value.")
+
+    # Position of each chunk within its value, for the shift it needs.
+    isStart = np.empty(chunks.size, dtype=bool)
+    isStart[0] = True
+    isStart[1:] = ends[:-1]
+    index = np.arange(chunks.size)
+    position = index - np.maximum.accumulate(np.where(isStart, index, 0))
+
+    values = np.add.reduceat((chunks & 0x1f).astype(np.int64) << (5 * position), np.flatnonzero(isStart))
+
+    # Undo the zig-zag sign encoding.
+    return (values >> 1) ^ -(values & 1), ends
+
+def decode_polyline(encoded):
+    """Returns the points of one encoded polyline as an (n, 2) array of lat/lng degrees."""
+    points, counts = decode_polylines([encoded])
+    return points
+
+def decode_polylines(encoded_list):
+    """Decodes many polylines in one pass.
+
+    Returns every point as one (n, 2) array of lat/lng degrees, and the number
+    of points that came from each polyline.
+    """
+    parts = [encoded.encode("ascii") for encoded in encoded_list]
+    if not parts:
+        return np.zeros((0, 2)), np.zeros(0, dtype=np.int64)
+    values, ends = decode_values(b"".join(parts))
+
+    # Values each polyline contributed, from the value ends seen up to its last byte.
+    byteOffsets = np.cumsum([len(part) for part in parts], dtype=np.int64)
+    endsBefore = np.concatenate(([0], np.cumsum(ends)))[byteOffsets]
+    valueCounts = np.diff(np.concatenate(([0], endsBefore)))
+    if np.any(valueCounts % 2) or any(part and not ends[offset - 1] for part, offset in zip(parts, byteOffsets)):
+        raise ValueError("Polyline does not contain whole lat/lng pairs.")
+    counts = valueCounts // 2
+
+    # Points are deltas from the previous point of the same polyline, so the
+    # running total restarts at the first point of each one.
+    deltas = values.reshape(-1, 2)
+    totals = np.cumsum(deltas, axis=0)
+    firstPoints = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    before = np.vstack((np.zeros((1, 2), dtype=np.int64), totals))[firstPoints]
+    points = (totals - np.repeat(before, counts, axis=0)) / PRECISION
+
+    return points, counts
+
+def haversine(start, end):
+    """Great-circle distance in meters between arrays of lat/lng points."""
+    lat1, lng1 = np.radians(start[..., 0]), np.radians(start[..., 1])
+    lat2, lng2 = np.radians(end[..., 0]), np.radians(end[..., 1])
+    return central_angle(lat1, lat2, lng2 - lng1, np.cos(lat1), np.cos(lat2)) * EARTH_RADIUS_METERS
+
+def central_angle(lat1, lat2, lngDelta, cosLat1, cosLat2):
+    a = np.sin((lat2 - lat1) / 2) ** 2 + cosLat1 * cosLat2 * np.sin(lngDelta / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def segment_distances(points):
+    """Distance in meters between each point and the next along a path."""
+    radians = np.radians(points)
+    lat, lng = radians[:, 0], radians[:, 1]
+    # Along a path every point is both a start and an end, so its cosine is
+    # only worked out once.
+    cosLat = np.cos(lat)
+    return central_angle(lat[:-1], lat[1:], np.diff(lng), cosLat[:-1], cosLat[1:]) * EARTH_RADIUS_METERS
+
+def path_length(points):
+    if len(points) < 2:
+        return 0.0
+    return float(segment_distances(points).sum())
+
+def path_lengths(points, counts):
+    """Length in meters of each path in the output of decode_polylines."""
+    counts = np.asarray(counts)
+    if len(points) < 2:
+        return np.zeros(len(counts))
+
+    pathIds = np.repeat(np.arange(len(counts)), counts)
+    distances = segment_distances(points)
+    samePath = pathIds[1:] == pathIds[:-1]
+    return np.bincount(pathIds[1:][samePath], weights=distances[samePath], minlength=len(counts))
@@ -0,0 +1,205 @@
+import os
+import sys
+import time
+import heapq
+import struct
+import asyncio
+import itertools
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Callers waiting for an upstream request are served lowest number first, so
+# a user waiting on /get_summary goes ahead of batch and prefetch work.
+INTERACTIVE = 0
+BATCH = 1
+PREFETCH = 2
+PRIORITY_NAMES = ("interactive", "batch", "prefetch")
+
+# How often a waiter that is not at the front of the queue looks again.
+POLL_INTERVAL = 0.05
+
+class RateLimitExceeded(Exception):
+    """Raised when a request could not be let through within its maximum wait."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Upstream rate limit reached; retry in {retry_after:.1f}s.")
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Holds up to burst tokens, refilled at rate tokens per second."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Takes a token, returning 0, or returns the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens, self.updated = refill(self.tokens, self.updated, now, self.rate, self.burst)
+        return take_token(self)
+
+    def available(self):
+        return refill(self.tokens, self.updated, time.monotonic(), self.rate, self.burst)[0]
+
+class SharedTokenBucket:
+    """A token bucket kept in a small file, so every worker process draws on one quota."""
+
+    STATE = struct.Struct("dd")
+
+    def __init__(self, path, rate, burst):
+        if fcntl is None:
+            raise RuntimeError("A shared rate limit needs fcntl, which this platform does not have.")
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self._open()
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._pid = os.getpid()
+
+    def _locked(self, update):
+        # flock locks belong to the open file, which a forked child shares
+        # with its parent, so each process opens the file for itself.
+        if self._pid != os.getpid():
+            self._open()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            # Wall-clock time, so every process reads the same clock.
+            now = time.time()
+            state = os.pread(self._fd, self.STATE.size, 0)
+            self.tokens, self.updated = self.STATE.unpack(state) if len(state) == self.STATE.size else (self.burst, now)
+            self.tokens, self.updated = refill(self.tokens, self.updated, now, self.rate, self.burst)
+            result = update()
+            os.pwrite(self._fd, self.STATE.pack(self.tokens, self.updated), 0)
+            return result
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def take(self):
+        return self._locked(lambda: take_token(self))
+
+    def available(self):
+        return self._locked(lambda: self.tokens)
+
+    def close(self):
+        os.close(self._fd)
+
+def refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + max(0.0, now - updated) * rate), now
+
+def take_token(bucket):
+    if bucket.tokens >= 1:
+        bucket.tokens -= 1
+        return 0
+    return (1 - bucket.tokens) / bucket.rate
+
+class RateLimiter:
+    """Lets upstream requests through at a steady rate, in priority order.
+
+    Callers queue by priority, then arrival. Only the caller at the front of
+    the queue takes tokens, so a burst of batch work cannot starve a later
+    interactive request. A caller whose turn would not come within its
+    maximum wait gives up straight away with RateLimitExceeded rather than
+    adding to the queue.
+    """
+
+    def __init__(self, rate, burst=None, max_wait=2.0, path=None):
+        burst = max(1.0, float(burst or rate))
+        self.bucket = SharedTokenBucket(path, rate, burst) if path else TokenBucket(rate, burst)
+        self.rate = rate
+        self.max_wait = max_wait
+        self._condition = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+
+        self.granted = 0
+        self.rejected = 0
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def _enqueue(self, priority):
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            return ticket
+
+    def _discard(self, ticket):
+        with self._condition:
+            if ticket in self._waiters:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    def _poll(self, ticket):
+        """Returns 0 once ticket has its token, otherwise a guess at the seconds left to wait."""
+        with self._condition:
+            if self._waiters[0] == ticket:
+                wait = self.bucket.take()
+                if wait == 0:
+                    heapq.heappop(self._waiters)
+                    self.granted += 1
+                    self._condition.notify_all()
+                return wait
+            ahead = sum(1 for waiter in self._waiters if waiter < ticket)
+            return max(POLL_INTERVAL, (ahead + 1 - self.bucket.available()) / self.rate)
+
+    def _reject(self, ticket, wait):
+        self._discard(ticket)
+        self.rejected += 1
+        return RateLimitExceeded(wait)
+
+    def acquire(self, priority=INTERACTIVE, max_wait=None):
+        """Blocks until a request may be sent, returning the seconds spent queued."""
+        started = time.monotonic()
+        deadline = started + (self.max_wait if max_wait is None else max_wait)
+        ticket = self._enqueue(priority)
+
+        try:
+            with self._condition:
+                while True:
+                    wait = self._poll(ticket)
+                    if wait == 0:
+                        return time.monotonic() - started
+                    if time.monotonic() + wait > deadline:
+                        break
+                    # Woken early whenever the queue moves.
+                    self._condition.wait(wait)
+        except BaseException:
+            self._discard(ticket)
+            raise
+        raise self._reject(ticket, wait)
+
+    async def acquire_async(self, priority=INTERACTIVE, max_wait=None):
+        started = time.monotonic()
+        deadline = started + (self.max_wait if max_wait is None else max_wait)
+        ticket = self._enqueue(priority)
+
+        try:
+            while True:
+                wait = self._poll(ticket)
+                if wait == 0:
+                    return time.monotonic() - started
+                if time.monotonic() + wait > deadline:
+                    break
+                await asyncio.sleep(min(wait, POLL_INTERVAL))
+        except BaseException:
+            self._discard(ticket)
+            raise
+        raise self._reject(ticket, wait)
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "queued": self.queued,
+            "granted": self.granted,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,83 @@
+import os
+import sys
+import hmac
+import pstats
+import cProfile
+import threading
+import contextvars
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Profiling is only run for callers on this list, or that send PROFILE_TOKEN.
+PROFILE_ALLOWED_IPS = [address.strip() for address in os.getenv("PROFILE_ALLOWED_IPS", "127.0.0.1,::1").split(",") if address.strip()]
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", 25))
+
+# Stage durations for the request being handled, in the order they happened.
+_timings = contextvars.ContextVar("nologynav_stage_timings", default=None)
+
+# Only one profiler can be active in a process at a time.
+_profile_lock = threading.Lock()
+
+def start_timings():
+    return _timings.set([])
+
+def stop_timings(token):
+    timings = _timings.get()
+    _timings.reset(token)
+    return timings or []
+
+def record_stage(name, seconds):
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+def server_timing(timings, total=None):
+    # Repeated stages (e.g. an upstream retry) are added together.
+    durations = {}
+    for name, seconds in timings:
+        durations[name] = durations.get(name, 0.0) + seconds
+    if total is not None:
+        durations["total"] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in durations.items())
+
+def profile_requested(args, headers):
+    flag = args.get("profile") or headers.get("X-Profile")
+    return flag is not None and flag.lower() not in ("0", "false", "no")
+
+def profile_allowed(remote_addr, headers):
+    token = headers.get("X-Profile-Token")
+    if PROFILE_TOKEN and token and hmac.compare_digest(token, PROFILE_TOKEN):
+        return True
+    return remote_addr in PROFILE_ALLOWED_IPS
+
+def profile_call(fn, *args, **kwargs):
+    """Runs fn under cProfile and returns (result, report), or (result, None) when another request is already being profiled."""
+    if not _profile_lock.acquire(blocking=False):
+        return fn(*args, **kwargs), None
+
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(fn, *args, **kwargs)
+    finally:
+        _profile_lock.release()
+
+    return result, profile_report(profiler)
+
+def profile_report(profiler, top=None):
+    stats = pstats.Stats(profiler)
+    functions = []
+    for (filename, line, name), (calls, primitiveCalls, ownTime, cumulativeTime, callers) in stats.stats.items():
+        functions.append({
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": calls,
+            "own_ms": round(ownTime * 1000, 3),
+            "cumulative_ms": round(cumulativeTime * 1000, 3)
+        })
+    functions.sort(key=lambda function: function["cumulative_ms"], reverse=True)
+
+    return {
+        "total_ms": round(stats.total_tt * 1000, 3),
+        "functions": functions[:top or PROFILE_TOP]
+    }
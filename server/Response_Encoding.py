@@ -0,0 +1,65 @@
+import os
+import sys
+import gzip
+import json
+import zlib
+import hashlib
+from dotenv import load_dotenv
+from werkzeug.http import parse_accept_header, parse_etags
+
+from Metrics import stage
+
+load_dotenv()
+
+# Bodies smaller than this are sent as they are; compressing them costs more
+# than it saves.
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 512))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", 6))
+
+ENCODINGS = ("gzip", "deflate")
+
+def wants_pretty(value):
+    return value is not None and value.lower() not in ("0", "false", "no")
+
+def negotiate_encoding(accept_encoding):
+    if not accept_encoding:
+        return None
+    return parse_accept_header(accept_encoding).best_match(ENCODINGS)
+
+def compress(body, encoding):
+    if encoding == "gzip":
+        # mtime=0 keeps the output, and so the ETag, the same for the same body.
+        return gzip.compress(body, compresslevel=COMPRESS_LEVEL, mtime=0)
+    return zlib.compress(body, COMPRESS_LEVEL)
+
+def encode_json(data, status, pretty=False, accept_encoding=None, if_none_match=None):
+    """Serializes a JSON response for the caller and returns (body, status, headers).
+
+    Bodies are compact unless pretty is set, compressed when the caller accepts
+    gzip or deflate, and successful responses get a strong ETag so a repeated
+    request with a matching If-None-Match is answered with an empty 304.
+    """
+    with stage("serialize"):
+        if pretty:
+            body = json.dumps(data, indent=4).encode("UTF-8")
+        else:
+            body = json.dumps(data, separators=(",", ":")).encode("UTF-8")
+
+    headers = [("Content-Type", "application/json"), ("Vary", "Accept-Encoding")]
+    if status == 503 and isinstance(data, dict) and "retry_after" in data:
+        headers.append(("Retry-After", str(data["retry_after"])))
+    encoding = negotiate_encoding(accept_encoding) if len(body) >= COMPRESS_MIN_BYTES else None
+
+    if status == 200:
+        # Each encoding is a different representation, so it gets its own tag.
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest() + ("-" + encoding if encoding else "")
+        headers.append(("ETag", '"' + etag + '"'))
+        if if_none_match and parse_etags(if_none_match).contains_weak(etag):
+            return b"", 304, headers
+
+    if encoding:
+        with stage("compress"):
+            body = compress(body, encoding)
+        headers.append(("Content-Encoding", encoding))
+
+    return body, status, headers
@@ -0,0 +1,85 @@
+from Step_Table import StepTable
+
+# Figures for every route and every leg of a Directions response, read in one
+# pass, so alternatives (alternatives=true) and waypoint requests can be
+# compared without a follow-up request per option.
+
+METERS_PER_SECOND_TO_MPH = 2.2369363
+METERS_PER_MILE = 1609.344
+
+# Each ranking sorts by its own figure first and total time second.
+RANKINGS = {
+    "fastest": lambda route: (route["duration_in_traffic"], route["distance"]),
+    "shortest": lambda route: (route["distance"], route["duration_in_traffic"]),
+    "least_walking": lambda route: (route["walking_duration"], route["duration_in_traffic"])
+}
+
+def format_duration(seconds):
+    # The same wording Google uses for durations, e.g. "1 day 12 hours", "5 hours 50 mins".
+    minutes = int(round(seconds / 60))
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+
+    def plural(count, unit):
+        return f"{count} {unit}" + ("s" if count != 1 else "")
+
+    if days:
+        return plural(days, "day") + (" " + plural(hours, "hour") if hours else "")
+    if hours:
+        return plural(hours, "hour") + (" " + plural(minutes, "min") if minutes else "")
+    return plural(max(minutes, 1), "min")
+
+def format_miles(meters):
+    return f"{meters / METERS_PER_MILE:.1f} mi"
+
+def speed_mph(meters, seconds):
+    return round(meters / seconds * METERS_PER_SECOND_TO_MPH, 1) if seconds else 0.0
+
+def aggregate_leg(leg):
+    duration = leg["duration"]["value"]
+    # Only driving requests with a departure time get traffic estimates.
+    durationInTraffic = leg["duration_in_traffic"]["value"] if "duration_in_traffic" in leg else duration
+    return {
+        "start_address": leg.get("start_address"),
+        "end_address": leg.get("end_address"),
+        "duration": duration,
+        "duration_in_traffic": durationInTraffic,
+        "distance": leg["distance"]["value"],
+        "total_time": format_duration(durationInTraffic),
+        "distance_travelled": format_miles(leg["distance"]["value"])
+    }
+
+def aggregate_route(route, routeNumber):
+    legs = [aggregate_leg(leg) for leg in route["legs"]]
+    stepTable = StepTable.from_legs(route["legs"])
+    duration = sum(leg["duration"] for leg in legs)
+    durationInTraffic = sum(leg["duration_in_traffic"] for leg in legs)
+    distance = sum(leg["distance"] for leg in legs)
+
+    return {
+        "route": routeNumber,
+        "summary": route.get("summary", ""),
+        "duration": duration,
+        "duration_in_traffic": durationInTraffic,
+        "distance": distance,
+        "total_time": format_duration(durationInTraffic),
+        "distance_travelled": format_miles(distance),
+        "avg_speed": speed_mph(distance, durationInTraffic),
+        "waypoints": len(stepTable),
+        "modes_of_transportation": stepTable.modes(),
+        "walking_duration": stepTable.duration_by_mode().get("walking", 0),
+        "warnings": route.get("warnings", []),
+        "legs": legs
+    }
+
+def aggregate_routes(navigation_data):
+    return [aggregate_route(route, routeNumber) for routeNumber, route in enumerate(navigation_data["routes"])]
+
+def rank_routes(routes, rank_by="fastest"):
+    """Returns the routes best first by rank_by, and the best route number for every ranking."""
+    if rank_by not in RANKINGS:
+        raise ValueError(f"rank_by must be one of: {', '.join(RANKINGS)}.")
+
+    best = {name: min(routes, key=key)["route"] if routes else None for name, key in RANKINGS.items()}
+    ranked = [dict(route, rank=rank) for rank, route in enumerate(sorted(routes, key=RANKINGS[rank_by]), start=1)]
+    return ranked, best
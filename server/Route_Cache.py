@@ -0,0 +1,137 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+
+def cache_key(options, fields=None):
+    # Key order in the request options does not change the upstream request,
+    # so sort it away. Tuple values (avoid, waypoints) keep their order.
+    key = json.dumps(options, sort_keys=True, separators=(",", ":"))
+    # A payload trimmed down to a field set must never answer a request for
+    # the full payload.
+    return key if fields is None else fields + ":" + key
+
+class RouteCache:
+    """Bounded in-process cache of Directions payloads with per-entry TTL and LRU eviction.
+
+    Expired entries are kept for a further stale_ttl seconds (still subject to
+    eviction) so get_stale can fall back to them while upstream is down.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300, clock=time.monotonic, stale_ttl=0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key):
+        """Returns (payload, seconds until it expires) for a fresh entry, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, size, payload = entry
+            now = self._clock()
+            if expires_at <= now:
+                if expires_at + self.stale_ttl <= now:
+                    self._remove(key)
+                    self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload, expires_at - now
+
+    def expires_in(self, key):
+        """Seconds until key expires (negative once expired), without counting as a lookup."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] - self._clock() if entry is not None else None
+
+    def get_stale(self, key):
+        """Returns the payload for key even if it has expired, as long as it is within stale_ttl."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, size, payload = entry
+            if expires_at + self.stale_ttl <= self._clock():
+                return None
+
+            self.stale_hits += 1
+            return payload
+
+    def put(self, key, payload, size, ttl=None):
+        if size > self.max_bytes or self.max_entries <= 0:
+            return False
+
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, payload)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                return True
+        return False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale_hits": self.stale_hits
+            }
+
+    def _remove(self, key):
+        expires_at, size, payload = self._entries.pop(key)
+        self._bytes -= size
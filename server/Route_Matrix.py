@@ -0,0 +1,126 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+from Google_API_Handler import retrieve_navigation_payload, get_duration_value, get_duration_in_traffic_value, SUMMARY_FIELDS
+from NologyNav_Methods import build_request_options, check_geocoding, error_status, first_leg, departure_error, departure_option, BATCH_CONCURRENCY
+from Rate_Limiter import BATCH
+from Location_Canonicalizer import normalize_location
+
+load_dotenv()
+
+MATRIX_MAX_ELEMENTS = int(os.getenv("MATRIX_MAX_ELEMENTS", 100))
+
+# Travel times from every origin to every destination. Each distinct
+# origin/destination pair costs one Directions request; repeated pairs and
+# pairs that are the same place are answered without one. Every route is
+# asked for with a departure time (now, unless the request gives one), as
+# Google only reports durations in traffic for those.
+
+def parse_matrix_request(body):
+    if not isinstance(body, dict):
+        return None, ({"error": "Expected origins and destinations."}, 400)
+    origins, destinations = body.get("origins"), body.get("destinations")
+    for name, locations in (("origins", origins), ("destinations", destinations)):
+        if not isinstance(locations, list) or not locations or not all(isinstance(location, str) and location.strip() for location in locations):
+            return None, ({"error": f"{name} must be a non-empty list of locations."}, 400)
+    if len(origins) * len(destinations) > MATRIX_MAX_ELEMENTS:
+        return None, ({"error": f"A matrix may contain at most {MATRIX_MAX_ELEMENTS} origin/destination pairs."}, 413)
+
+    concurrency = body.get("concurrency")
+    if concurrency is not None:
+        if type(concurrency) != int or concurrency < 1:
+            return None, ({"error": "concurrency must be a positive integer."}, 400)
+        concurrency = min(concurrency, BATCH_CONCURRENCY)
+
+    departure = body.get("departure_time")
+    if departure is not None and departure_error(departure):
+        return None, ({"error": departure_error(departure)}, 400)
+
+    return (origins, destinations, concurrency, departure_option(departure)), None
+
+def plan_matrix(origins, destinations):
+    """Returns the distinct pairs to request, and for every cell the index of its pair (None for same-place cells)."""
+    pairs, pairIndex, cells = [], {}, {}
+    for i, origin in enumerate(origins):
+        for j, destination in enumerate(destinations):
+            key = (normalize_location(origin), normalize_location(destination))
+            if key[0] == key[1]:
+                cells[(i, j)] = None
+                continue
+            if key not in pairIndex:
+                pairIndex[key] = len(pairs)
+                pairs.append((origin, destination))
+            cells[(i, j)] = pairIndex[key]
+    return pairs, cells
+
+def matrix_element(origin, destination, use_cache=True, departure_time="now"):
+    locations = {"origin": origin, "destination": destination}
+    options = dict(build_request_options(locations), departure_time=departure_time)
+    try:
+        navigation_data = check_geocoding(locations, retrieve_navigation_payload(options, use_cache=use_cache, fields=SUMMARY_FIELDS, priority=BATCH))
+    except Exception as error:
+        return {"status": 502, "error": f"Unable to retrieve this route from Google: {error}"}
+
+    if "error" in navigation_data:
+        return {"status": error_status(navigation_data), "error": navigation_data["error"]}
+
+    durationInTraffic = get_duration_in_traffic_value(navigation_data)
+    return {
+        "status": 200,
+        "duration": get_duration_value(navigation_data),
+        "duration_in_traffic": durationInTraffic if durationInTraffic is not False else None,
+        "distance": first_leg(navigation_data)["distance"]["value"]
+    }
+
+SAME_PLACE = {"status": 200, "duration": 0, "duration_in_traffic": 0, "distance": 0}
+
+def iter_matrix(origins, destinations, concurrency=None, use_cache=True, plan=None, departure_time="now"):
+    """Yields (origin index, destination index, element) for every cell, as soon as its route is known."""
+    pairs, cells = plan or plan_matrix(origins, destinations)
+    cellsByPair = {}
+    for cell, pair in cells.items():
+        if pair is None:
+            yield cell[0], cell[1], SAME_PLACE
+        else:
+            cellsByPair.setdefault(pair, []).append(cell)
+
+    if not pairs:
+        return
+
+    workers = max(1, min(concurrency or BATCH_CONCURRENCY, len(pairs)))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(matrix_element, origin, destination, use_cache, departure_time): pair for pair, (origin, destination) in enumerate(pairs)}
+        for future in as_completed(futures):
+            for i, j in cellsByPair[futures[future]]:
+                yield i, j, future.result()
+    finally:
+        # A client that disconnects from a streamed matrix stops the
+        # requests that have not started yet.
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def build_matrix(origins, destinations, concurrency=None, use_cache=True, departure_time="now"):
+    rows, columns = len(origins), len(destinations)
+    plan = plan_matrix(origins, destinations)
+    matrix = {
+        "origins": origins,
+        "destinations": destinations,
+        "durations": [[None] * columns for _ in range(rows)],
+        "durations_in_traffic": [[None] * columns for _ in range(rows)],
+        "distances": [[None] * columns for _ in range(rows)],
+        "statuses": [[None] * columns for _ in range(rows)],
+        "errors": []
+    }
+    for i, j, element in iter_matrix(origins, destinations, concurrency, use_cache, plan, departure_time):
+        matrix["statuses"][i][j] = element["status"]
+        if element["status"] == 200:
+            matrix["durations"][i][j] = element["duration"]
+            matrix["durations_in_traffic"][i][j] = element["duration_in_traffic"]
+            matrix["distances"][i][j] = element["distance"]
+        else:
+            matrix["errors"].append({"origin": i, "destination": j, "error": element["error"]})
+    matrix["errors"].sort(key=lambda error: (error["origin"], error["destination"]))
+    matrix["distinct_routes"] = len(plan[0])
+    return matrix
@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import threading
+
+class RoutePrefetcher:
+    """Keeps the most requested routes in the cache before anyone asks for them again.
+
+    record() counts requests per cache key. Every interval seconds the top_n
+    keys are looked at, and any that are not cached or would expire before
+    the next look are handed to refresh(key, options, fields). Counts decay
+    each interval, so routes that stop being asked for drop out of the top.
+    """
+
+    def __init__(self, refresh, expires_in, top_n=50, interval=30.0, horizon=0.0, decay=0.9):
+        self.refresh = refresh
+        self.expires_in = expires_in
+        self.top_n = top_n
+        self.interval = interval
+        # Refresh anything expiring before the next run, plus this margin.
+        self.horizon = horizon
+        self.decay = decay
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.refreshes = 0
+
+    def __len__(self):
+        return len(self._routes)
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def record(self, key, options, fields=None):
+        with self._lock:
+            route = self._routes.get(key)
+            if route is None:
+                self._routes[key] = [1.0, options, fields]
+            else:
+                route[0] += 1
+
+    def hot_routes(self):
+        """Returns (key, options, fields, count) for the top_n routes, most requested first."""
+        with self._lock:
+            ranked = sorted(self._routes.items(), key=lambda item: item[1][0], reverse=True)[:self.top_n]
+            return [(key, options, fields, count) for key, (count, options, fields) in ranked]
+
+    def run_once(self):
+        """Refreshes the hot routes that are due and returns their keys."""
+        due = []
+        for key, options, fields, count in self.hot_routes():
+            expires_in = self.expires_in(key)
+            if expires_in is None or expires_in < self.interval + self.horizon:
+                self.refresh(key, options, fields)
+                due.append(key)
+        self.refreshes += len(due)
+        self._age()
+        return due
+
+    def _age(self):
+        # Only a bounded number of routes is tracked; the least requested go first.
+        with self._lock:
+            for route in self._routes.values():
+                route[0] *= self.decay
+            if len(self._routes) > self.top_n * 10:
+                ranked = sorted(self._routes.items(), key=lambda item: item[1][0], reverse=True)
+                self._routes = dict(ranked[:self.top_n * 10])
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="route-prefetcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as error:
+                print(f"Route prefetch failed: {error}", file=sys.stderr)
+
+    def save(self, path):
+        """Writes the hot routes to path, so the next run can prewarm them."""
+        routes = [{"options": options, "fields": fields, "count": round(count, 3)} for key, options, fields, count in self.hot_routes()]
+        temporaryPath = path + ".tmp"
+        with open(temporaryPath, "w") as statsFile:
+            json.dump({"routes": routes}, statsFile)
+        os.replace(temporaryPath, path)
+
+    def load(self, path, key_for, default_fields=None):
+        """Reads routes saved by save(), or a plain JSON list of request options, and counts them.
+
+        key_for(options, fields) gives the cache key for a route. Returns the
+        number of routes read.
+        """
+        with open(path) as routesFile:
+            routes = json.load(routesFile)
+        if isinstance(routes, dict):
+            routes = routes.get("routes", [])
+
+        with self._lock:
+            for route in routes:
+                if "options" in route:
+                    options, fields, count = route["options"], route.get("fields"), float(route.get("count", 1))
+                else:
+                    options, fields, count = route, default_fields, 1.0
+                # JSON has no tuples; multi-valued options (avoid, waypoints) are tuples.
+                options = {name: tuple(value) if isinstance(value, list) else value for name, value in options.items()}
+                key = key_for(options, fields)
+                current = self._routes.get(key)
+                self._routes[key] = [count + (current[0] if current else 0.0), options, fields]
+        return len(routes)
+
+    def is_cached(self, key):
+        expires_in = self.expires_in(key)
+        return expires_in is not None and expires_in > 0
+
+    def prewarm(self):
+        """Fetches every hot route that is not cached yet."""
+        due = [(key, options, fields) for key, options, fields, count in self.hot_routes() if not self.is_cached(key)]
+        for key, options, fields in due:
+            self.refresh(key, options, fields)
+        return [key for key, options, fields in due]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tracked": len(self._routes),
+                "top_n": self.top_n,
+                "interval": self.interval,
+                "refreshes": self.refreshes,
+                "running": self.running
+            }
@@ -0,0 +1,140 @@
+import math
+import threading
+from collections import OrderedDict
+
+from Location_Canonicalizer import normalize_location, parse_coordinates
+
+# Requests for places a few meters apart (two spellings of one address, or a
+# phone's GPS fix) can share a route. Places are matched by their
+# coordinates: given as "lat,lng", or learned from the start and end of
+# routes Google has already answered.
+
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_METERS / 180
+
+def haversine_meters(start, end):
+    lat1, lng1, lat2, lng2 = map(math.radians, (start[0], start[1], end[0], end[1]))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+class LocationMemo:
+    """Where Google placed each location it has geocoded, and the place ID it found, least recently used first out."""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        # location -> [(lat, lng) or None, place ID or None]
+        self._places = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._places)
+
+    def learn(self, location, point=None, place_id=None):
+        """Remembers what Google found for location. Returns True if its place ID was not known yet."""
+        key = normalize_location(location)
+        if point is not None and isinstance(point, dict):
+            point = (point["lat"], point["lng"])
+        with self._lock:
+            place = self._places.get(key)
+            if place is None:
+                place = self._places[key] = [None, None]
+                while len(self._places) > self.max_entries:
+                    self._places.popitem(last=False)
+            else:
+                self._places.move_to_end(key)
+            newPlaceId = place_id is not None and place[1] != place_id
+            place[0] = tuple(point) if point is not None else place[0]
+            place[1] = place_id or place[1]
+            return newPlaceId
+
+    def _lookup(self, location, field):
+        key = normalize_location(location)
+        with self._lock:
+            place = self._places.get(key)
+            if place is None:
+                return None
+            self._places.move_to_end(key)
+            return place[field]
+
+    def get(self, location):
+        point = parse_coordinates(location)
+        if point is not None:
+            return point
+        return self._lookup(location, 0)
+
+    def place_id(self, location):
+        return self._lookup(location, 1)
+
+class ProximityIndex:
+    """Routes indexed on a grid by where they start, to find one starting and ending within radius meters of a request.
+
+    Grid cells are radius meters tall, and radius meters wide at the
+    equator, so a match can only be in the start's cell or the cells around
+    it (more of them across, away from the equator, where a degree of
+    longitude gets shorter). Each lookup looks at those few cells only, however
+    many routes are indexed. Routes are grouped (e.g. by the fields kept in
+    the cached payload) and only match within their group.
+    """
+
+    def __init__(self, radius, max_routes=500000):
+        self.radius = radius
+        self.max_routes = max_routes
+        self._cell_degrees = radius / METERS_PER_DEGREE
+        # key -> (group, cell, start, end), oldest first.
+        self._routes = OrderedDict()
+        # (group, cell) -> set of keys
+        self._cells = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._routes)
+
+    def _cell(self, point):
+        return math.floor(point[0] / self._cell_degrees), math.floor(point[1] / self._cell_degrees)
+
+    def add(self, group, key, start, end):
+        cell = self._cell(start)
+        with self._lock:
+            self._remove(key)
+            self._routes[key] = (group, cell, tuple(start), tuple(end))
+            self._cells.setdefault((group, cell), set()).add(key)
+            while len(self._routes) > self.max_routes:
+                self._remove(next(iter(self._routes)))
+
+    def discard(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        route = self._routes.pop(key, None)
+        if route is None:
+            return
+        group, cell = route[0], route[1]
+        keys = self._cells.get((group, cell))
+        keys.discard(key)
+        if not keys:
+            del self._cells[(group, cell)]
+
+    def nearby(self, group, start, end):
+        """Keys of the routes in group starting and ending within radius of start and end, closest first."""
+        row, column = self._cell(start)
+        # Cells are narrower in meters away from the equator, so look further across.
+        shrink = math.cos(math.radians(min(89.0, abs(start[0]) + self._cell_degrees)))
+        across = math.ceil(1 / shrink)
+        candidates = []
+        with self._lock:
+            for cellRow in range(row - 1, row + 2):
+                for cellColumn in range(column - across, column + across + 1):
+                    for key in self._cells.get((group, (cellRow, cellColumn)), ()):
+                        candidates.append((key, self._routes[key]))
+
+        matches = []
+        for key, (routeGroup, cell, routeStart, routeEnd) in candidates:
+            startDistance = haversine_meters(start, routeStart)
+            if startDistance > self.radius:
+                continue
+            endDistance = haversine_meters(end, routeEnd)
+            if endDistance <= self.radius:
+                matches.append((startDistance + endDistance, key))
+        matches.sort()
+        return [key for distance, key in matches]
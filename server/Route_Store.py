@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import argparse
+import threading
+
+class RouteStore:
+    """Directions payloads kept in a local SQLite file so they survive restarts and are shared between worker processes."""
+
+    def __init__(self, path, ttl=3600, compression_level=6, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.compression_level = compression_level
+        self._clock = clock
+        self._local = threading.local()
+
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS routes ("
+                "key TEXT PRIMARY KEY, payload BLOB NOT NULL, size INTEGER NOT NULL, "
+                "stored_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS routes_expires_at ON routes (expires_at)")
+
+    def _connection(self):
+        # sqlite3 connections must not cross threads or a fork, so keep one per
+        # thread and reopen it in a forked child.
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            # WAL lets any number of processes read while one writes.
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key, allow_expired=False):
+        entry = self.get_entry(key, allow_expired)
+        return entry[0] if entry else None
+
+    def get_entry(self, key, allow_expired=False):
+        row = self._connection().execute("SELECT payload, expires_at FROM routes WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        payloadBlob, expires_at = row
+        if expires_at <= self._clock() and not allow_expired:
+            return None
+
+        return json.loads(zlib.decompress(payloadBlob)), expires_at
+
+    def put(self, key, payload, ttl=None):
+        raw = json.dumps(payload, separators=(",", ":")).encode("UTF-8")
+        now = self._clock()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+
+        self._connection().execute(
+            "INSERT OR REPLACE INTO routes (key, payload, size, stored_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (key, zlib.compress(raw, self.compression_level), len(raw), now, expires_at)
+        )
+        return expires_at
+
+    def delete(self, key):
+        return self._connection().execute("DELETE FROM routes WHERE key = ?", (key,)).rowcount > 0
+
+    def purge(self, expired_only=True):
+        if expired_only:
+            cursor = self._connection().execute("DELETE FROM routes WHERE expires_at <= ?", (self._clock(),))
+        else:
+            cursor = self._connection().execute("DELETE FROM routes")
+        return cursor.rowcount
+
+    def compact(self):
+        purged = self.purge()
+        connection = self._connection()
+        connection.execute("VACUUM")
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return purged
+
+    def entries(self, limit=100):
+        rows = self._connection().execute(
+            "SELECT key, size, length(payload), stored_at, expires_at FROM routes ORDER BY stored_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        now = self._clock()
+        return [{
+            "key": key,
+            "size": size,
+            "stored_size": storedSize,
+            "stored_at": stored_at,
+            "expires_in": round(expires_at - now, 1)
+        } for key, size, storedSize, stored_at, expires_at in rows]
+
+    def stats(self):
+        now = self._clock()
+        count, expired, size, storedSize = self._connection().execute(
+            "SELECT count(*), coalesce(sum(expires_at <= ?), 0), coalesce(sum(size), 0), coalesce(sum(length(payload)), 0) FROM routes", (now,)
+        ).fetchone()
+        return {
+            "path": self.path,
+            "entries": count,
+            "expired": expired,
+            "bytes": size,
+            "stored_bytes": storedSize,
+            "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        }
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and maintain the persistent NologyNav route store.")
+    parser.add_argument("--path", default=os.getenv("ROUTE_STORE_PATH"), help="SQLite file (defaults to $ROUTE_STORE_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="show entry counts and sizes")
+    listCommand = commands.add_parser("list", help="list the most recently stored routes")
+    listCommand.add_argument("--limit", type=int, default=20)
+    showCommand = commands.add_parser("show", help="print one stored payload")
+    showCommand.add_argument("key")
+    purgeCommand = commands.add_parser("purge", help="delete expired routes")
+    purgeCommand.add_argument("--all", action="store_true", help="delete every route, not only expired ones")
+    commands.add_parser("compact", help="delete expired routes and reclaim file space")
+    args = parser.parse_args(argv)
+
+    if not args.path:
+        parser.error("no store given; pass --path or set ROUTE_STORE_PATH")
+
+    store = RouteStore(args.path)
+    if args.command == "stats":
+        output = store.stats()
+    elif args.command == "list":
+        output = store.entries(args.limit)
+    elif args.command == "show":
+        output = store.get(args.key, allow_expired=True)
+        if output is None:
+            print(f"No route stored under {args.key}", file=sys.stderr)
+            return 1
+    elif args.command == "purge":
+        output = {"purged": store.purge(expired_only=not args.all)}
+    else:
+        output = {"purged": store.compact(), "file_bytes": store.stats()["file_bytes"]}
+
+    print(json.dumps(output, indent=4))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key share its outcome."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+
+        self.leaders = 0
+        self.coalesced = 0
+
+    @property
+    def in_flight(self):
+        return len(self._calls) + len(self._async_calls)
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+        return call.result
+
+    async def do_async(self, key, coroutine_fn):
+        # Tasks belong to one event loop, so calls are only shared between
+        # coroutines running on the same loop.
+        loop = asyncio.get_running_loop()
+        callKey = (loop, key)
+
+        task = self._async_calls.get(callKey)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # The call runs as its own task and every caller, the first one
+            # included, waits on it through a shield: a caller that is
+            # cancelled (e.g. its client went away) stops waiting without
+            # cancelling the call for everyone else.
+            task = loop.create_task(coroutine_fn())
+            self._async_calls[callKey] = task
+            self.leaders += 1
+            task.add_done_callback(lambda done: self._finish_async(callKey, done))
+
+        return await asyncio.shield(task)
+
+    def _finish_async(self, callKey, task):
+        del self._async_calls[callKey]
+        # Everyone waiting may have been cancelled; mark the exception as
+        # seen to avoid "exception was never retrieved" noise.
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": self.in_flight
+        }
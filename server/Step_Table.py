@@ -0,0 +1,63 @@
+import numpy as np
+
+NO_VALUE = -1
+
+class StepTable:
+    """The steps of a route as parallel arrays, one entry per step.
+
+    String columns (travel mode, maneuver) are stored as integer codes into
+    a tuple of the distinct values, so aggregations are array operations
+    rather than loops over step dicts.
+    """
+    __slots__ = ("travel_mode", "travel_modes", "maneuver", "maneuvers", "duration", "distance")
+
+    def __init__(self, steps):
+        # One pass over the step dicts fills every column.
+        modes, maneuvers = {}, {}
+        travelMode, maneuver, duration, distance = [], [], [], []
+        for step in steps:
+            travelMode.append(modes.setdefault(step["travel_mode"].lower(), len(modes)))
+            stepManeuver = step.get("maneuver")
+            maneuver.append(maneuvers.setdefault(stepManeuver.lower(), len(maneuvers)) if stepManeuver else NO_VALUE)
+            duration.append(step["duration"]["value"])
+            distance.append(step["distance"]["value"])
+
+        # Codes are numbered in order of first appearance.
+        self.travel_modes, self.travel_mode = tuple(modes), np.array(travelMode, dtype=np.int32)
+        self.maneuvers, self.maneuver = tuple(maneuvers), np.array(maneuver, dtype=np.int32)
+        self.duration = np.array(duration, dtype=np.int64)
+        self.distance = np.array(distance, dtype=np.int64)
+
+    @classmethod
+    def from_legs(cls, legs):
+        # Every step of every leg of the route.
+        return cls([step for leg in legs for step in leg["steps"]])
+
+    def __len__(self):
+        return len(self.duration)
+
+    def duration_by_mode(self):
+        totals = np.bincount(self.travel_mode, weights=self.duration, minlength=len(self.travel_modes))
+        return {mode: int(total) for mode, total in zip(self.travel_modes, totals)}
+
+    def distance_by_mode(self):
+        totals = np.bincount(self.travel_mode, weights=self.distance, minlength=len(self.travel_modes))
+        return {mode: int(total) for mode, total in zip(self.travel_modes, totals)}
+
+    def modes(self):
+        """Travel modes and ferry maneuvers in the order they first appear."""
+        modeSteps = first_occurrences(self.travel_mode, len(self.travel_modes))
+        ferryCodes = np.array([code for code, maneuver in enumerate(self.maneuvers) if "ferry" in maneuver], dtype=np.int32)
+        maneuverSteps = first_occurrences(self.maneuver, len(self.maneuvers))[ferryCodes]
+
+        # Within a step, its travel mode comes before its maneuver.
+        events = [(step, 0, mode) for step, mode in zip(modeSteps.tolist(), self.travel_modes)]
+        events += [(step, 1, self.maneuvers[code]) for step, code in zip(maneuverSteps.tolist(), ferryCodes.tolist())]
+        return [name for step, kind, name in sorted(events)]
+
+def first_occurrences(codes, count):
+    # Index of the first step holding each code.
+    first = np.full(count, len(codes), dtype=np.int64)
+    present = codes != NO_VALUE
+    np.minimum.at(first, codes[present], np.flatnonzero(present))
+    return first
@@ -0,0 +1,226 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import inspect
+import threading
+import functools
+import contextvars
+import collections
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Share of requests traced. A caller's traceparent marked as sampled is
+# always traced, so a trace started upstream is never cut short here.
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 2048))
+# "{pid}" in the path is replaced by the ID of the process writing it, so
+# pre-forked workers do not rotate each other's files.
+TRACE_PATH = os.getenv("TRACE_PATH", "")
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", 10 * 1024 * 1024))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", 3))
+
+# https://www.w3.org/TR/trace-context/#traceparent-header
+TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+TRACE_ID = re.compile(r"^[0-9A-Za-z_-]{1,64}$")
+
+# The span code running now belongs to; None when the request is not traced.
+_current = contextvars.ContextVar("nologynav_span", default=None)
+
+class SpanFile:
+    """Appends finished spans to path as JSON lines, rotating it to path.1, path.2, ... once it reaches max_bytes.
+
+    "{pid}" in path is replaced by the ID of the writing process, worked out
+    on its first write, so a process forked after the file was set up
+    writes its own file.
+    """
+
+    def __init__(self, path, max_bytes=TRACE_MAX_BYTES, backups=TRACE_BACKUPS):
+        self.path_template = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.reset()
+
+    def reset(self):
+        """Forgets the file (and lock) inherited from the parent process; the next write opens this process's own."""
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._pid = os.getpid()
+        self.path = self.path_template.replace("{pid}", str(self._pid))
+
+    def write(self, span):
+        line = json.dumps(span, separators=(",", ":")) + "\n"
+        if self._pid != os.getpid():
+            self.reset()
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a")
+                self._size = self._file.tell()
+            if self._size and self._size + len(line) > self.max_bytes:
+                self._rotate()
+            self._file.write(line)
+            # Flushed per line, so the file can be tailed while the server runs.
+            self._file.flush()
+            self._size += len(line)
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a")
+        self._size = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+SPANS = collections.deque(maxlen=BUFFER_SIZE)
+SPAN_FILE = SpanFile(TRACE_PATH) if TRACE_PATH else None
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_time", "started", "token")
+
+    def __init__(self, trace_id, parent_id, name, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+
+    def __enter__(self):
+        self.token = _current.set(self)
+        self.start_time = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current.reset(self.token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        export(self.to_dict(time.perf_counter() - self.started))
+        return False
+
+    def set(self, name, value):
+        self.attributes[name] = value
+
+    def to_dict(self, seconds):
+        span = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start_time, 6),
+            "duration_ms": round(seconds * 1000, 3)
+        }
+        if self.attributes:
+            span["attributes"] = self.attributes
+        return span
+
+class _NoSpan:
+    """Stands in for a span when the request is not traced, so callers need no checks."""
+    __slots__ = ()
+    trace_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, name, value):
+        pass
+
+NO_SPAN = _NoSpan()
+
+def new_trace_id():
+    return os.urandom(16).hex()
+
+def new_span_id():
+    return os.urandom(8).hex()
+
+def start_trace(name, traceparent=None, trace_id=None):
+    """Returns the root span for a request, or NO_SPAN when it is not sampled.
+
+    The trace ID comes from a W3C traceparent header, then an X-Trace-Id
+    header, and is made up otherwise.
+    """
+    parent_id = None
+    sampled = False
+    match = TRACEPARENT.match(traceparent.strip().lower()) if traceparent else None
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        sampled = int(flags, 16) & 1 == 1
+    elif not (trace_id and TRACE_ID.match(trace_id)):
+        trace_id = None
+
+    if not sampled and (SAMPLE_RATE <= 0 or random.random() >= SAMPLE_RATE):
+        return NO_SPAN
+    return Span(trace_id or new_trace_id(), parent_id, name)
+
+def span(name, **attributes):
+    """A child of the current span, or NO_SPAN outside a traced request."""
+    parent = _current.get()
+    if parent is None:
+        return NO_SPAN
+    return Span(parent.trace_id, parent.span_id, name, attributes)
+
+def current_span():
+    return _current.get() or NO_SPAN
+
+def record_span(name, seconds, **attributes):
+    """Records a span that has just finished after taking seconds, e.g. a timed upstream call."""
+    parent = _current.get()
+    if parent is None:
+        return
+    child = Span(parent.trace_id, parent.span_id, name, attributes)
+    child.start_time = time.time() - seconds
+    export(child.to_dict(seconds))
+
+def traced(function):
+    """Runs every call of function in a span named after it."""
+    name = function.__name__
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def traced_coroutine(*args, **kwargs):
+            with span(name):
+                return await function(*args, **kwargs)
+        return traced_coroutine
+
+    @functools.wraps(function)
+    def traced_function(*args, **kwargs):
+        if _current.get() is None:
+            return function(*args, **kwargs)
+        with span(name):
+            return function(*args, **kwargs)
+    return traced_function
+
+def export(span):
+    SPANS.append(span)
+    if SPAN_FILE is not None:
+        try:
+            SPAN_FILE.write(span)
+        except OSError as error:
+            print(f"Unable to write trace span: {error}", file=sys.stderr)
+
+def reset_after_fork():
+    """Gives a forked worker its own span file and an empty span buffer."""
+    SPANS.clear()
+    if SPAN_FILE is not None:
+        SPAN_FILE.reset()
+
+def recent_spans(trace_id=None, limit=None):
+    """Spans in the ring buffer, oldest first, optionally only those of one trace."""
+    spans = [span for span in list(SPANS) if trace_id is None or span["trace_id"] == trace_id]
+    return spans[-limit:] if limit else spans
@@ -0,0 +1,144 @@
+import os
+import sys
+import math
+import time
+import sqlite3
+import threading
+
+from Location_Canonicalizer import normalize_location, option_values
+
+# What Google reports for a route changes with the time of day and the day of
+# the week (duration_in_traffic most of all), so observations are kept per
+# hour of the week, in the server's local time.
+
+def hour_of_week(when):
+    moment = time.localtime(when)
+    return moment.tm_wday * 24 + moment.tm_hour
+
+def route_key(options):
+    """The route a travel time belongs to: where from and to, and how, but not when or in what form it was asked for."""
+    places = [options["origin"], *option_values(options.get("waypoints", ())), options["destination"]]
+    return "|".join(normalize_location(place) for place in places) + ":" + options.get("mode", "driving") + ":" + ",".join(option_values(options.get("avoid", ())))
+
+class TravelTimeHistory:
+    """Running mean and variance (Welford's method) of observed travel times, per route, metric and hour of the week.
+
+    estimate() only answers for a bucket with at least min_samples
+    observations, updated within max_age seconds, whose standard deviation is
+    at most max_spread of its mean. With a path, every observation is also
+    written to a SQLite file, so the history survives restarts and every
+    worker adds to it; it is read back into memory when opened.
+    """
+
+    def __init__(self, path=None, min_samples=5, max_spread=0.15, max_age=28 * 86400, max_buckets=200000, clock=time.time):
+        self.path = path
+        self.min_samples = min_samples
+        self.max_spread = max_spread
+        self.max_age = max_age
+        self.max_buckets = max_buckets
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # (route, metric, hour of week) -> [count, mean, m2, updated_at]
+        self._buckets = {}
+
+        if path:
+            connection = self._connection()
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS travel_times ("
+                    "route TEXT NOT NULL, metric TEXT NOT NULL, hour INTEGER NOT NULL, "
+                    "count INTEGER NOT NULL, mean REAL NOT NULL, m2 REAL NOT NULL, updated_at REAL NOT NULL, "
+                    "PRIMARY KEY (route, metric, hour))"
+                )
+            self.load()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _connection(self):
+        # Same rules as Route_Store: one connection per thread, reopened after a fork.
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def load(self):
+        rows = self._connection().execute("SELECT route, metric, hour, count, mean, m2, updated_at FROM travel_times").fetchall()
+        with self._lock:
+            for route, metric, hour, count, mean, m2, updated_at in rows:
+                self._buckets[(route, metric, hour)] = [count, mean, m2, updated_at]
+        return len(rows)
+
+    def observe(self, route, metric, seconds, when=None):
+        now = self._clock()
+        key = (route, metric, hour_of_week(now if when is None else when))
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_buckets:
+                    self._evict()
+                bucket = self._buckets[key] = [0, 0.0, 0.0, now]
+            bucket[0] += 1
+            delta = seconds - bucket[1]
+            bucket[1] += delta / bucket[0]
+            bucket[2] += delta * (seconds - bucket[1])
+            bucket[3] = now
+
+        if self.path:
+            try:
+                self._write(key, seconds, now)
+            except sqlite3.Error as error:
+                print(f"Unable to record travel time: {error}", file=sys.stderr)
+
+    def _write(self, key, seconds, now):
+        # The same update as observe(), done by SQLite so that workers writing
+        # the same bucket add to each other's observations. Every expression on
+        # the right reads the row as it was before the update.
+        self._connection().execute(
+            "INSERT INTO travel_times (route, metric, hour, count, mean, m2, updated_at) VALUES (?, ?, ?, 1, ?, 0, ?) "
+            "ON CONFLICT (route, metric, hour) DO UPDATE SET "
+            "count = count + 1, "
+            "mean = mean + (excluded.mean - mean) / (count + 1), "
+            "m2 = m2 + (excluded.mean - mean) * (excluded.mean - mean - (excluded.mean - mean) / (count + 1)), "
+            "updated_at = excluded.updated_at",
+            (*key, seconds, now)
+        )
+
+    def _evict(self):
+        # Drops the tenth of the buckets that have gone longest without an observation.
+        ranked = sorted(self._buckets.items(), key=lambda item: item[1][3])
+        for key, bucket in ranked[:max(1, len(ranked) // 10)]:
+            del self._buckets[key]
+
+    def bucket_stats(self, route, metric, when=None):
+        """Returns (count, mean, standard deviation, updated_at) for the bucket covering when, or None."""
+        with self._lock:
+            bucket = self._buckets.get((route, metric, hour_of_week(self._clock() if when is None else when)))
+            if bucket is None:
+                return None
+            count, mean, m2, updated_at = bucket
+        return count, mean, math.sqrt(m2 / (count - 1)) if count > 1 else 0.0, updated_at
+
+    def estimate(self, route, metric, when=None):
+        """The expected travel time for route when travelling at when, or None when the history is not confident enough."""
+        stats = self.bucket_stats(route, metric, when)
+        if stats is None or not self.confident(*stats):
+            return None
+
+        count, mean, stddev, updated_at = stats
+        return {"duration": round(mean), "stddev": round(stddev, 1), "samples": count}
+
+    def confident(self, count, mean, stddev, updated_at):
+        return count >= self.min_samples and updated_at >= self._clock() - self.max_age and mean > 0 and stddev <= self.max_spread * mean
+
+    def stats(self):
+        with self._lock:
+            return {
+                "buckets": len(self._buckets),
+                "routes": len({key[0] for key in self._buckets})
+            }
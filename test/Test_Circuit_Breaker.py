@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import time
+import pytest
+import logging
+
+import Google_API_Handler
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Circuit_Breaker import CircuitBreaker, CircuitOpen, CLOSED, HALF_OPEN, OPEN
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+LOCATIONS = {"origin": "London", "destination": "Paris"}
+
+def open_circuit():
+    circuit = CircuitBreaker(min_calls=1, open_seconds=60)
+    circuit.record(False, 0.1)
+    return circuit
+
+class TestCircuitBreaker:
+    def test_opens_on_failure_ratio(self, clock):
+        circuit = CircuitBreaker(failure_ratio=0.5, min_calls=4, open_seconds=10, clock=clock)
+
+        logger.info("Verifying the circuit stays closed until enough calls have failed")
+        for succeeded in (True, False, True):
+            circuit.allow()
+            circuit.record(succeeded, 0.1)
+        assert circuit.state == CLOSED
+
+        circuit.allow()
+        circuit.record(False, 0.1)
+        assert circuit.state == OPEN
+
+        logger.info("Verifying calls are refused while the circuit is open")
+        clock.now += 4
+        with pytest.raises(CircuitOpen) as error:
+            circuit.allow()
+        assert error.value.retry_after == pytest.approx(6)
+
+    def test_slow_calls_count_as_failures(self, clock):
+        circuit = CircuitBreaker(slow_call_seconds=2, min_calls=2, clock=clock)
+
+        logger.info("Verifying successful but slow calls open the circuit")
+        circuit.record(True, 2.5)
+        circuit.record(True, 3)
+        assert circuit.state == OPEN
+
+    @pytest.mark.parametrize("input, output", [
+        (True, CLOSED),
+        (False, OPEN)
+    ])
+    def test_half_open_probe(self, input, output, clock):
+        circuit = CircuitBreaker(min_calls=1, open_seconds=10, clock=clock)
+        circuit.record(False, 0.1)
+
+        logger.info("Verifying one probe is let through once the circuit has been open long enough")
+        clock.now += 10
+        assert circuit.state == HALF_OPEN
+        circuit.allow()
+        with pytest.raises(CircuitOpen):
+            circuit.allow()
+
+        circuit.record(input, 0.1)
+        assert circuit.state == output
+
+    def test_stale_route_while_open(self, monkeypatch, session, clock):
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache(ttl=300, stale_ttl=3600, clock=clock))
+        client = create_app().test_client()
+
+        logger.info("Caching a route, then letting it expire while the circuit is open")
+        assert client.post('/get_summary', json = LOCATIONS).status_code == 200
+        clock.now += 301
+        monkeypatch.setattr(Google_API_Handler, "CIRCUIT", open_circuit())
+
+        response = client.post('/get_summary', json = LOCATIONS)
+        assert response.status_code == 200
+        responseData = json.loads(response.data)
+        assert responseData["stale"] == True
+        assert responseData["origin"] == "London"
+        assert session.calls == 1
+
+        logger.info("Verifying the cached payload itself was not marked stale")
+        assert "_stale" not in Google_API_Handler.ROUTE_CACHE.get_stale(Google_API_Handler.canonical_key(LOCATIONS, Google_API_Handler.SUMMARY_FIELDS))
+
+    def test_stale_route_on_server_errors(self, monkeypatch, session, clock):
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache(ttl=300, stale_ttl=3600, clock=clock))
+        monkeypatch.setattr(Google_API_Handler, "CIRCUIT", CircuitBreaker())
+        monkeypatch.setattr(Google_API_Handler, "HTTP_MAX_RETRIES", 1)
+        monkeypatch.setattr(Google_API_Handler.time, "sleep", lambda delay: None)
+        client = create_app().test_client()
+
+        logger.info("Caching a route, then letting it expire while Google answers with error pages")
+        assert client.post('/get_summary', json = LOCATIONS).status_code == 200
+        clock.now += 301
+        session.status_code, session.content = 500, b"<html><body>Server Error</body></html>"
+
+        response = client.post('/get_summary', json = LOCATIONS)
+        assert response.status_code == 200
+        assert json.loads(response.data)["stale"] == True
+        assert session.calls == 3
+
+        logger.info("Verifying the same outage with nothing cached asks the caller to retry")
+        response = client.post('/get_summary', json = {"origin": "London", "destination": "Calais"})
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) == Google_API_Handler.HTTP_BACKOFF_MAX
+
+    def test_release_unused_probe(self, clock):
+        circuit = CircuitBreaker(min_calls=1, open_seconds=10, clock=clock)
+        circuit.record(False, 0.1)
+        clock.now += 10
+
+        logger.info("Verifying a probe that was never made can be given back")
+        circuit.allow()
+        circuit.release()
+        circuit.allow()
+        with pytest.raises(CircuitOpen):
+            circuit.allow()
+
+    def test_open_without_stale_route(self, monkeypatch, session):
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        monkeypatch.setattr(Google_API_Handler, "CIRCUIT", open_circuit())
+        client = create_app().test_client()
+
+        logger.info("Verifying an open circuit with nothing cached is answered with 503 straight away")
+        response = client.post('/get_summary', json = LOCATIONS)
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) == 60
+        assert session.calls == 0
+
+    def test_refresh_ahead(self, monkeypatch, session, clock):
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache(ttl=300, clock=clock))
+        monkeypatch.setattr(Google_API_Handler, "REFRESH_AHEAD", 30)
+
+        logger.info("Verifying a route near expiry is served from cache and refreshed in the background")
+        first = Google_API_Handler.retrieve_navigation_payload(LOCATIONS)
+        session.called.clear()
+        clock.now += 280
+        second = Google_API_Handler.retrieve_navigation_payload(LOCATIONS)
+        assert second is first
+
+        assert session.called.wait(5)
+        for _ in range(500):
+            if Google_API_Handler.ROUTE_CACHE.get_entry(Google_API_Handler.canonical_key(LOCATIONS))[1] == pytest.approx(300):
+                break
+            time.sleep(0.01)
+        assert session.calls == 2
+        assert Google_API_Handler.ROUTE_CACHE.get_entry(Google_API_Handler.canonical_key(LOCATIONS))[1] == pytest.approx(300)
@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import pytest
+import logging
+import threading
+from werkzeug.serving import make_server
+
+import Google_API_Handler
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Directions_Stub_Server import create_stub_app, Latency, DIRECTIONS_PATH
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class TestDirectionsStubServer:
+    @pytest.mark.parametrize("input, output", [
+        ({"origin": "London", "destination": "Paris"}, "London, UK"),
+        ({"origin": "london, uk", "destination": "PARIS,  France"}, "London, UK"),
+        ({"origin": "Disneyland", "destination": "Seaworld"}, "1313 Disneyland Dr, Anaheim, CA 92802, USA"),
+        ({"origin": "Disneyland", "destination": "UniversalStudios"}, "1313 Disneyland Dr, Anaheim, CA 92802, USA")
+    ])
+    def test_replays_recorded_routes(self, input, output):
+        client = create_stub_app().test_client()
+
+        logger.info("Requesting stubbed route - Origin: " + input["origin"] + " / Destination: " + input["destination"])
+        response = client.post(DIRECTIONS_PATH, query_string=input)
+
+        assert response.status_code == 200
+        assert response.get_json()["routes"][0]["legs"][0]["start_address"] == output
+
+    def test_unknown_route(self):
+        client = create_stub_app().test_client()
+
+        logger.info("Verifying unknown locations get a geocoding failure")
+        response = client.post(DIRECTIONS_PATH, query_string={"origin": "London", "destination": "Very Bad Location Data"})
+        assert response.get_json()["status"] == "NOT_FOUND"
+
+        logger.info("Verifying a fallback route can be served instead")
+        client = create_stub_app(fallback_route="London_to_Paris").test_client()
+        response = client.post(DIRECTIONS_PATH, query_string={"origin": "Anywhere", "destination": "Else"})
+        assert response.get_json()["status"] == "OK"
+
+    @pytest.mark.parametrize("input, output", [
+        ({"error_rate": 1.0}, (500, None)),
+        ({"over_query_limit_rate": 1.0}, (200, "OVER_QUERY_LIMIT")),
+        ({}, (200, "OK"))
+    ])
+    def test_injected_failures(self, input, output):
+        client = create_stub_app(seed=1, **input).test_client()
+
+        logger.info("Verifying injected failure settings: " + json.dumps(input))
+        response = client.post(DIRECTIONS_PATH, query_string={"origin": "London", "destination": "Paris"})
+        assert response.status_code == output[0]
+        if output[1]:
+            assert response.get_json()["status"] == output[1]
+
+    def test_runtime_config(self):
+        client = create_stub_app().test_client()
+
+        logger.info("Changing stub behaviour between load test phases")
+        response = client.post("/stub/config", json={"latency": "fixed:1", "error_rate": 1.0})
+        assert json.loads(response.data)["latency"] == "fixed:1"
+        assert client.post(DIRECTIONS_PATH).status_code == 500
+        assert client.post("/stub/config", json={"latency": "sometimes"}).status_code == 400
+        assert json.loads(client.get("/stub/stats").data)["errors"] == 1
+
+    @pytest.mark.parametrize("input, output", [
+        ("none", (0, 0)),
+        ("fixed:50", (50, 50)),
+        ("uniform:20:200", (20, 200)),
+        ("normal:100:30", (0, 1000)),
+        ("lognormal:150:0.4", (0, 10000))
+    ])
+    def test_latency(self, input, output):
+        latency = Latency(input)
+
+        logger.info("Verifying latency samples for " + input + " stay in range")
+        for _ in range(100):
+            assert output[0] <= latency.sample() <= output[1]
+
+    @pytest.mark.parametrize("input", ["fixed", "uniform:1", "gamma:1:2"])
+    def test_bad_latency(self, input):
+        with pytest.raises(ValueError):
+            Latency(input)
+
+    def test_get_summary_against_stub(self, monkeypatch):
+        server = make_server("127.0.0.1", 0, create_stub_app(), threaded=True)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            monkeypatch.setattr(Google_API_Handler, "DIRECTIONS_URL", f"http://127.0.0.1:{server.server_port}{DIRECTIONS_PATH}")
+            monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+            client = create_app().test_client()
+
+            logger.info("Calling Flask Client Route: /get_summary backed by the stub server")
+            response = client.post('/get_summary', json = {"origin": "London", "destination": "Paris"})
+            assert response.status_code == 200
+            assert json.loads(response.data)["distance_travelled"] == "295.5 mi"
+
+            response = client.post('/get_summary', json = {"origin": "London", "destination": "Very Bad Location Data"})
+            assert response.status_code == 406
+        finally:
+            server.shutdown()
+            thread.join()
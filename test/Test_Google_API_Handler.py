@@ -13,23 +13,35 @@ load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
 
 from server import Google_API_Handler
+from conftest import FakeResponse, ScriptedSession
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+def html_response(status_code):
+    return FakeResponse(b"<html><body>Server Error</body></html>", status_code)
+
+@pytest.fixture(autouse=True)
+def upstream_guards(monkeypatch):
+    # The circuit and the rate limit are module state; a fresh pair per test
+    # keeps one test's failures from opening the circuit on the next.
+    monkeypatch.setattr(Google_API_Handler, "CIRCUIT", Google_API_Handler.CircuitBreaker())
+    if Google_API_Handler.RATE_LIMITER is not None:
+        monkeypatch.setattr(Google_API_Handler, "RATE_LIMITER", Google_API_Handler.RateLimiter(Google_API_Handler.UPSTREAM_QPS, Google_API_Handler.UPSTREAM_BURST))
+
 class TestGoogleApiHandler:
     @pytest.mark.parametrize("input, output", [
         ({"origin": "San Diego", 
         "destination": "Los Angeles"},
-        "https://maps.googleapis.com/maps/api/directions/json?origin=San Diego&destination=Los Angeles&key="+API_KEY),
+        "https://maps.googleapis.com/maps/api/directions/json?origin=San%20Diego&destination=Los%20Angeles&key="+API_KEY),
         ({"origin": "San Diego", 
         "destination": "Los Angeles",
         "mode": "walking"},
-        "https://maps.googleapis.com/maps/api/directions/json?origin=San Diego&destination=Los Angeles&mode=walking&key="+API_KEY),
+        "https://maps.googleapis.com/maps/api/directions/json?origin=San%20Diego&destination=Los%20Angeles&mode=walking&key="+API_KEY),
         ({"origin": "San Diego", 
         "destination": "Los Angeles",
         "avoid": ("ferry", "tolls")},
-        "https://maps.googleapis.com/maps/api/directions/json?origin=San Diego&destination=Los Angeles&avoid=ferry|tolls&key="+API_KEY)
+        "https://maps.googleapis.com/maps/api/directions/json?origin=San%20Diego&destination=Los%20Angeles&avoid=ferry%7Ctolls&key="+API_KEY)
         ])  
     def test_url_builder(self, input, output):
         logger.info("Sending input options to URL builder")
@@ -465,4 +477,91 @@ class TestGoogleApiHandler:
         
         logger.info("Checking route preferences for assertion")
         assert less_walking_result["walking_duration"] <= output["walking_duration"]
-        assert fewer_transfers_result["transit_duration"] != output["transit_duration"]
\ No newline at end of file
+        assert fewer_transfers_result["transit_duration"] != output["transit_duration"]
+
+    @pytest.mark.parametrize("input, output", [
+        ([FakeResponse({"status": "OK"})], {"status": "OK", "attempts": 1}),
+        ([FakeResponse({}, 503), FakeResponse({"status": "OK"})], {"status": "OK", "attempts": 2}),
+        ([FakeResponse({"status": "OVER_QUERY_LIMIT"}), FakeResponse({"status": "UNKNOWN_ERROR"}), FakeResponse({"status": "OK"})], {"status": "OK", "attempts": 3}),
+        ([Google_API_Handler.requests.ConnectionError(), FakeResponse({"status": "ZERO_RESULTS"})], {"status": "ZERO_RESULTS", "attempts": 2}),
+        ([FakeResponse({"status": "OVER_QUERY_LIMIT"})] * 4, {"status": "OVER_QUERY_LIMIT", "attempts": 4}),
+        ([FakeResponse({"status": "REQUEST_DENIED"})], {"status": "REQUEST_DENIED", "attempts": 1})
+    ])
+    def test_request_payload_retries(self, monkeypatch, input, output):
+        session = ScriptedSession(input)
+        delays = []
+        monkeypatch.setattr(Google_API_Handler, "get_session", lambda: session)
+        monkeypatch.setattr(Google_API_Handler, "HTTP_MAX_RETRIES", 3)
+        monkeypatch.setattr(Google_API_Handler.time, "sleep", delays.append)
+
+        logger.info("Requesting payload through a session that fails " + str(output["attempts"] - 1) + " times")
+        result, size = Google_API_Handler.request_payload("https://example.invalid/directions/json")
+
+        logger.info("Verifying the final status and number of attempts")
+        assert result["status"] == output["status"]
+        assert len(session.requests) == output["attempts"]
+        assert len(delays) == output["attempts"] - 1
+        assert all(call["timeout"] == (Google_API_Handler.HTTP_CONNECT_TIMEOUT, Google_API_Handler.HTTP_READ_TIMEOUT) for call in session.requests)
+
+    def test_request_payload_gives_up_on_connection_errors(self, monkeypatch):
+        session = ScriptedSession([Google_API_Handler.requests.Timeout()] * 3)
+        monkeypatch.setattr(Google_API_Handler, "get_session", lambda: session)
+        monkeypatch.setattr(Google_API_Handler, "HTTP_MAX_RETRIES", 2)
+        monkeypatch.setattr(Google_API_Handler.time, "sleep", lambda delay: None)
+
+        logger.info("Verifying the last connection error is raised once retries run out")
+        with pytest.raises(Google_API_Handler.requests.Timeout):
+            Google_API_Handler.request_payload("https://example.invalid/directions/json")
+        assert len(session.requests) == 3
+
+    @pytest.mark.parametrize("input, output", [
+        ([FakeResponse({}, 503)] * 3, "The Directions API answered 503."),
+        ([html_response(502), html_response(200), html_response(200)], "The Directions API response could not be read")
+    ])
+    def test_request_payload_upstream_failure(self, monkeypatch, input, output):
+        session = ScriptedSession(input)
+        monkeypatch.setattr(Google_API_Handler, "get_session", lambda: session)
+        monkeypatch.setattr(Google_API_Handler, "HTTP_MAX_RETRIES", 2)
+        monkeypatch.setattr(Google_API_Handler.time, "sleep", lambda delay: None)
+
+        logger.info("Verifying a 5xx or unreadable body after the last retry is answered as a failure to retry later")
+        result, size = Google_API_Handler.request_payload("https://example.invalid/directions/json")
+        assert result["status"] == "UNKNOWN_ERROR"
+        assert result["error_message"].startswith(output)
+        assert result["retry_after"] == Google_API_Handler.HTTP_BACKOFF_MAX
+        assert len(session.requests) == 3
+        assert Google_API_Handler.CIRCUIT.stats()["failures"] == 3
+
+    def test_request_payload_circuit_before_rate_limit(self, monkeypatch):
+        class CountingLimiter:
+            acquired = 0
+
+            def acquire(self, priority):
+                self.acquired += 1
+                return 0.0
+
+        limiter = CountingLimiter()
+        circuit = Google_API_Handler.CircuitBreaker(min_calls=1)
+        circuit.record(False, 0.1)
+        monkeypatch.setattr(Google_API_Handler, "RATE_LIMITER", limiter)
+        monkeypatch.setattr(Google_API_Handler, "CIRCUIT", circuit)
+
+        logger.info("Verifying an open circuit answers without waiting for or spending rate limit tokens")
+        result, size = Google_API_Handler.request_payload("https://example.invalid/directions/json")
+        assert result["status"] == "UNKNOWN_ERROR"
+        assert limiter.acquired == 0
+
+    @pytest.mark.parametrize("input", [0, 1, 2, 5, 10])
+    def test_backoff_delay(self, input):
+        logger.info("Verifying jittered backoff for attempt " + str(input) + " stays within its cap")
+        delay = Google_API_Handler.backoff_delay(input)
+        assert 0 <= delay <= min(Google_API_Handler.HTTP_BACKOFF_MAX, Google_API_Handler.HTTP_BACKOFF_BASE * 2 ** input)
+
+    def test_pool_stats(self):
+        logger.info("Verifying a single shared session is used for upstream requests")
+        assert Google_API_Handler.get_session() is Google_API_Handler.get_session()
+
+        stats = Google_API_Handler.get_pool_stats()
+        assert stats["pool_size"] == Google_API_Handler.HTTP_POOL_SIZE
+        assert type(stats["pools"]) == list
+        assert {"requests", "retries", "failures"} <= set(stats)
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import pytest
+import logging
+
+import Google_API_Handler
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Route_Proximity import LocationMemo
+from Location_Canonicalizer import LocationCanonicalizer, load_aliases
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+LONDON_PLACE_ID = "ChIJdd4hrwug2EcRmSrV3Vo6llI"
+PARIS_PLACE_ID = "ChIJD7fiBh9u5kcRYJSMaMOCCwQ"
+
+@pytest.fixture
+def session(session, monkeypatch):
+    monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+    monkeypatch.setattr(Google_API_Handler, "LOCATION_MEMO", LocationMemo())
+    return session
+
+class TestLocationCanonicalizer:
+    @pytest.mark.parametrize("input, output", [
+        (" London ", "london"),
+        ("LONDON,   UK", "london, uk"),
+        (" 51.5073 , -0.1277", "51.5073,-0.1277"),
+        ("place_id:" + LONDON_PLACE_ID, "place_id:" + LONDON_PLACE_ID),
+        ("nyc", "new york, ny")
+    ])
+    def test_canonical_location(self, input, output):
+        canonicalizer = LocationCanonicalizer({"NYC": "New York,  NY"})
+
+        logger.info("Verifying a location is written in its canonical form: " + input)
+        assert canonicalizer.canonical_location(input) == output
+
+    def test_canonical_options(self):
+        canonicalizer = LocationCanonicalizer()
+        memo = LocationMemo()
+        memo.learn("London", place_id=LONDON_PLACE_ID)
+        options = {"origin": "London ", "destination": "Paris", "waypoints": ["Calais", " LILLE"], "avoid": ("tolls", "Ferries", "tolls"), "mode": "Walking", "departure_time": "now"}
+
+        logger.info("Verifying every option is canonicalized, and known places are asked for by place ID")
+        assert canonicalizer.canonical_options(options, memo) == {
+            "origin": "place_id:" + LONDON_PLACE_ID,
+            "destination": "paris",
+            "waypoints": ("calais", "lille"),
+            "avoid": ("ferries", "tolls"),
+            "mode": "walking",
+            "departure_time": "now"
+        }
+        assert canonicalizer.canonical_options(options)["origin"] == "london"
+
+    @pytest.mark.parametrize("input, output", [
+        ({"origin": "London", "destination": "Paris", "avoid": ("Tolls")}, {"origin": "london", "destination": "paris", "avoid": ("tolls",)}),
+        ({"origin": "London", "destination": "Paris", "avoid": "tolls|ferries"}, {"origin": "london", "destination": "paris", "avoid": ("ferries", "tolls")}),
+        ({"origin": "London", "destination": "Paris", "waypoints": "place_id:" + PARIS_PLACE_ID}, {"origin": "london", "destination": "paris", "waypoints": ("place_id:" + PARIS_PLACE_ID,)}),
+        ({"origin": "London", "destination": "Paris", "waypoints": "Calais|Lille"}, {"origin": "london", "destination": "paris", "waypoints": ("calais", "lille")})
+    ])
+    def test_string_list_options(self, input, output):
+        logger.info("Verifying a list option given as a string is read as its values, not its characters: " + str(input))
+        assert LocationCanonicalizer().canonical_options(input) == output
+
+    def test_string_list_options_url(self, session):
+        logger.info("Verifying a string avoid and waypoint reach Google whole")
+        Google_API_Handler.retrieve_navigation_payload({"origin": "London", "destination": "Paris", "avoid": ("tolls"), "waypoints": "place_id:" + PARIS_PLACE_ID})
+        assert "&waypoints=place_id%3A" + PARIS_PLACE_ID + "&" in session.urls[0]
+        assert "&avoid=tolls&" in session.urls[0]
+
+    def test_string_waypoints_learned(self, session):
+        logger.info("Verifying place IDs are learned for a single waypoint given as a string")
+        Google_API_Handler.learn_locations("key", {"origin": "London", "waypoints": "Calais", "destination": "Paris"}, None, {
+            "status": "OK",
+            "geocoded_waypoints": [{"place_id": LONDON_PLACE_ID}, {"place_id": "calais-id"}, {"place_id": PARIS_PLACE_ID}],
+            "routes": [{"legs": [{}]}]
+        })
+        assert Google_API_Handler.LOCATION_MEMO.place_id("calais") == "calais-id"
+        assert Google_API_Handler.LOCATION_MEMO.place_id("c") is None
+
+    def test_load_aliases(self, tmp_path):
+        path = tmp_path / "aliases.json"
+        path.write_text(json.dumps({"The Big Smoke": "London"}))
+
+        logger.info("Verifying aliases are read from a JSON file")
+        assert LocationCanonicalizer(load_aliases(str(path))).canonical_location("the big smoke") == "london"
+
+    @pytest.mark.parametrize("input, output", [
+        ({"origin": "Fish & Chips, London", "destination": "Paris"}, "origin=Fish%20%26%20Chips%2C%20London&destination=Paris&key="),
+        ({"origin": "Paris #2", "destination": "A+B"}, "origin=Paris%20%232&destination=A%2BB&key="),
+        ({"origin": "place_id:" + LONDON_PLACE_ID, "destination": "Paris", "waypoints": ("via:Calais", "Lille")}, "origin=place_id%3A" + LONDON_PLACE_ID + "&destination=Paris&waypoints=via%3ACalais%7CLille&key=")
+    ])
+    def test_url_encoding(self, input, output):
+        logger.info("Verifying option values are percent-encoded: " + str(input))
+        assert Google_API_Handler.url_builder(input) == Google_API_Handler.DIRECTIONS_URL + "?" + output + Google_API_Handler.API_KEY
+
+    def test_url_memoized(self):
+        options = {"origin": "Memo Street", "destination": "Paris"}
+        first = Google_API_Handler.url_builder(options)
+        hits = Google_API_Handler.build_url.cache_info().hits
+
+        logger.info("Verifying the same options build their URL once")
+        assert Google_API_Handler.url_builder(dict(options)) is first
+        assert Google_API_Handler.build_url.cache_info().hits == hits + 1
+
+    def test_spellings_share_route(self, session):
+        client = create_app().test_client()
+
+        logger.info("Verifying spellings of the same places share one upstream call")
+        for locations in ({"origin": "London", "destination": "Paris"}, {"origin": "  london", "destination": "PARIS"}):
+            response = client.post('/get_summary', json = locations)
+            assert response.status_code == 200
+            assert json.loads(response.data)["origin"] == locations["origin"]
+        assert len(session.urls) == 1
+        assert "origin=london&destination=paris&" in session.urls[0]
+
+    def test_place_id_substitution(self, session):
+        client = create_app().test_client()
+        assert client.post('/get_summary', json = {"origin": "London", "destination": "Paris"}).status_code == 200
+
+        logger.info("Verifying a place Google has geocoded is asked for by its place ID")
+        assert client.post('/get_summary', json = {"origin": "London", "destination": "Paris"}, headers = {"Cache-Control": "no-cache"}).status_code == 200
+        assert "origin=place_id%3A" + LONDON_PLACE_ID + "&destination=place_id%3A" + PARIS_PLACE_ID + "&" in session.urls[1]
+
+        logger.info("Verifying another name for the same place shares its route once Google has resolved it")
+        assert client.post('/get_summary', json = {"origin": "London, UK", "destination": "Paris"}).status_code == 200
+        assert len(session.urls) == 3
+        assert client.post('/get_summary', json = {"origin": "london,  uk", "destination": "Paris"}).status_code == 200
+        assert client.post('/get_summary', json = {"origin": "London", "destination": "Paris"}).status_code == 200
+        assert len(session.urls) == 3
@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import pytest
+import logging
+
+import Metrics
+import Google_API_Handler
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Metrics import Registry
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def sample_value(text, sample):
+    for line in text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+class TestMetrics:
+    @pytest.mark.parametrize("input, output", [
+        ([0.0001], ["1", "1", "1"]),
+        ([0.003, 0.003], ["0", "2", "2"]),
+        ([0.0001, 20], ["1", "1", "2"])
+    ])
+    def test_histogram_buckets(self, input, output):
+        registry = Registry()
+        histogram = registry.histogram("test_seconds", "Test timings.", ("stage",), (0.001, 0.005))
+        for value in input:
+            histogram.observe(value, "parse")
+
+        logger.info("Verifying cumulative bucket counts for " + json.dumps(input))
+        text = registry.render()
+        assert sample_value(text, 'test_seconds_bucket{stage="parse",le="0.001"}') == float(output[0])
+        assert sample_value(text, 'test_seconds_bucket{stage="parse",le="0.005"}') == float(output[1])
+        assert sample_value(text, 'test_seconds_bucket{stage="parse",le="+Inf"}') == float(output[2])
+        assert sample_value(text, 'test_seconds_count{stage="parse"}') == len(input)
+        assert sample_value(text, 'test_seconds_sum{stage="parse"}') == pytest.approx(sum(input))
+
+    def test_exposition_format(self):
+        registry = Registry()
+        counter = registry.counter("test_requests_total", "Requests seen.", ("status",))
+        counter.inc("OK")
+        counter.inc("OK")
+        counter.inc('say "hi"')
+        registry.callback("test_entries", "Entries held.", lambda: 7)
+
+        logger.info("Verifying HELP/TYPE lines, label escaping and callback values")
+        text = registry.render()
+        assert "# HELP test_requests_total Requests seen.\n# TYPE test_requests_total counter\n" in text
+        assert sample_value(text, 'test_requests_total{status="OK"}') == 2
+        assert sample_value(text, 'test_requests_total{status="say \\"hi\\""}') == 1
+        assert "# TYPE test_entries gauge\ntest_entries 7\n" in text
+
+    def test_register_returns_existing(self):
+        registry = Registry()
+        first = registry.counter("test_total", "Test.")
+
+        logger.info("Verifying a module imported twice shares its metrics")
+        assert registry.counter("test_total", "Test.") is first
+
+    def test_metrics_endpoint(self, monkeypatch, session):
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        client = create_app().test_client()
+
+        upstreamBefore = Metrics.STAGE_SECONDS.count("upstream")
+        okBefore = Metrics.DIRECTIONS_STATUS.value("OK")
+        serializeBefore = Metrics.STAGE_SECONDS.count("serialize")
+
+        logger.info("Calling Flask Client Route: /get_summary twice, the second from the cache")
+        for _ in range(2):
+            assert client.post('/get_summary', json = {"origin": "London", "destination": "Paris"}).status_code == 200
+
+        logger.info("Calling Flask Client Route: /metrics")
+        response = client.get('/metrics')
+        text = response.data.decode("UTF-8")
+        assert response.status_code == 200
+        assert response.mimetype == "text/plain"
+
+        logger.info("Verifying only the first request reached the upstream stages")
+        assert Metrics.STAGE_SECONDS.count("upstream") == upstreamBefore + 1
+        assert Metrics.DIRECTIONS_STATUS.value("OK") == okBefore + 1
+        assert Metrics.STAGE_SECONDS.count("serialize") == serializeBefore + 2
+        assert sample_value(text, "nologynav_route_cache_entries") is not None
+        assert sample_value(text, "nologynav_upstream_in_flight") == 0
+        assert sample_value(text, 'nologynav_request_seconds_count{endpoint="get_summary",code="200"}') >= 2
+        assert sample_value(text, 'nologynav_response_bytes_count{endpoint="get_summary"}') >= 2
@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import time
+import httpx
+import pytest
+import asyncio
+import logging
+
+import Google_API_Handler
+import NologyNav_ASGI
+from Route_Cache import RouteCache
+from conftest import FakeAsyncClient
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def load_route(name):
+    with open("test/routes/" + name, "rb") as test_file:
+        return test_file.read()
+
+def not_found_payload(url):
+    return json.dumps({
+        "geocoded_waypoints": [{"geocoder_status": "OK"}, {"geocoder_status": "ZERO_RESULTS"}],
+        "routes": [],
+        "status": "NOT_FOUND"
+    }).encode("UTF-8")
+
+async def post_summaries(bodies, headers=None):
+    transport = httpx.ASGITransport(app=NologyNav_ASGI.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://nologynav") as client:
+        return await asyncio.gather(*[client.post("/get_summary", json=body, headers=headers) for body in bodies])
+
+class TestNologyNavASGI:
+    @pytest.fixture(autouse=True)
+    def fresh_cache(self, monkeypatch):
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+
+    def test_get_summary(self, monkeypatch):
+        london_to_paris = load_route("London_to_Paris.json")
+        client = FakeAsyncClient(lambda url: london_to_paris)
+        monkeypatch.setattr(Google_API_Handler, "get_async_client", lambda: client)
+
+        logger.info("Calling ASGI Route: /get_summary with: - Origin: London / Destination: Paris")
+        response, = asyncio.run(post_summaries([{"origin": "London", "destination": "Paris"}]))
+
+        logger.info("Verifying response matches the synchronous summary fields")
+        assert response.status_code == 200
+        responseData = response.json()
+        assert responseData["distance_travelled"] == "295.5 mi"
+        assert responseData["total_time"] == "5 hours 50 mins"
+        assert responseData["modes_of_transportation"] == ["driving", "ferry-train"]
+
+        logger.info("Verifying the Server-Timing header: " + response.headers["Server-Timing"])
+        assert [metric.split(";")[0] for metric in response.headers["Server-Timing"].split(", ")] == ["upstream", "parse", "extract", "serialize", "compress", "total"]
+
+    def test_get_summary_geocode_error(self, monkeypatch):
+        client = FakeAsyncClient(not_found_payload)
+        monkeypatch.setattr(Google_API_Handler, "get_async_client", lambda: client)
+
+        logger.info("Verifying geocoding errors are reported with a 406")
+        response, = asyncio.run(post_summaries([{"origin": "London", "destination": "Very Bad Location Data"}]))
+        assert response.status_code == 406
+        assert response.json() == {"error": "We are unable to find that destination."}
+
+    def test_get_summary_bad_body(self):
+        async def post_garbage():
+            transport = httpx.ASGITransport(app=NologyNav_ASGI.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://nologynav") as client:
+                return await client.post("/get_summary", content=b"not json")
+
+        logger.info("Verifying a body that is not JSON is rejected")
+        assert asyncio.run(post_garbage()).status_code == 400
+
+    def test_concurrent_requests_overlap(self, monkeypatch):
+        london_to_paris = load_route("London_to_Paris.json")
+        client = FakeAsyncClient(lambda url: london_to_paris, delay=0.2)
+        monkeypatch.setattr(Google_API_Handler, "get_async_client", lambda: client)
+        bodies = [{"origin": "London " + str(index), "destination": "Paris"} for index in range(50)]
+
+        logger.info("Sending 50 concurrent requests against an upstream that takes 200ms each")
+        started = time.perf_counter()
+        responses = asyncio.run(post_summaries(bodies, headers={"Cache-Control": "no-cache"}))
+        elapsed = time.perf_counter() - started
+
+        logger.info("Verifying upstream calls ran concurrently: " + str(elapsed) + "s")
+        assert all(response.status_code == 200 for response in responses)
+        assert client.calls == 50
+        assert elapsed < 0.2 * 10
+
+    def test_get_summaries(self, monkeypatch):
+        london_to_paris = load_route("London_to_Paris.json")
+        client = FakeAsyncClient(lambda url: not_found_payload(url) if "destination=bad" in url else london_to_paris)
+        monkeypatch.setattr(Google_API_Handler, "get_async_client", lambda: client)
+        body = {"locations": [{"origin": "London", "destination": "Paris"}, {"origin": "London", "destination": "Bad"}]}
+
+        async def post_batch():
+            transport = httpx.ASGITransport(app=NologyNav_ASGI.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://nologynav") as asgi_client:
+                return await asgi_client.post("/get_summaries", json=body)
+
+        logger.info("Verifying the ASGI batch route reports each item separately")
+        response = asyncio.run(post_batch())
+        assert response.status_code == 200
+        assert [result["status"] for result in response.json()["results"]] == [200, 406]
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import pytest
+import logging
+
+import Google_API_Handler
+import NologyNav_Methods
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Route_Proximity import LocationMemo
+from conftest import FakeResponse, FakeSession
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+NOT_FOUND = json.dumps({
+    "geocoded_waypoints": [{"geocoder_status": "OK"}, {"geocoder_status": "ZERO_RESULTS"}],
+    "routes": [],
+    "status": "NOT_FOUND"
+}).encode("UTF-8")
+
+class BatchSession(FakeSession):
+    def respond(self, url):
+        if "origin=broken" in url:
+            raise Google_API_Handler.requests.ConnectionError("connection reset")
+        if "bad%20location" in url:
+            return FakeResponse(NOT_FOUND)
+        return super().respond(url)
+
+class TestNologyNavBatch:
+    @pytest.fixture()
+    def client(self, monkeypatch):
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        monkeypatch.setattr(Google_API_Handler, "HTTP_MAX_RETRIES", 0)
+        # Every fake route has the same place IDs; a fresh memo keeps "London 1" and "London 2" apart.
+        monkeypatch.setattr(Google_API_Handler, "LOCATION_MEMO", LocationMemo())
+        app = create_app()
+        return app.test_client()
+
+    def test_get_summaries(self, client, monkeypatch):
+        monkeypatch.setattr(Google_API_Handler, "get_session", lambda: BatchSession())
+        body = {"locations": [
+            {"origin": "London", "destination": "Paris"},
+            {"origin": "London", "destination": "Very Bad Location Data"},
+            {"origin": "London"},
+            {"origin": "Broken", "destination": "Paris"}
+        ]}
+
+        logger.info("Calling Flask Client Route: /get_summaries with " + str(len(body["locations"])) + " location pairs")
+        response = client.post('/get_summaries', json = body)
+        assert response.status_code == 200
+        results = json.loads(response.data.decode("UTF-8"))["results"]
+
+        logger.info("Verifying each item carries its own result or error")
+        assert [result["status"] for result in results] == [200, 406, 400, 502]
+        assert results[0]["result"]["distance_travelled"] == "295.5 mi"
+        assert results[0]["result"]["origin"] == "London"
+        assert results[1]["error"] == "We are unable to find that destination."
+
+    @pytest.mark.parametrize("input, output", [
+        (None, 3),
+        (2, 2),
+        (1, 1)
+    ])
+    def test_get_summaries_concurrency(self, client, monkeypatch, input, output):
+        session = BatchSession(delay=0.05)
+        monkeypatch.setattr(Google_API_Handler, "get_session", lambda: session)
+        monkeypatch.setattr(NologyNav_Methods, "BATCH_CONCURRENCY", 3)
+        body = {"locations": [{"origin": "London " + str(index), "destination": "Paris"} for index in range(9)]}
+        if input is not None:
+            body["concurrency"] = input
+
+        logger.info("Verifying no more than " + str(output) + " upstream calls run at once")
+        response = client.post('/get_summaries', json = body)
+        assert response.status_code == 200
+        assert session.max_active == output
+
+    @pytest.mark.parametrize("input, output", [
+        ({"locations": "London to Paris"}, 400),
+        ({"locations": [{"origin": "London", "destination": "Paris"}] * 101}, 413),
+        ({"locations": [], "concurrency": 0}, 400),
+        ([], 200)
+    ])
+    def test_get_summaries_bad_request(self, client, input, output):
+        logger.info("Verifying malformed batches are rejected with " + str(output))
+        response = client.post('/get_summaries', json = input)
+        assert response.status_code == output
@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import signal
+import pytest
+import logging
+import threading
+import subprocess
+import requests
+from werkzeug.serving import make_server
+
+import NologyNav_Server
+from Route_Cache import RouteCache
+from Directions_Stub_Server import create_stub_app, DIRECTIONS_PATH
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+@pytest.fixture
+def stub_server():
+    server = make_server("127.0.0.1", 0, create_stub_app(), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:" + str(server.server_port)
+    server.shutdown()
+
+class TestNologyNavServer:
+    def test_worker_cache(self):
+        cache = RouteCache(max_entries=1000, max_bytes=4000, ttl=120, stale_ttl=600)
+
+        logger.info("Verifying each worker keeps its share of the in-memory cache budget")
+        workerCache = NologyNav_Server.worker_cache(cache, 4)
+        assert (workerCache.max_entries, workerCache.max_bytes, workerCache.ttl, workerCache.stale_ttl) == (250, 1000, 120, 600)
+
+    def test_configure_shared_state(self, monkeypatch):
+        monkeypatch.setenv("ROUTE_STORE_PATH", "")
+        monkeypatch.setenv("GOOGLE_API_QPS", "10")
+        monkeypatch.setenv("GOOGLE_API_RATE_LIMIT_PATH", "")
+        monkeypatch.setenv("ROUTE_STORE_TTL", "")
+        monkeypatch.setenv("ROUTE_CACHE_TTL", "120")
+
+        logger.info("Verifying the route store and rate limit default to shared memory")
+        created = NologyNav_Server.configure_shared_state()
+        assert os.environ["ROUTE_STORE_PATH"].startswith(NologyNav_Server.SHARED_MEMORY_DIR)
+        assert os.environ["GOOGLE_API_RATE_LIMIT_PATH"] in created
+        assert os.environ["ROUTE_STORE_PATH"] + "-wal" in created
+
+        logger.info("Verifying shared routes are kept no longer than the in-memory cache keeps them")
+        assert os.environ["ROUTE_STORE_TTL"] == "120"
+        monkeypatch.setenv("ROUTE_STORE_TTL", "900")
+        NologyNav_Server.configure_shared_state()
+        assert os.environ["ROUTE_STORE_TTL"] == "900"
+
+    def test_workers_share_routes(self, stub_server, tmp_path):
+        env = dict(os.environ, GOOGLE_DIRECTIONS_URL=stub_server + DIRECTIONS_PATH, ROUTE_STORE_PATH=str(tmp_path / "routes.sqlite"), ROUTE_PREFETCH_TOP="0")
+        process = subprocess.Popen([sys.executable, "server/NologyNav_Server.py", "--host", "127.0.0.1", "--port", "0", "--workers", "3"],
+                                   env=env, stderr=subprocess.PIPE, text=True)
+        try:
+            line = process.stderr.readline()
+            logger.info("Started: " + line.strip())
+            url = line.split()[2]
+
+            logger.info("Verifying a route fetched by one worker is a cache hit for the others")
+            for _ in range(9):
+                # A new connection each time, so requests land on different workers.
+                response = requests.post(url + "/get_summary", json = {"origin": "London", "destination": "Paris"}, headers = {"Connection": "close"})
+                assert response.status_code == 200
+                assert json.loads(response.text)["origin"] == "London"
+            assert requests.get(stub_server + "/stub/stats").json()["requests"] == 1
+        finally:
+            process.send_signal(signal.SIGTERM)
+            assert process.wait(timeout=10) == 0
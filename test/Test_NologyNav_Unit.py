@@ -7,6 +7,7 @@ from pytest import approx
 from flask import Flask, request
 
 from server import NologyNav
+from server import NologyNav_Methods
 from server.NologyNav import create_app
 
 logging.basicConfig(level=logging.DEBUG)
@@ -112,6 +113,29 @@ class TestNavigationManager:
         assert type(result) == list
         logger.info("Expected output: travel modes: " + ' '.join(output) + " | Actual output: travel modes = " + ' '.join(result))
     
+    @pytest.mark.parametrize("input", [
+        ("Disneyland_to_Seaworld.json"),
+        ("Disneyland_to_UniversalStudios.json"),
+        ("London_to_Paris.json")
+    ])
+    def test_extract_route_summary(self, input):
+        logger.info("Loading Test File: " + input)
+        with open("test/routes/" + input) as test_file:
+            test_data_contents = test_file.read()
+        testData = json.loads(test_data_contents)
+
+        logger.info("Calling 'extract_route_summary' function with test data to get result")
+        result = NologyNav_Methods.extract_route_summary(testData)
+
+        logger.info("Verifying the single-pass summary matches every individual extraction function")
+        assert result.waypoints == NologyNav.count_waypoints(testData)
+        assert result.distance_travelled() == NologyNav.distance_travelled(testData)
+        assert result.total_time() == NologyNav.total_time(testData)
+        assert result.lat_lng() == NologyNav.lat_lng(testData)
+        assert result.avg_speed() == NologyNav.avg_speed(testData)
+        assert result.modes == NologyNav.modes_of_transportation(testData)
+        assert not hasattr(result, "__dict__")
+
     @pytest.mark.parametrize("input, output", [
         ({"waypoints": "32", 
         "distance_travelled": "295.5mi",
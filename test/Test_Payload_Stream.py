@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import pytest
+import logging
+
+from server import NologyNav_Methods
+from server import Google_API_Handler
+from server.Payload_Stream import parse_chunks, payload_size
+from conftest import FakeSession
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def load_chunks(name, chunk_size):
+    with open("test/routes/" + name, "rb") as test_file:
+        body = test_file.read()
+    return body, [body[start:start + chunk_size] for start in range(0, len(body), chunk_size)]
+
+class TestPayloadStream:
+    @pytest.mark.parametrize("input, chunk_size", [
+        ("Disneyland_to_Seaworld.json", 65536),
+        ("Disneyland_to_UniversalStudios.json", 7),
+        ("London_to_Paris.json", 1024)
+    ])
+    def test_summary_fields_match_full_parse(self, input, chunk_size):
+        logger.info("Loading Test File: " + input + " in chunks of " + str(chunk_size) + " bytes")
+        body, chunks = load_chunks(input, chunk_size)
+        fullData = json.loads(body)
+
+        logger.info("Streaming the body through the summary field set")
+        prunedData, bytesRead = parse_chunks(chunks, "summary")
+        assert bytesRead == len(body)
+
+        logger.info("Verifying the pruned payload produces the same summary")
+        locations = {"origin": "A", "destination": "B"}
+        assert NologyNav_Methods.build_navigation_response(locations, prunedData) == NologyNav_Methods.build_navigation_response(locations, fullData)
+        assert NologyNav_Methods.check_geocoding(locations, prunedData) is prunedData
+
+        logger.info("Verifying the Google_API_Handler helpers read the same values")
+        assert Google_API_Handler.get_num_routes(prunedData) == Google_API_Handler.get_num_routes(fullData)
+        assert len(Google_API_Handler.get_steps(prunedData, 0)) == len(Google_API_Handler.get_steps(fullData, 0))
+        assert Google_API_Handler.get_duration_value(prunedData) == Google_API_Handler.get_duration_value(fullData)
+        assert Google_API_Handler.get_duration_in_traffic_value(prunedData) == Google_API_Handler.get_duration_in_traffic_value(fullData)
+        assert Google_API_Handler.get_travel_mode(prunedData) == Google_API_Handler.get_travel_mode(fullData)
+        assert Google_API_Handler.get_transit_route_preferences(prunedData) == Google_API_Handler.get_transit_route_preferences(fullData)
+        assert Google_API_Handler.get_start_address(prunedData) == Google_API_Handler.get_start_address(fullData)
+        assert Google_API_Handler.get_waypoints(prunedData) == Google_API_Handler.get_waypoints(fullData)
+
+    @pytest.mark.parametrize("input", [
+        ("Disneyland_to_Seaworld.json"),
+        ("London_to_Paris.json")
+    ])
+    def test_unused_fields_are_dropped(self, input):
+        body, chunks = load_chunks(input, 65536)
+        prunedData, bytesRead = parse_chunks(chunks, "summary")
+        step = Google_API_Handler.get_steps(prunedData, 0)[0]
+
+        logger.info("Verifying polylines and instructions are never materialized")
+        assert "polyline" not in step
+        assert "html_instructions" not in step
+        assert "overview_polyline" not in prunedData["routes"][0]
+
+        logger.info("Verifying the kept payload is a fraction of the body: " + str(payload_size(prunedData)) + " of " + str(len(body)) + " bytes")
+        assert payload_size(prunedData) < len(body) / 3
+
+    def test_numbers_are_floats(self):
+        prunedData, bytesRead = parse_chunks([b'{"routes": [{"legs": [{"start_location": {"lat": 51.5072126, "lng": -0.1275835}}]}]}'], "summary")
+
+        logger.info("Verifying coordinates come back as JSON-serializable floats")
+        location = prunedData["routes"][0]["legs"][0]["start_location"]
+        assert type(location["lat"]) == float
+        assert json.dumps(location) == '{"lat": 51.5072126, "lng": -0.1275835}'
+
+    @pytest.mark.parametrize("input, output", [
+        (True, False),
+        (False, True)
+    ])
+    def test_request_payload_stream_mode(self, monkeypatch, input, output):
+        session = FakeSession()
+        monkeypatch.setattr(Google_API_Handler, "get_session", lambda: session)
+        monkeypatch.setattr(Google_API_Handler, "STREAM_PARSE", input)
+
+        logger.info("Requesting the summary field set with GOOGLE_API_STREAM_PARSE=" + str(input))
+        result, size = Google_API_Handler.request_payload("https://example.invalid/directions/json", "summary")
+
+        logger.info("Verifying polylines are only kept when streaming is off")
+        assert session.requests[0]["stream"] == input
+        assert ("overview_polyline" in result["routes"][0]) == output
+        assert (size == len(session.content)) == output
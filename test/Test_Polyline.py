@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import pytest
+import logging
+import numpy as np
+
+import Google_API_Handler
+import NologyNav_Methods
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Polyline import decode_polyline, decode_polylines, haversine, path_length, path_lengths
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def load_steps(name):
+    with open("test/routes/" + name) as test_file:
+        return json.load(test_file)["routes"][0]["legs"][0]["steps"]
+
+def decode_reference(encoded):
+    # The decoder from Google's documentation, one character at a time.
+    index, lat, lng, points = 0, 0, 0, []
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift, result = 0, 0
+            while True:
+                chunk = ord(encoded[index]) - 63
+                index += 1
+                result |= (chunk & 0x1f) << shift
+                shift += 5
+                if chunk < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / 1e5, lng / 1e5))
+    return points
+
+class TestPolyline:
+    def test_decode_polyline(self):
+        logger.info("Decoding the example from Google's polyline documentation")
+        points = decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+        assert np.allclose(points, [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)])
+
+    @pytest.mark.parametrize("input", [
+        ("Disneyland_to_Seaworld.json"),
+        ("Disneyland_to_UniversalStudios.json"),
+        ("London_to_Paris.json")
+    ])
+    def test_decode_polylines_matches_reference(self, input):
+        steps = load_steps(input)
+        encoded = [step["polyline"]["points"] for step in steps]
+
+        logger.info("Decoding every step polyline of " + input + " in one pass")
+        points, counts = decode_polylines(encoded)
+
+        logger.info("Verifying " + str(len(points)) + " points against the reference decoder")
+        reference = [decode_reference(polyline) for polyline in encoded]
+        assert counts.tolist() == [len(stepPoints) for stepPoints in reference]
+        assert np.allclose(points, [point for stepPoints in reference for point in stepPoints])
+
+        logger.info("Verifying step lengths agree with the distances Google reports")
+        lengths = path_lengths(points, counts)
+        googleDistances = np.array([step["distance"]["value"] for step in steps])
+        assert lengths.sum() == pytest.approx(googleDistances.sum(), rel=0.001)
+        assert path_length(decode_polyline(encoded[1])) == pytest.approx(lengths[1])
+
+    def test_empty_polylines(self):
+        points, counts = decode_polylines(["", "_p~iF~ps|U", ""])
+
+        logger.info("Verifying empty polylines contribute no points or distance")
+        assert counts.tolist() == [0, 1, 0]
+        assert path_lengths(points, counts).tolist() == [0, 0, 0]
+
+    def test_no_polylines(self):
+        points, counts = decode_polylines([])
+
+        logger.info("Verifying a leg without steps decodes to empty arrays")
+        assert points.shape == (0, 2)
+        assert counts.tolist() == []
+        assert path_lengths(points, counts).tolist() == []
+
+        logger.info("Verifying a leg without steps has an empty speed profile")
+        profile = NologyNav_Methods.speed_profile({"routes": [{"legs": [{"steps": []}]}]})
+        assert profile["distance_travelled"] == "0.0 mi"
+        assert profile["avg_speed"] == 0.0
+        assert profile["max_speed"] == 0.0
+        assert profile["steps"] == []
+        assert profile["speed_profile"] == {"distance": [], "speed": []}
+
+    @pytest.mark.parametrize("input", ["_p~iF~ps|", "_p~iF", "_p~iF~ps|U" + " "])
+    def test_bad_polyline(self, input):
+        logger.info("Verifying malformed polylines are rejected: " + input)
+        with pytest.raises(ValueError):
+            decode_polyline(input)
+
+    @pytest.mark.parametrize("input, output", [
+        (((51.5072126, -0.1275835), (48.8563715, 2.3532147)), 343.6),
+        (((0, 0), (0, 1)), 111.2),
+        (((33.8, -117.9), (33.8, -117.9)), 0)
+    ])
+    def test_haversine(self, input, output):
+        logger.info("Verifying great-circle distance in km between " + str(input))
+        assert haversine(np.array(input[0]), np.array(input[1])) / 1000 == pytest.approx(output, abs=0.1)
+
+    def test_get_speed_profile(self, monkeypatch, session):
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        client = create_app().test_client()
+
+        logger.info("Calling Flask Client Route: /get_speed_profile with: - Origin: London / Destination: Paris")
+        response = client.post('/get_speed_profile', json = {"origin": "London", "destination": "Paris"})
+        assert response.status_code == 200
+        responseData = json.loads(response.data)
+
+        logger.info("Verifying per-step speeds and the route profile")
+        assert responseData["distance_travelled"] == "295.6 mi"
+        assert len(responseData["steps"]) == 51
+        assert responseData["steps"][0] == {"travel_mode": "driving", "distance": 114.5, "duration": 43, "avg_speed": 6.0, "points": 26}
+        assert responseData["speed_profile"]["distance"][-1] == 295.55
+        assert max(responseData["speed_profile"]["speed"]) == responseData["max_speed"]
+        assert 40 < responseData["avg_speed"] < responseData["max_speed"]
+        assert responseData["modes_of_transportation"] == ["driving", "ferry-train"]
+        assert sum(responseData["duration_by_mode"].values()) == sum(step["duration"] for step in responseData["steps"])
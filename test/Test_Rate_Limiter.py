@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import pytest
+import asyncio
+import logging
+import threading
+
+import Google_API_Handler
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Rate_Limiter import RateLimiter, RateLimitExceeded, TokenBucket, INTERACTIVE, BATCH, PREFETCH
+from conftest import FakeSession
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def drained_limiter(rate, **kwargs):
+    limiter = RateLimiter(rate, burst=1, **kwargs)
+    limiter.acquire()
+    return limiter
+
+class TestRateLimiter:
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=10, burst=2)
+
+        logger.info("Verifying the burst is let through and the next token is a tenth of a second away")
+        assert bucket.take() == 0
+        assert bucket.take() == 0
+        assert 0 < bucket.take() <= 0.1
+
+    def test_priority_order(self):
+        limiter = drained_limiter(20, max_wait=5)
+        granted = []
+
+        def acquire(priority):
+            limiter.acquire(priority)
+            granted.append(priority)
+
+        logger.info("Queueing prefetch and batch work ahead of an interactive request")
+        threads = []
+        for priority in (PREFETCH, BATCH, INTERACTIVE):
+            thread = threading.Thread(target=acquire, args=(priority,))
+            thread.start()
+            threads.append(thread)
+            while limiter.queued < len(threads):
+                time.sleep(0.001)
+        for thread in threads:
+            thread.join()
+
+        assert granted == [INTERACTIVE, BATCH, PREFETCH]
+        assert limiter.stats()["queued"] == 0
+
+    def test_fails_fast(self):
+        limiter = drained_limiter(1, max_wait=0.5)
+
+        logger.info("Verifying a request that cannot get through in time is turned away without waiting")
+        started = time.monotonic()
+        with pytest.raises(RateLimitExceeded) as error:
+            limiter.acquire()
+        assert time.monotonic() - started < 0.1
+        assert 0.5 < error.value.retry_after <= 1
+        assert limiter.stats() == {"rate": 1, "queued": 0, "granted": 1, "rejected": 1}
+
+    def test_shared_bucket(self, tmp_path):
+        path = str(tmp_path / "quota")
+        first = RateLimiter(1, burst=1, max_wait=0.1, path=path)
+        second = RateLimiter(1, burst=1, max_wait=0.1, path=path)
+
+        logger.info("Verifying two limiters on one file share a single budget")
+        first.acquire()
+        with pytest.raises(RateLimitExceeded):
+            second.acquire()
+
+    def test_acquire_async(self):
+        limiter = drained_limiter(50, max_wait=1)
+
+        logger.info("Verifying async callers wait for the next token")
+        queued = asyncio.run(limiter.acquire_async(BATCH))
+        assert 0 < queued < 0.5
+
+    @pytest.mark.parametrize("input, output", [
+        ({"status": "OVER_QUERY_LIMIT", "error_message": "You have exceeded your rate-limit for this API.", "routes": []}, (503, "4")),
+        ({"status": "REQUEST_DENIED", "error_message": "The provided API key is invalid.", "routes": []}, (406, None))
+    ])
+    def test_get_summary_google_errors(self, monkeypatch, input, output):
+        monkeypatch.setattr(Google_API_Handler, "get_session", lambda: FakeSession(input))
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        monkeypatch.setattr(Google_API_Handler, "HTTP_MAX_RETRIES", 0)
+        client = create_app().test_client()
+
+        logger.info("Verifying Google's " + input["status"] + " is reported without geocoding results")
+        response = client.post('/get_summary', json = {"origin": "London", "destination": "Paris"})
+        assert response.status_code == output[0]
+        assert response.headers.get("Retry-After") == output[1]
+        assert "error" in json.loads(response.data)
+
+    def test_get_summary_rate_limited(self, monkeypatch):
+        session = FakeSession({"status": "OK"})
+        monkeypatch.setattr(Google_API_Handler, "get_session", lambda: session)
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        monkeypatch.setattr(Google_API_Handler, "RATE_LIMITER", drained_limiter(0.5, max_wait=0.1))
+        client = create_app().test_client()
+
+        logger.info("Verifying a request over the local rate limit is answered with 503 without calling Google")
+        response = client.post('/get_summary', json = {"origin": "London", "destination": "Paris"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "2"
+        assert session.calls == 0
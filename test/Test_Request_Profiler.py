@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import pytest
+import httpx
+import asyncio
+import logging
+
+import Google_API_Handler
+import Request_Profiler
+import NologyNav_ASGI
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Request_Profiler import server_timing, profile_requested
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def stage_names(header):
+    return [metric.split(";")[0] for metric in header.split(", ")]
+
+class TestRequestProfiler:
+    @pytest.fixture
+    def client(self, monkeypatch, session):
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        return create_app().test_client()
+
+    @pytest.mark.parametrize("input, output", [
+        (([("upstream", 0.0123), ("parse", 0.001)], 0.02), "upstream;dur=12.30, parse;dur=1.00, total;dur=20.00"),
+        (([("upstream", 0.01), ("upstream", 0.005)], None), "upstream;dur=15.00"),
+        (([], 0.0004), "total;dur=0.40")
+    ])
+    def test_server_timing(self, input, output):
+        logger.info("Verifying Server-Timing value: " + output)
+        assert server_timing(*input) == output
+
+    @pytest.mark.parametrize("input, output", [
+        (({"profile": "1"}, {}), True),
+        (({}, {"X-Profile": "true"}), True),
+        (({"profile": "0"}, {}), False),
+        (({}, {}), False)
+    ])
+    def test_profile_requested(self, input, output):
+        assert profile_requested(*input) == output
+
+    def test_server_timing_header(self, client):
+        logger.info("Calling Flask Client Route: /get_summary")
+        response = client.post('/get_summary', json = {"origin": "London", "destination": "Paris"})
+
+        logger.info("Verifying every stage is reported: " + response.headers["Server-Timing"])
+        assert stage_names(response.headers["Server-Timing"]) == ["upstream", "parse", "extract", "serialize", "total"]
+
+        logger.info("Verifying a cached response skips the upstream stages")
+        response = client.post('/get_summary', json = {"origin": "London", "destination": "Paris"})
+        assert stage_names(response.headers["Server-Timing"]) == ["extract", "serialize", "total"]
+
+    def test_profile(self, client):
+        logger.info("Calling Flask Client Route: /get_summary?profile=1 from an allowed address")
+        response = client.post('/get_summary?profile=1', json = {"origin": "London", "destination": "Paris"})
+        assert response.status_code == 200
+        responseData = json.loads(response.data)
+        assert responseData["distance_travelled"] == "295.5 mi"
+
+        logger.info("Verifying the profile names the functions that ran")
+        functions = [function["function"] for function in responseData["profile"]["functions"]]
+        assert any(function.endswith("(summarize_locations)") for function in functions)
+        assert any(function.endswith("(retrieve_navigation_payload)") for function in functions)
+
+    def test_profile_not_allowed(self, client, monkeypatch):
+        monkeypatch.setattr(Request_Profiler, "PROFILE_TOKEN", "secret")
+        remote = {"REMOTE_ADDR": "203.0.113.7"}
+
+        logger.info("Verifying callers outside PROFILE_ALLOWED_IPS are refused")
+        response = client.post('/get_summary', json = {"origin": "London", "destination": "Paris"}, headers={"X-Profile": "1"}, environ_base=remote)
+        assert response.status_code == 403
+
+        response = client.post('/get_summary', json = {"origin": "London", "destination": "Paris"}, headers={"X-Profile": "1", "X-Profile-Token": "wrong"}, environ_base=remote)
+        assert response.status_code == 403
+
+        logger.info("Verifying PROFILE_TOKEN lets them in")
+        response = client.post('/get_summary', json = {"origin": "London", "destination": "Paris"}, headers={"X-Profile": "1", "X-Profile-Token": "secret"}, environ_base=remote)
+        assert response.status_code == 200
+        assert "profile" in json.loads(response.data)
+
+        logger.info("Verifying requests without the flag are never profiled")
+        response = client.post('/get_summary', json = {"origin": "London", "destination": "Paris"}, environ_base=remote)
+        assert "profile" not in json.loads(response.data)
+
+    def test_profile_asgi(self, client):
+        async def post(path, headers, address):
+            transport = httpx.ASGITransport(app=NologyNav_ASGI.app, client=(address, 123))
+            async with httpx.AsyncClient(transport=transport, base_url="http://nologynav") as asgiClient:
+                return await asgiClient.post(path, json={"origin": "London", "destination": "Paris"}, headers=headers)
+
+        logger.info("Calling ASGI Route: /get_summary?profile=1 from an allowed address")
+        response = asyncio.run(post("/get_summary?profile=1", {}, "127.0.0.1"))
+        assert response.status_code == 200
+        functions = [function["function"] for function in response.json()["profile"]["functions"]]
+        assert any(function.endswith("(summarize_locations)") for function in functions)
+
+        logger.info("Verifying the ASGI app refuses callers outside PROFILE_ALLOWED_IPS as Flask does")
+        response = asyncio.run(post("/get_summary", {"X-Profile": "1"}, "203.0.113.7"))
+        assert response.status_code == 403
+        assert response.json() == {"error": "Profiling is not enabled for this caller."}
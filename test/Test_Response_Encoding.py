@@ -0,0 +1,112 @@
+import os
+import sys
+import gzip
+import json
+import zlib
+import httpx
+import pytest
+import asyncio
+import logging
+
+import Google_API_Handler
+import NologyNav_ASGI
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Response_Encoding import encode_json, negotiate_encoding
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+LOCATIONS = {"origin": "London", "destination": "Paris"}
+
+class TestResponseEncoding:
+    @pytest.fixture
+    def client(self, monkeypatch, session):
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        return create_app().test_client()
+
+    @pytest.mark.parametrize("input, output", [
+        ("gzip, deflate, br", "gzip"),
+        ("deflate", "deflate"),
+        ("gzip;q=0.5, deflate;q=0.9", "deflate"),
+        ("br", None),
+        ("gzip;q=0", None),
+        ("", None),
+        (None, None)
+    ])
+    def test_negotiate_encoding(self, input, output):
+        logger.info("Negotiating Accept-Encoding: " + str(input))
+        assert negotiate_encoding(input) == output
+
+    def test_small_bodies_are_not_compressed(self):
+        body, status, headers = encode_json({"error": "We are unable to find that destination."}, 406, accept_encoding="gzip")
+
+        logger.info("Verifying error bodies are sent compact, uncompressed and untagged")
+        assert body == b'{"error":"We are unable to find that destination."}'
+        assert "Content-Encoding" not in dict(headers)
+        assert "ETag" not in dict(headers)
+
+    def test_compact_by_default(self, client):
+        logger.info("Calling Flask Client Route: /get_summary")
+        response = client.post('/get_summary', json = LOCATIONS)
+        assert response.mimetype == "application/json"
+        assert b"\n" not in response.data
+        compactLength = len(response.data)
+
+        logger.info("Calling Flask Client Route: /get_summary?pretty")
+        response = client.post('/get_summary?pretty', json = LOCATIONS)
+        assert response.data.decode("UTF-8") == json.dumps(json.loads(response.data), indent=4)
+        assert len(response.data) > compactLength
+
+    @pytest.mark.parametrize("input, output", [
+        ("gzip", gzip.decompress),
+        ("deflate", zlib.decompress)
+    ])
+    def test_compression(self, client, input, output):
+        logger.info("Calling Flask Client Route: /get_summary with Accept-Encoding: " + input)
+        response = client.post('/get_summary', json = LOCATIONS, headers={"Accept-Encoding": input})
+
+        assert response.headers["Content-Encoding"] == input
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert json.loads(output(response.data))["distance_travelled"] == "295.5 mi"
+
+    def test_conditional_request(self, client):
+        logger.info("Calling Flask Client Route: /get_summary for an ETag")
+        response = client.post('/get_summary', json = LOCATIONS)
+        etag = response.headers["ETag"]
+        assert etag.startswith('"') and not etag.startswith('W/')
+
+        logger.info("Verifying a matching If-None-Match gets an empty 304")
+        response = client.post('/get_summary', json = LOCATIONS, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.data == b""
+        assert response.headers["ETag"] == etag
+
+        logger.info("Verifying other representations and routes get a full response")
+        response = client.post('/get_summary', json = LOCATIONS, headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        response = client.post('/get_summary', json = {"origin": "Paris", "destination": "London"}, headers={"If-None-Match": '"something-else"'})
+        assert response.status_code == 200
+
+    def test_asgi_negotiation(self, client):
+        # The Flask client fixture fills the route cache the ASGI app reads from.
+        client.post('/get_summary', json = LOCATIONS)
+
+        async def post(headers, path="/get_summary"):
+            transport = httpx.ASGITransport(app=NologyNav_ASGI.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://nologynav") as asgiClient:
+                return await asgiClient.post(path, json=LOCATIONS, headers=headers)
+
+        logger.info("Calling ASGI Route: /get_summary with Accept-Encoding: gzip")
+        response = asyncio.run(post({"Accept-Encoding": "gzip"}))
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.json()["distance_travelled"] == "295.5 mi"
+
+        logger.info("Verifying the ASGI route honours If-None-Match")
+        response = asyncio.run(post({"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]}))
+        assert response.status_code == 304
+
+        logger.info("Calling ASGI Route: /get_summary?pretty=1")
+        response = asyncio.run(post({"Accept-Encoding": "identity"}, "/get_summary?pretty=1"))
+        assert response.text == json.dumps(response.json(), indent=4)
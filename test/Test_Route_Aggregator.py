@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import pytest
+import logging
+
+import Google_API_Handler
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Route_Aggregator import format_duration, aggregate_routes, rank_routes
+from conftest import FakeSession
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def load_route(name):
+    with open("test/routes/" + name) as test_file:
+        return json.load(test_file)
+
+def step(mode, duration, distance):
+    return {"travel_mode": mode, "duration": {"value": duration}, "distance": {"value": distance}}
+
+def leg(duration, distance, steps, durationInTraffic=None):
+    leg = {"start_address": "A", "end_address": "B", "duration": {"value": duration}, "distance": {"value": distance}, "steps": steps}
+    if durationInTraffic is not None:
+        leg["duration_in_traffic"] = {"value": durationInTraffic}
+    return leg
+
+def alternatives_payload():
+    # Route 0 is the shortest, route 1 the fastest once traffic is counted,
+    # and route 2 (two legs) has the least walking.
+    return {
+        "geocoded_waypoints": [{"geocoder_status": "OK"}, {"geocoder_status": "OK"}],
+        "status": "OK",
+        "routes": [
+            {"summary": "Direct", "legs": [leg(3000, 20000, [step("WALKING", 600, 800), step("DRIVING", 2400, 19200)], 3900)]},
+            {"summary": "Motorway", "legs": [leg(2700, 30000, [step("WALKING", 300, 400), step("DRIVING", 2400, 29600)], 3000)]},
+            {"summary": "Two legs", "legs": [leg(1800, 15000, [step("DRIVING", 1800, 15000)]), leg(1600, 12000, [step("DRIVING", 1600, 12000)])]}
+        ]
+    }
+
+class TestRouteAggregator:
+    @pytest.mark.parametrize("input, output", [
+        (130454, "1 day 12 hours"),
+        (20989, "5 hours 50 mins"),
+        (2940, "49 mins"),
+        (3600, "1 hour"),
+        (3660, "1 hour 1 min"),
+        (90000, "1 day 1 hour"),
+        (10, "1 min")
+    ])
+    def test_format_duration(self, input, output):
+        logger.info("Formatting " + str(input) + " seconds as " + output)
+        assert format_duration(input) == output
+
+    @pytest.mark.parametrize("input", [
+        ("Disneyland_to_Seaworld.json"),
+        ("Disneyland_to_UniversalStudios.json"),
+        ("London_to_Paris.json")
+    ])
+    def test_single_route_matches_summary_figures(self, input):
+        route_data = load_route(input)
+        leg = route_data["routes"][0]["legs"][0]
+
+        logger.info("Aggregating the only route of " + input)
+        route, = aggregate_routes(route_data)
+        assert route["duration"] == Google_API_Handler.get_duration_value(route_data)
+        assert route["total_time"] == leg["duration"]["text"]
+        assert route["distance"] == leg["distance"]["value"]
+        assert route["waypoints"] == len(leg["steps"])
+        assert route["legs"][0]["start_address"] == Google_API_Handler.get_start_address(route_data)
+
+    @pytest.mark.parametrize("input, output", [
+        ("fastest", [1, 2, 0]),
+        ("shortest", [0, 2, 1]),
+        ("least_walking", [2, 1, 0])
+    ])
+    def test_rank_routes(self, input, output):
+        routes = aggregate_routes(alternatives_payload())
+
+        logger.info("Ranking alternatives by " + input)
+        ranked, best = rank_routes(routes, input)
+        assert [route["route"] for route in ranked] == output
+        assert [route["rank"] for route in ranked] == [1, 2, 3]
+        assert best == {"fastest": 1, "shortest": 0, "least_walking": 2}
+
+    def test_multi_leg_route(self):
+        route = aggregate_routes(alternatives_payload())[2]
+
+        logger.info("Verifying legs are totalled and reported separately")
+        assert route["duration"] == 3400
+        assert route["distance"] == 27000
+        assert route["total_time"] == "57 mins"
+        assert [leg["duration"] for leg in route["legs"]] == [1800, 1600]
+        assert route["modes_of_transportation"] == ["driving"]
+
+        logger.info("Verifying traffic durations are used when Google provides them")
+        route = aggregate_routes(alternatives_payload())[1]
+        assert route["duration_in_traffic"] == 3000
+        assert route["walking_duration"] == 300
+        assert route["avg_speed"] == 22.4
+
+    def test_rank_by_unknown(self):
+        with pytest.raises(ValueError):
+            rank_routes([], "scenic")
+
+    def test_route_number_helpers(self):
+        route_data = alternatives_payload()
+
+        logger.info("Verifying Google_API_Handler helpers can read any route")
+        assert Google_API_Handler.get_duration_value(route_data, 0, 1) == 2700
+        assert Google_API_Handler.get_duration_in_traffic_value(route_data, 0, 2) == False
+        assert len(Google_API_Handler.get_steps(route_data, 1, 2)) == 1
+
+    def test_get_alternatives(self, monkeypatch):
+        session = FakeSession(alternatives_payload())
+        monkeypatch.setattr(Google_API_Handler, "get_session", lambda: session)
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        client = create_app().test_client()
+
+        logger.info("Calling Flask Client Route: /get_alternatives ranked by shortest")
+        response = client.post('/get_alternatives', json = {"origin": "London", "destination": "Paris", "waypoints": ["Calais", "Lille"], "rank_by": "shortest"})
+        assert response.status_code == 200
+        responseData = json.loads(response.data)
+
+        logger.info("Verifying the request asked Google for alternatives through the waypoints")
+        assert "alternatives=true" in session.urls[0]
+        assert "waypoints=calais%7Clille" in session.urls[0]
+        assert responseData["ranked_by"] == "shortest"
+        assert [route["summary"] for route in responseData["routes"]] == ["Direct", "Two legs", "Motorway"]
+        assert responseData["best"]["fastest"] == 1
+
+    @pytest.mark.parametrize("input, output", [
+        ({"origin": "London"}, 400),
+        ({"origin": "London", "destination": "Paris", "rank_by": "scenic"}, 400),
+        ({"origin": "London", "destination": "Paris", "mode": "teleport"}, 400),
+        ({"origin": "London", "destination": "Paris", "waypoints": "Calais"}, 400)
+    ])
+    def test_get_alternatives_bad_request(self, input, output):
+        client = create_app().test_client()
+
+        logger.info("Verifying a bad /get_alternatives body is rejected: " + json.dumps(input))
+        assert client.post('/get_alternatives', json = input).status_code == output
+
+    @pytest.mark.parametrize("input, output", [
+        ({"status": "INVALID_REQUEST", "error_message": "Transit may not be used with waypoints.", "routes": []}, (400, "Transit may not be used with waypoints.")),
+        ({"status": "NOT_FOUND", "routes": [], "geocoded_waypoints": [{"geocoder_status": "OK"}, {"geocoder_status": "ZERO_RESULTS"}, {"geocoder_status": "OK"}]}, (406, "We are unable to find one of the waypoints."))
+    ])
+    def test_get_alternatives_google_errors(self, monkeypatch, input, output):
+        monkeypatch.setattr(Google_API_Handler, "get_session", lambda: FakeSession(input))
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        client = create_app().test_client()
+
+        logger.info("Verifying Google's " + input["status"] + " is reported")
+        response = client.post('/get_alternatives', json = {"origin": "London", "destination": "Paris", "waypoints": ["Nowhere"], "mode": "transit"})
+        assert response.status_code == output[0]
+        assert json.loads(response.data) == {"error": output[1]}
@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import pytest
+import logging
+
+from server.Route_Cache import RouteCache, cache_key
+
+import Google_API_Handler
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class TestRouteCache:
+    @pytest.mark.parametrize("input, output", [
+        (({"origin": "London", "destination": "Paris"}, {"destination": "Paris", "origin": "London"}), True),
+        (({"origin": "London", "destination": "Paris", "avoid": ("ferries", "tolls")}, {"avoid": ("ferries", "tolls"), "destination": "Paris", "origin": "London"}), True),
+        (({"origin": "London", "destination": "Paris"}, {"origin": "Paris", "destination": "London"}), False),
+        (({"origin": "A", "destination": "B", "waypoints": ("C", "D")}, {"origin": "A", "destination": "B", "waypoints": ("D", "C")}), False)
+    ])
+    def test_cache_key(self, input, output):
+        logger.info("Verifying cache keys ignore option order but keep values distinct")
+        assert (cache_key(input[0]) == cache_key(input[1])) == output
+
+    def test_ttl_expiry(self, clock):
+        cache = RouteCache(ttl=60, clock=clock)
+        cache.put("London|Paris", {"status": "OK"}, 10)
+
+        logger.info("Verifying entry is served before its TTL runs out")
+        assert cache.get("London|Paris") == {"status": "OK"}
+
+        clock.now += 61
+        logger.info("Verifying entry is dropped once its TTL runs out")
+        assert cache.get("London|Paris") is None
+        assert len(cache) == 0
+        assert cache.size_bytes == 0
+        assert cache.stats()["expirations"] == 1
+
+    def test_stale_entries(self, clock):
+        cache = RouteCache(ttl=60, stale_ttl=600, clock=clock)
+        cache.put("London|Paris", {"status": "OK"}, 10)
+
+        clock.now += 61
+        logger.info("Verifying an expired entry is only served as a stale fallback")
+        assert cache.get("London|Paris") is None
+        assert cache.get_stale("London|Paris") == {"status": "OK"}
+        assert cache.stats()["stale_hits"] == 1
+
+        clock.now += 600
+        logger.info("Verifying the entry is dropped once its stale window runs out")
+        assert cache.get_stale("London|Paris") is None
+        assert cache.get("London|Paris") is None
+        assert len(cache) == 0
+
+    def test_lru_eviction_by_entries(self):
+        cache = RouteCache(max_entries=2)
+        cache.put("a", 1, 1)
+        cache.put("b", 2, 1)
+        cache.get("a")
+        cache.put("c", 3, 1)
+
+        logger.info("Verifying least recently used entry is evicted first")
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+
+    def test_lru_eviction_by_bytes(self):
+        cache = RouteCache(max_bytes=100)
+        cache.put("a", 1, 40)
+        cache.put("b", 2, 40)
+        cache.put("c", 3, 40)
+
+        logger.info("Verifying byte budget is enforced")
+        assert cache.size_bytes == 80
+        assert cache.get("a") is None
+
+        logger.info("Verifying payloads larger than the whole budget are never stored")
+        assert cache.put("huge", 4, 101) is False
+        assert cache.get("huge") is None
+
+    def test_hit_miss_counters(self):
+        cache = RouteCache()
+        cache.get("missing")
+        cache.put("present", 1, 1)
+        cache.get("present")
+        cache.get("present")
+
+        stats = cache.stats()
+        assert stats["hits"] == 2
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == pytest.approx(2 / 3)
+
+    def test_retrieve_navigation_payload_uses_cache(self, monkeypatch, session):
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        options = {"origin": "London", "destination": "Paris"}
+
+        logger.info("Verifying repeated lookups only reach the upstream once")
+        first = Google_API_Handler.retrieve_navigation_payload(options)
+        second = Google_API_Handler.retrieve_navigation_payload(dict(reversed(list(options.items()))))
+        assert first is second
+        assert len(session.urls) == 1
+
+        logger.info("Verifying use_cache=False bypasses the cache")
+        Google_API_Handler.retrieve_navigation_payload(options, use_cache=False)
+        assert len(session.urls) == 2
@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import pytest
+import logging
+
+import Google_API_Handler
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Route_Matrix import plan_matrix, parse_matrix_request, build_matrix
+from conftest import FakeResponse, FakeSession
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def load_route(name):
+    with open("test/routes/" + name) as test_file:
+        return json.load(test_file)
+
+class MatrixSession(FakeSession):
+    def respond(self, url):
+        if "atlantis" in url:
+            return FakeResponse({"status": "NOT_FOUND", "routes": [], "geocoded_waypoints": [{"geocoder_status": "OK"}, {"geocoder_status": "ZERO_RESULTS"}]})
+        return super().respond(url)
+
+@pytest.fixture
+def session(monkeypatch):
+    session = MatrixSession()
+    monkeypatch.setattr(Google_API_Handler, "get_session", lambda: session)
+    monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+    return session
+
+class TestRouteMatrix:
+    def test_plan_matrix(self):
+        logger.info("Planning a matrix with a repeated pair and a same-place cell")
+        pairs, cells = plan_matrix(["London", "Paris", " london "], ["Paris", "London"])
+
+        assert pairs == [("London", "Paris"), ("Paris", "London")]
+        assert cells == {(0, 0): 0, (0, 1): None, (1, 0): None, (1, 1): 1, (2, 0): 0, (2, 1): None}
+
+    @pytest.mark.parametrize("input, output", [
+        (None, 400),
+        ({"origins": ["London"]}, 400),
+        ({"origins": [], "destinations": ["Paris"]}, 400),
+        ({"origins": ["London", ""], "destinations": ["Paris"]}, 400),
+        ({"origins": ["London"], "destinations": ["Paris"], "concurrency": 0}, 400),
+        ({"origins": ["London"], "destinations": ["Paris"], "departure_time": "tomorrow"}, 400),
+        ({"origins": ["London"], "destinations": ["Paris"], "departure_time": 1000}, 400),
+        ({"origins": ["Place " + str(n) for n in range(11)], "destinations": ["Place " + str(n) for n in range(10)]}, 413)
+    ])
+    def test_parse_matrix_request_errors(self, input, output):
+        logger.info("Verifying a bad matrix body is rejected: " + json.dumps(input))
+        matrix_request, error = parse_matrix_request(input)
+        assert matrix_request is None
+        assert error[1] == output
+
+    def test_build_matrix(self, session):
+        route_data = load_route("London_to_Paris.json")
+        leg = route_data["routes"][0]["legs"][0]
+
+        logger.info("Building a 3x2 matrix that needs two distinct routes")
+        matrix = build_matrix(["London", "Paris", "LONDON"], ["Paris", "London"], concurrency=2)
+        assert len(session.urls) == 2
+        assert matrix["distinct_routes"] == 2
+        assert matrix["durations"] == [[leg["duration"]["value"], 0], [0, leg["duration"]["value"]], [leg["duration"]["value"], 0]]
+        assert matrix["distances"][2][0] == leg["distance"]["value"]
+        assert matrix["statuses"] == [[200, 200], [200, 200], [200, 200]]
+        assert matrix["errors"] == []
+
+        logger.info("Verifying a rebuilt matrix is answered from the route cache")
+        build_matrix(["London", "Paris"], ["Paris", "London"])
+        assert len(session.urls) == 2
+
+    @pytest.mark.parametrize("input, output", [
+        ({}, "departure_time=now"),
+        ({"departure_time": 4102444800}, "departure_time=4102444800")
+    ])
+    def test_get_matrix_in_traffic(self, session, monkeypatch, input, output):
+        payload = load_route("London_to_Paris.json")
+        payload["routes"][0]["legs"][0]["duration_in_traffic"] = {"text": "6 hours", "value": 21600}
+        session = MatrixSession(payload)
+        monkeypatch.setattr(Google_API_Handler, "get_session", lambda: session)
+        client = create_app().test_client()
+
+        logger.info("Verifying matrix routes are asked for with a departure time, so Google reports traffic: " + output)
+        response = client.post('/get_matrix', json = dict(input, origins = ["London"], destinations = ["Paris"]))
+        assert response.status_code == 200
+        assert output + "&" in session.urls[0]
+        assert json.loads(response.data)["durations_in_traffic"] == [[21600]]
+
+    def test_get_matrix_errors(self, session):
+        client = create_app().test_client()
+
+        logger.info("Calling Flask Client Route: /get_matrix with a destination Google cannot find")
+        response = client.post('/get_matrix', json = {"origins": ["London"], "destinations": ["Paris", "Atlantis"]})
+        assert response.status_code == 200
+        responseData = json.loads(response.data)
+
+        assert responseData["statuses"] == [[200, 406]]
+        assert responseData["durations"][0][1] is None
+        assert responseData["errors"] == [{"origin": 0, "destination": 1, "error": "We are unable to find that destination."}]
+
+    def test_get_matrix_stream(self, session):
+        client = create_app().test_client()
+
+        logger.info("Calling Flask Client Route: /get_matrix as NDJSON")
+        response = client.post('/get_matrix', json = {"origins": ["London", "Paris"], "destinations": ["Paris"]}, headers = {"Accept": "application/x-ndjson"})
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+
+        cells = [json.loads(line) for line in response.data.decode("UTF-8").splitlines()]
+        assert sorted((cell["origin"], cell["destination"], cell["status"]) for cell in cells) == [(0, 0, 200), (1, 0, 200)]
+        assert len(session.urls) == 1
@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import time
+import pytest
+import logging
+
+import Google_API_Handler
+from Route_Cache import RouteCache, cache_key
+from Route_Prefetcher import RoutePrefetcher
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def fake_prefetcher(expiries, **kwargs):
+    refreshed = []
+    prefetcher = RoutePrefetcher(lambda key, options, fields: refreshed.append(key), expiries.get, **kwargs)
+    return prefetcher, refreshed
+
+class TestRoutePrefetcher:
+    def test_hot_routes(self):
+        prefetcher, refreshed = fake_prefetcher({}, top_n=2)
+        for key in ("a", "b", "b", "c", "c", "c"):
+            prefetcher.record(key, {"origin": key, "destination": "Paris"})
+
+        logger.info("Verifying only the most requested routes are hot")
+        assert [(key, count) for key, options, fields, count in prefetcher.hot_routes()] == [("c", 3), ("b", 2)]
+
+    def test_run_once(self):
+        prefetcher, refreshed = fake_prefetcher({"a": 300, "b": 40, "c": -5}, top_n=3, interval=30, horizon=30)
+        for key in ("a", "b", "c", "d"):
+            prefetcher.record(key, {"origin": key, "destination": "Paris"})
+
+        logger.info("Verifying routes expiring before the next run, or not cached, are refreshed")
+        assert sorted(prefetcher.run_once()) == ["b", "c"]
+        assert sorted(refreshed) == ["b", "c"]
+        assert prefetcher.stats()["refreshes"] == 2
+
+        logger.info("Verifying request counts decay between runs")
+        assert prefetcher.hot_routes()[0][3] == pytest.approx(0.9)
+
+    def test_save_and_load(self, tmp_path):
+        path = str(tmp_path / "prefetch.json")
+        prefetcher, refreshed = fake_prefetcher({})
+        options = {"origin": "London", "destination": "Paris", "waypoints": ("Calais", "Lille")}
+        prefetcher.record(cache_key(options, "summary"), options, "summary")
+        prefetcher.record(cache_key(options, "summary"), options, "summary")
+        prefetcher.save(path)
+
+        logger.info("Verifying saved counts are read back under the same cache key")
+        loaded, refreshed = fake_prefetcher({})
+        assert loaded.load(path, cache_key) == 1
+        assert loaded.hot_routes() == [(cache_key(options, "summary"), options, "summary", 2)]
+
+        logger.info("Verifying a plain route list is read with the default fields")
+        with open(path, "w") as routes_file:
+            json.dump([{"origin": "London", "destination": "Paris"}], routes_file)
+        loaded.load(path, cache_key, "summary")
+        assert loaded.prewarm() == [cache_key(options, "summary"), cache_key({"origin": "London", "destination": "Paris"}, "summary")]
+        assert len(refreshed) == 2
+
+    def test_refreshes_hot_route(self, monkeypatch, session, clock):
+        options = {"origin": "London", "destination": "Paris"}
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache(ttl=300, clock=clock))
+        monkeypatch.setattr(Google_API_Handler, "REFRESH_AHEAD", 0)
+        # Keeps the route under one key, rather than moving to its place IDs once Google has geocoded it.
+        monkeypatch.setattr(Google_API_Handler, "PLACE_IDS", False)
+        prefetcher = RoutePrefetcher(Google_API_Handler.refresh_in_background, lambda key: Google_API_Handler.ROUTE_CACHE.expires_in(key), interval=30)
+        monkeypatch.setattr(Google_API_Handler, "PREFETCHER", prefetcher)
+
+        logger.info("Verifying requests are counted, cached or not")
+        Google_API_Handler.retrieve_navigation_payload(options)
+        Google_API_Handler.retrieve_navigation_payload(options)
+        assert prefetcher.hot_routes()[0][3] == 2
+        assert len(session.urls) == 1
+
+        logger.info("Verifying the prefetcher refreshes the route before it expires")
+        clock.now += 280
+        assert prefetcher.run_once() == [Google_API_Handler.canonical_key(options)]
+        for _ in range(500):
+            if Google_API_Handler.ROUTE_CACHE.expires_in(Google_API_Handler.canonical_key(options)) == pytest.approx(300):
+                break
+            time.sleep(0.01)
+        assert len(session.urls) == 2
+        assert Google_API_Handler.ROUTE_CACHE.expires_in(Google_API_Handler.canonical_key(options)) == pytest.approx(300)
+        assert prefetcher.hot_routes()[0][3] == pytest.approx(1.8)
@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import random
+import pytest
+import logging
+
+import Google_API_Handler
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Route_Proximity import LocationMemo, ProximityIndex, haversine_meters, parse_coordinates
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+LONDON = (51.5072126, -0.1275835)
+PARIS = (48.85637149999999, 2.3532147)
+
+def near(point, random_source, spread):
+    return (point[0] + random_source.uniform(-spread, spread), point[1] + random_source.uniform(-spread, spread))
+
+class TestRouteProximity:
+    @pytest.mark.parametrize("input, output", [
+        ("51.5073,-0.1277", (51.5073, -0.1277)),
+        (" -33.86 , 151.21 ", (-33.86, 151.21)),
+        ("London", None),
+        ("95.0,10.0", None)
+    ])
+    def test_parse_coordinates(self, input, output):
+        logger.info("Verifying locations written as coordinates are read: " + input)
+        assert parse_coordinates(input) == output
+
+    def test_haversine(self):
+        logger.info("Verifying great circle distances between London and Paris")
+        assert haversine_meters(LONDON, PARIS) == pytest.approx(343500, rel=0.005)
+        assert haversine_meters(LONDON, LONDON) == 0
+
+    @pytest.mark.parametrize("input, output", [
+        (LONDON, 100),
+        ((0.5, 30.0), 25),
+        ((69.6492, 18.9553), 100)
+    ])
+    def test_nearby_matches_brute_force(self, input, output):
+        random_source = random.Random(7)
+        index = ProximityIndex(output)
+        routes = {}
+        spread = output * 5 / 111000
+        for number in range(3000):
+            start, end = near(input, random_source, spread), near(PARIS, random_source, spread)
+            routes[f"route-{number}"] = (start, end)
+            index.add(None, f"route-{number}", start, end)
+
+        logger.info(f"Verifying grid lookups find exactly the routes within {output} m around {input}")
+        for _ in range(50):
+            start, end = near(input, random_source, spread), near(PARIS, random_source, spread)
+            expected = {key for key, (routeStart, routeEnd) in routes.items() if haversine_meters(start, routeStart) <= output and haversine_meters(end, routeEnd) <= output}
+            found = index.nearby(None, start, end)
+            assert set(found) == expected
+            assert [haversine_meters(start, routes[key][0]) + haversine_meters(end, routes[key][1]) for key in found] == sorted(haversine_meters(start, routes[key][0]) + haversine_meters(end, routes[key][1]) for key in found)
+
+    def test_groups_and_bounds(self):
+        index = ProximityIndex(50, max_routes=2)
+        index.add("summary", "a", LONDON, PARIS)
+        index.add(None, "b", LONDON, PARIS)
+
+        logger.info("Verifying routes only match within their group")
+        assert index.nearby("summary", LONDON, PARIS) == ["a"]
+
+        logger.info("Verifying the oldest route is dropped once the index is full")
+        index.add(None, "c", LONDON, PARIS)
+        assert index.nearby("summary", LONDON, PARIS) == []
+        assert len(index) == 2
+
+    def test_location_memo(self):
+        memo = LocationMemo(max_entries=2)
+        memo.learn("London", {"lat": LONDON[0], "lng": LONDON[1]})
+        memo.learn("Paris", PARIS)
+
+        logger.info("Verifying learned locations are found however they are spaced or capitalized")
+        assert memo.get("  LONDON ") == LONDON
+
+        logger.info("Verifying the least recently used location is forgotten first")
+        memo.learn("Calais", (50.95, 1.85))
+        assert memo.get("Paris") is None
+        assert memo.get("London") == LONDON
+
+    def test_nearby_request_uses_cached_route(self, monkeypatch, session):
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        monkeypatch.setattr(Google_API_Handler, "LOCATION_MEMO", LocationMemo())
+        monkeypatch.setattr(Google_API_Handler, "PROXIMITY_INDEX", ProximityIndex(50))
+        client = create_app().test_client()
+
+        assert client.post('/get_summary', json = {"origin": "London", "destination": "Paris"}).status_code == 200
+
+        logger.info("Verifying places within the radius of a cached route's ends are answered from it")
+        for locations in ({"origin": "51.5073,-0.1277", "destination": "48.8564,2.3533"}, {"origin": " london", "destination": "PARIS "}):
+            response = client.post('/get_summary', json = locations)
+            assert response.status_code == 200
+            assert json.loads(response.data)["origin"] == locations["origin"]
+        assert session.calls == 1
+
+        logger.info("Verifying places further away still ask Google")
+        assert client.post('/get_summary', json = {"origin": "51.52,-0.1277", "destination": "Paris"}).status_code == 200
+        assert session.calls == 2
+
+        logger.info("Verifying an indexed route that has left the cache is dropped from the index")
+        Google_API_Handler.ROUTE_CACHE.clear()
+        assert Google_API_Handler.lookup_nearby_payload({"origin": "London", "destination": "Paris"}) is None
+        assert len(Google_API_Handler.PROXIMITY_INDEX) == 0
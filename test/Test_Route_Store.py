@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import pytest
+import asyncio
+import logging
+import threading
+
+import Google_API_Handler
+import Route_Store
+from Route_Cache import RouteCache
+from Route_Store import RouteStore
+from Route_Proximity import LocationMemo
+from conftest import FakeAsyncClient, FakeClock
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def load_route(name):
+    with open("test/routes/" + name) as test_file:
+        return json.loads(test_file.read())
+
+class ThreadRecordingStore(RouteStore):
+    # Notes the thread behind every read and write.
+    def __init__(self, path):
+        super().__init__(path)
+        self.threads = []
+
+    def get_entry(self, key, allow_expired=False):
+        self.threads.append(threading.get_ident())
+        return super().get_entry(key, allow_expired)
+
+    def put(self, key, payload, ttl=None):
+        self.threads.append(threading.get_ident())
+        return super().put(key, payload, ttl)
+
+class TestRouteStore:
+    @pytest.fixture()
+    def clock(self):
+        return FakeClock(1700000000.0)
+
+    @pytest.fixture()
+    def store(self, tmp_path, clock):
+        store = RouteStore(str(tmp_path / "routes.sqlite"), ttl=60, clock=clock)
+        yield store
+        store.close()
+
+    @pytest.mark.parametrize("input", [
+        ("Disneyland_to_UniversalStudios.json"),
+        ("London_to_Paris.json")
+    ])
+    def test_round_trip(self, store, input):
+        logger.info("Storing Test File: " + input)
+        payload = load_route(input)
+        store.put("London|Paris", payload)
+
+        logger.info("Verifying the stored payload reads back unchanged and compressed")
+        assert store.get("London|Paris") == payload
+        entry, = store.entries()
+        assert entry["stored_size"] < entry["size"] / 1.5
+
+    def test_ttl(self, store, clock):
+        store.put("London|Paris", {"status": "OK"})
+        clock.now += 61
+
+        logger.info("Verifying expired routes are hidden unless stale reads are allowed")
+        assert store.get("London|Paris") is None
+        assert store.get("London|Paris", allow_expired=True) == {"status": "OK"}
+        assert store.stats()["expired"] == 1
+
+    def test_purge_and_compact(self, store, clock):
+        store.put("old", {"status": "OK"}, ttl=10)
+        store.put("new", {"status": "OK"}, ttl=100)
+        clock.now += 50
+
+        logger.info("Verifying purge only drops expired routes by default")
+        assert store.purge() == 1
+        assert store.get("new") == {"status": "OK"}
+        assert store.compact() == 0
+        assert store.purge(expired_only=False) == 1
+        assert store.stats()["entries"] == 0
+
+    def test_shared_between_connections(self, store, tmp_path, clock):
+        other = RouteStore(store.path, clock=clock)
+        store.put("London|Paris", {"status": "OK"})
+
+        logger.info("Verifying a second process-style connection sees the same routes")
+        assert other.get("London|Paris") == {"status": "OK"}
+        other.close()
+
+    def test_cli(self, store, capsys):
+        store.put("London|Paris", {"status": "OK"})
+
+        logger.info("Running the admin CLI against the store")
+        assert Route_Store.main(["--path", store.path, "stats"]) == 0
+        assert json.loads(capsys.readouterr().out)["entries"] == 1
+        assert Route_Store.main(["--path", store.path, "show", "London|Paris"]) == 0
+        assert json.loads(capsys.readouterr().out) == {"status": "OK"}
+        assert Route_Store.main(["--path", store.path, "show", "missing"]) == 1
+        assert Route_Store.main(["--path", store.path, "purge", "--all"]) == 0
+        assert json.loads(capsys.readouterr().out) == {"purged": 1}
+
+    def test_survives_restart(self, tmp_path, monkeypatch, session):
+        path = str(tmp_path / "routes.sqlite")
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_STORE", RouteStore(path))
+        options = {"origin": "London", "destination": "Paris"}
+        first = Google_API_Handler.retrieve_navigation_payload(options)
+
+        logger.info("Simulating a restart: empty memory cache, fresh store connection")
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_STORE", RouteStore(path))
+        second = Google_API_Handler.retrieve_navigation_payload(options)
+
+        assert second == first
+        assert len(session.urls) == 1
+        logger.info("Verifying the route was promoted back into the memory cache")
+        assert len(Google_API_Handler.ROUTE_CACHE) == 1
+
+    def test_async_store_off_loop(self, tmp_path, monkeypatch):
+        store = ThreadRecordingStore(str(tmp_path / "routes.sqlite"))
+        client = FakeAsyncClient()
+        monkeypatch.setattr(Google_API_Handler, "get_async_client", lambda: client)
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_STORE", store)
+        monkeypatch.setattr(Google_API_Handler, "LOCATION_MEMO", LocationMemo())
+        options = {"origin": "London", "destination": "Paris"}
+
+        async def lookups():
+            first = await Google_API_Handler.retrieve_navigation_payload_async(options)
+            # A fresh memory cache sends the second lookup to the store.
+            monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+            second = await Google_API_Handler.retrieve_navigation_payload_async(options)
+            return threading.get_ident(), first, second
+
+        logger.info("Verifying the async path reads and writes the store off the event loop")
+        loopThread, first, second = asyncio.run(lookups())
+        assert second == first
+        assert client.calls == 1
+        assert store.threads
+        assert loopThread not in store.threads
+        store.close()
@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import time
+import pytest
+import asyncio
+import logging
+import threading
+
+import Google_API_Handler
+from Route_Cache import RouteCache
+from Single_Flight import SingleFlight
+from conftest import FakeSession
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def run_threads(count, target):
+    results = [None] * count
+    errors = [None] * count
+
+    def worker(index):
+        try:
+            results[index] = target()
+        except Exception as error:
+            errors[index] = error
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_result(self):
+        flight = SingleFlight()
+        calls = []
+
+        def slow_lookup():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"status": "OK"}
+
+        logger.info("Starting 10 concurrent lookups for the same key")
+        results, errors = run_threads(10, lambda: flight.do("London|Paris", slow_lookup))
+
+        logger.info("Verifying only one lookup ran and every caller got its result")
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        assert flight.stats() == {"leaders": 1, "coalesced": 9, "in_flight": 0}
+
+    @pytest.mark.parametrize("input", [
+        ValueError("upstream failed"),
+        {"status": "ZERO_RESULTS"}
+    ])
+    def test_outcomes_are_shared(self, input):
+        flight = SingleFlight()
+
+        def slow_lookup():
+            time.sleep(0.1)
+            if isinstance(input, Exception):
+                raise input
+            return input
+
+        logger.info("Verifying every waiter sees the same outcome: " + str(input))
+        results, errors = run_threads(5, lambda: flight.do("Hawaii|California", slow_lookup))
+        if isinstance(input, Exception):
+            assert all(error is input for error in errors)
+        else:
+            assert all(result is input for result in results)
+
+    def test_distinct_keys_do_not_wait(self):
+        flight = SingleFlight()
+        calls = []
+
+        def lookup(key):
+            calls.append(key)
+            time.sleep(0.05)
+            return key
+
+        logger.info("Verifying different keys each get their own call")
+        run_threads(1, lambda: [flight.do(key, lambda: lookup(key)) for key in ("a", "b")])
+        assert calls == ["a", "b"]
+        assert flight.coalesced == 0
+
+    def test_async_calls_share_result(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def slow_lookup():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"status": "OK"}
+
+        async def run():
+            return await asyncio.gather(*[flight.do_async("London|Paris", slow_lookup) for index in range(10)])
+
+        logger.info("Verifying concurrent coroutines share one call")
+        results = asyncio.run(run())
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        assert flight.stats() == {"leaders": 1, "coalesced": 9, "in_flight": 0}
+
+    def test_async_leader_cancelled(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def slow_lookup():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"status": "OK"}
+
+        async def run():
+            leader = asyncio.ensure_future(flight.do_async("London|Paris", slow_lookup))
+            await asyncio.sleep(0)
+            followers = [asyncio.ensure_future(flight.do_async("London|Paris", slow_lookup)) for index in range(3)]
+            await asyncio.sleep(0)
+            leader.cancel()
+            return leader, await asyncio.gather(*followers)
+
+        logger.info("Verifying the first caller being cancelled does not cancel the call for the others")
+        leader, results = asyncio.run(run())
+        assert leader.cancelled()
+        assert results == [{"status": "OK"}] * 3
+        assert len(calls) == 1
+        assert flight.stats() == {"leaders": 1, "coalesced": 3, "in_flight": 0}
+
+    def test_retrieve_navigation_payload_coalesces(self, monkeypatch):
+        session = FakeSession(delay=0.1)
+        monkeypatch.setattr(Google_API_Handler, "get_session", lambda: session)
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache(max_entries=0))
+        monkeypatch.setattr(Google_API_Handler, "INFLIGHT", SingleFlight())
+
+        logger.info("Verifying a burst of identical route lookups reaches Google once")
+        results, errors = run_threads(8, lambda: Google_API_Handler.retrieve_navigation_payload({"origin": "London", "destination": "Paris"}))
+        assert len(session.urls) == 1
+        assert Google_API_Handler.INFLIGHT.coalesced == 7
+        assert all(result["status"] == "OK" for result in results)
@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import pytest
+import logging
+
+import Google_API_Handler
+import NologyNav_Methods
+from Step_Table import StepTable
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def walking_step(duration, distance, maneuver=None):
+    step = {"travel_mode": "WALKING", "duration": {"value": duration}, "distance": {"value": distance}, "steps": [{}]}
+    if maneuver:
+        step["maneuver"] = maneuver
+    return step
+
+def transit_step(duration, distance, vehicleType, vehicleName):
+    return {
+        "travel_mode": "TRANSIT",
+        "duration": {"value": duration},
+        "distance": {"value": distance},
+        "transit_details": {"line": {"vehicle": {"type": vehicleType, "name": vehicleName}}}
+    }
+
+# Two legs: walk, bus, walk onto a ferry, then a train.
+TRANSIT_ROUTE = {"routes": [{"legs": [
+    {"duration": {"value": 1560}, "steps": [walking_step(300, 400), transit_step(900, 6000, "BUS", "Bus"), walking_step(360, 500, "ferry")]},
+    {"duration": {"value": 2400}, "steps": [transit_step(2400, 40000, "HEAVY_RAIL", "Train")]}
+]}]}
+
+class TestStepTable:
+    @pytest.mark.parametrize("input", [
+        ("Disneyland_to_Seaworld.json"),
+        ("Disneyland_to_UniversalStudios.json"),
+        ("London_to_Paris.json")
+    ])
+    def test_modes_match_step_loop(self, input):
+        with open("test/routes/" + input) as test_file:
+            route = json.load(test_file)
+        steps = route["routes"][0]["legs"][0]["steps"]
+
+        logger.info("Building the step table for " + input)
+        stepTable = StepTable(steps)
+        assert len(stepTable) == len(steps)
+
+        logger.info("Verifying modes and totals match a loop over the step dicts")
+        assert stepTable.modes() == NologyNav_Methods.collect_modes(steps)
+        assert sum(stepTable.duration_by_mode().values()) == sum(step["duration"]["value"] for step in steps)
+        assert sum(stepTable.distance_by_mode().values()) == sum(step["distance"]["value"] for step in steps)
+
+    def test_transit_route(self):
+        logger.info("Building the step table for every leg of a transit route")
+        stepTable = StepTable.from_legs(TRANSIT_ROUTE["routes"][0]["legs"])
+
+        assert len(stepTable) == 4
+        assert stepTable.modes() == ["walking", "transit", "ferry"]
+        assert stepTable.duration_by_mode() == {"walking": 660, "transit": 3300}
+        assert stepTable.distance_by_mode() == {"walking": 900, "transit": 46000}
+
+    def test_empty_table(self):
+        stepTable = StepTable([])
+
+        logger.info("Verifying a route without steps aggregates to nothing")
+        assert stepTable.modes() == []
+        assert stepTable.duration_by_mode() == {}
+
+    def test_transit_helpers(self, capsys):
+        logger.info("Verifying the Google_API_Handler transit helpers read the steps")
+        assert Google_API_Handler.get_transit_mode(TRANSIT_ROUTE) == "Bus"
+        assert Google_API_Handler.get_transit_route_preferences(TRANSIT_ROUTE) == {"duration": 1560, "walking_duration": 660, "transit_duration": 900}
+
+        logger.info("Verifying nothing is printed to stdout")
+        assert capsys.readouterr().out == ""
@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import pytest
+import httpx
+import asyncio
+import logging
+import collections
+
+import Tracing
+import Google_API_Handler
+import NologyNav_ASGI
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Tracing import SpanFile, start_trace, span, NO_SPAN
+from conftest import FakeAsyncClient
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+async def post_summary(headers):
+    transport = httpx.ASGITransport(app=NologyNav_ASGI.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://nologynav") as client:
+        return await client.post("/get_summary", json={"origin": "London", "destination": "Paris"}, headers=headers)
+
+@pytest.fixture
+def spans(monkeypatch):
+    spans = collections.deque(maxlen=100)
+    monkeypatch.setattr(Tracing, "SPANS", spans)
+    return spans
+
+class TestTracing:
+    @pytest.mark.parametrize("input, output", [
+        ((0.0, f"00-{TRACE_ID}-00f067aa0ba902b7-01", None), (TRACE_ID, "00f067aa0ba902b7")),
+        ((1.0, None, "checkout-42"), ("checkout-42", None)),
+        ((1.0, "not a traceparent", "bad id!"), (None, None)),
+        ((0.0, f"00-{TRACE_ID}-00f067aa0ba902b7-00", None), NO_SPAN)
+    ])
+    def test_start_trace(self, monkeypatch, input, output):
+        sampleRate, traceparent, traceId = input
+        monkeypatch.setattr(Tracing, "SAMPLE_RATE", sampleRate)
+
+        logger.info("Verifying the trace ID is taken from the request headers: " + str(input))
+        trace = start_trace("get_summary", traceparent, traceId)
+        if output is NO_SPAN:
+            assert trace is NO_SPAN
+        elif output[0] is None:
+            assert len(trace.trace_id) == 32 and trace.parent_id is None
+        else:
+            assert (trace.trace_id, trace.parent_id) == output
+
+    def test_untraced_request(self, monkeypatch, spans):
+        monkeypatch.setattr(Tracing, "SAMPLE_RATE", 0.0)
+
+        logger.info("Verifying nothing is recorded outside a sampled trace")
+        with start_trace("get_summary"):
+            with span("extract"):
+                pass
+        assert len(spans) == 0
+
+    def test_summary_trace(self, monkeypatch, session, spans):
+        monkeypatch.setattr(Tracing, "SAMPLE_RATE", 0.0)
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        client = create_app().test_client()
+
+        response = client.post('/get_summary', json = {"origin": "London", "destination": "Paris"}, headers = {"traceparent": f"00-{TRACE_ID}-00f067aa0ba902b7-01"})
+        assert response.status_code == 200
+        assert response.headers["X-Trace-Id"] == TRACE_ID
+
+        logger.info("Verifying every stage of the request is a span of the caller's trace")
+        byName = {span["name"]: span for span in spans}
+        for name in ("get_summary", "parse_request", "retrieve_data_from_google", "url_builder", "upstream", "parse", "check_geocoding", "extract", "extract_route_summary", "summary", "serialize"):
+            assert byName[name]["trace_id"] == TRACE_ID
+        assert byName["get_summary"]["parent_id"] == "00f067aa0ba902b7"
+        assert byName["get_summary"]["attributes"]["status"] == 200
+        assert byName["upstream"]["attributes"] == {"code": 200, "attempt": 0}
+
+        logger.info("Verifying spans are nested under the stage that called them")
+        assert byName["url_builder"]["parent_id"] == byName["retrieve_data_from_google"]["span_id"]
+        assert byName["summary"]["parent_id"] == byName["extract"]["span_id"]
+        assert byName["retrieve_data_from_google"]["parent_id"] == byName["get_summary"]["span_id"]
+
+        logger.info("Verifying the spans can be read back by trace ID")
+        traces = json.loads(client.get('/traces', query_string = {"trace_id": TRACE_ID}).data)
+        assert {span["name"] for span in traces["spans"]} == set(byName)
+
+    def test_asgi_summary_trace(self, monkeypatch, spans):
+        monkeypatch.setattr(Tracing, "SAMPLE_RATE", 0.0)
+        monkeypatch.setattr(Google_API_Handler, "get_async_client", lambda: FakeAsyncClient())
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+
+        logger.info("Verifying the ASGI entry point traces /get_summary under the caller's trace ID")
+        response = asyncio.run(post_summary({"X-Trace-Id": "checkout-42", "traceparent": f"00-{TRACE_ID}-00f067aa0ba902b7-01"}))
+        assert response.status_code == 200
+        assert response.headers["X-Trace-Id"] == TRACE_ID
+        byName = {span["name"]: span for span in spans}
+        assert byName["upstream"]["trace_id"] == TRACE_ID
+        assert byName["retrieve_data_from_google_async"]["parent_id"] == byName["get_summary"]["span_id"]
+
+    def test_span_file_rotation(self, tmp_path):
+        path = str(tmp_path / "spans.jsonl")
+        spanFile = SpanFile(path, max_bytes=200, backups=2)
+
+        logger.info("Verifying the span file is rotated once it is full, keeping two backups")
+        for index in range(12):
+            spanFile.write({"name": "upstream", "index": index, "padding": "x" * 40})
+        spanFile.close()
+        assert sorted(os.listdir(tmp_path)) == ["spans.jsonl", "spans.jsonl.1", "spans.jsonl.2"]
+        for name in os.listdir(tmp_path):
+            assert os.path.getsize(tmp_path / name) <= 200
+        with open(path) as spansFile:
+            assert json.loads(spansFile.readlines()[-1])["index"] == 11
+
+    def test_span_file_per_process(self, tmp_path):
+        spanFile = SpanFile(str(tmp_path / "spans-{pid}.jsonl"))
+        spanFile.write({"name": "parent"})
+
+        logger.info("Verifying a forked process writes its own span file")
+        child = os.fork()
+        if child == 0:
+            try:
+                spanFile.write({"name": "child"})
+            finally:
+                os._exit(0)
+        os.waitpid(child, 0)
+        spanFile.close()
+        with open(tmp_path / f"spans-{os.getpid()}.jsonl") as spansFile:
+            assert [json.loads(line)["name"] for line in spansFile] == ["parent"]
+        with open(tmp_path / f"spans-{child}.jsonl") as spansFile:
+            assert [json.loads(line)["name"] for line in spansFile] == ["child"]
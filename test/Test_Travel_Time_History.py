@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import time
+import pytest
+import logging
+import statistics
+
+import Google_API_Handler
+from NologyNav import create_app
+from Route_Cache import RouteCache
+from Travel_Time_History import TravelTimeHistory, route_key
+from conftest import FakeClock
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+LOCATIONS = {"origin": "London", "destination": "Paris"}
+MONDAY_9AM = time.mktime((2026, 10, 19, 9, 15, 0, 0, 0, -1))
+
+class TestTravelTimeHistory:
+    @pytest.mark.parametrize("input, output", [
+        ([1200, 1260, 1180, 1230, 1210], True),
+        ([1200, 1900, 800, 1500, 1000], False),
+        ([1200, 1260, 1180, 1230], False)
+    ])
+    def test_estimate(self, input, output):
+        history = TravelTimeHistory(min_samples=5, max_spread=0.15, clock=FakeClock(MONDAY_9AM))
+        for seconds in input:
+            history.observe("london|paris:driving:", "duration", seconds)
+
+        logger.info("Verifying the running mean and deviation match the observations: " + str(input))
+        count, mean, stddev, updatedAt = history.bucket_stats("london|paris:driving:", "duration")
+        assert (count, mean, stddev) == (len(input), pytest.approx(statistics.mean(input)), pytest.approx(statistics.stdev(input)))
+
+        logger.info("Verifying an estimate is only given when the history is consistent enough")
+        estimate = history.estimate("london|paris:driving:", "duration")
+        assert (estimate is not None) == output
+        if output:
+            assert estimate == {"duration": round(statistics.mean(input)), "stddev": round(statistics.stdev(input), 1), "samples": 5}
+
+    def test_buckets_by_hour_and_age(self):
+        clock = FakeClock(MONDAY_9AM)
+        history = TravelTimeHistory(min_samples=1, max_age=86400, clock=clock)
+        history.observe("route", "duration", 600)
+
+        logger.info("Verifying travel at another hour of the week has no estimate")
+        assert history.estimate("route", "duration", MONDAY_9AM + 1800) is not None
+        assert history.estimate("route", "duration", MONDAY_9AM + 3600) is None
+        assert history.estimate("route", "duration", MONDAY_9AM + 86400) is None
+
+        logger.info("Verifying history older than max_age is not used")
+        clock.now += 7 * 86400
+        assert history.estimate("route", "duration") is None
+
+    def test_shared_file(self, tmp_path):
+        path = str(tmp_path / "history.sqlite")
+        first = TravelTimeHistory(path, clock=FakeClock(MONDAY_9AM))
+        second = TravelTimeHistory(path, clock=FakeClock(MONDAY_9AM))
+
+        logger.info("Verifying observations written by several workers are combined in the file")
+        for seconds in (1000, 1100):
+            first.observe("route", "duration", seconds)
+        for seconds in (1300, 900, 1200):
+            second.observe("route", "duration", seconds)
+        reopened = TravelTimeHistory(path, clock=FakeClock(MONDAY_9AM))
+        count, mean, stddev, updatedAt = reopened.bucket_stats("route", "duration")
+        assert (count, mean, stddev) == (5, pytest.approx(1100), pytest.approx(statistics.stdev([1000, 1100, 1300, 900, 1200])))
+
+    @pytest.mark.parametrize("input, output", [
+        ({"origin": " London ", "destination": "PARIS"}, "london|paris:driving:"),
+        ({"origin": "London", "destination": "Paris", "waypoints": ("Calais",), "mode": "walking", "avoid": ("tolls", "ferries")}, "london|calais|paris:walking:tolls,ferries"),
+        ({"origin": "London", "destination": "Paris", "departure_time": "now", "alternatives": "true"}, "london|paris:driving:")
+    ])
+    def test_route_key(self, input, output):
+        logger.info("Verifying the route key only depends on the route: " + str(input))
+        assert route_key(input) == output
+
+    def test_get_eta(self, monkeypatch, session):
+        monkeypatch.setattr(Google_API_Handler, "ROUTE_CACHE", RouteCache())
+        monkeypatch.setattr(Google_API_Handler, "TRAVEL_HISTORY", TravelTimeHistory(min_samples=3))
+        client = create_app().test_client()
+
+        logger.info("Verifying travel times come from Google until there is enough history")
+        for _ in range(3):
+            response = client.post('/get_eta', json = dict(LOCATIONS, estimate=True), headers = {"Cache-Control": "no-cache"})
+            assert response.status_code == 200
+            responseData = json.loads(response.data)
+            assert responseData["source"] == "google"
+        assert "departure_time=now" in session.urls[0]
+        assert responseData["arrival_time"] - responseData["departure_time"] == responseData["duration"] == 20989
+
+        logger.info("Verifying the history then answers without calling Google")
+        responseData = json.loads(client.post('/get_eta', json = dict(LOCATIONS, estimate=True)).data)
+        assert responseData["source"] == "history"
+        assert (responseData["duration"], responseData["samples"], responseData["stddev"]) == (20989, 3, 0.0)
+        assert len(session.urls) == 3
+
+        logger.info("Verifying requests that do not ask for an estimate still go to Google")
+        assert json.loads(client.post('/get_eta', json = LOCATIONS).data)["source"] == "google"
+
+    @pytest.mark.parametrize("input, output", [
+        ({"origin": "London"}, "An origin and a destination are required."),
+        ({"origin": "London", "destination": "Paris", "departure_time": "tomorrow"}, "departure_time must be a Unix timestamp in seconds."),
+        ({"origin": "London", "destination": "Paris", "departure_time": 1000}, "departure_time must not be in the past."),
+        ({"origin": "London", "destination": "Paris", "estimate": "yes"}, "estimate must be true or false.")
+    ])
+    def test_get_eta_bad_request(self, input, output):
+        client = create_app().test_client()
+
+        logger.info("Verifying a bad /get_eta request is refused: " + str(input))
+        response = client.post('/get_eta', json = input)
+        assert response.status_code == 400
+        assert json.loads(response.data)["error"] == output
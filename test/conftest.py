@@ -0,0 +1,108 @@
+import json
+import time
+import asyncio
+import threading
+import contextlib
+import pytest
+
+import httpx
+
+import Google_API_Handler
+
+def load_body(name="London_to_Paris.json"):
+    with open("test/routes/" + name, "rb") as test_file:
+        return test_file.read()
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class FakeResponse:
+    def __init__(self, content, status_code=200):
+        if not isinstance(content, bytes):
+            content = json.dumps(content).encode("UTF-8")
+        self.content = content
+        self.status_code = status_code
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+class FakeSession:
+    # Answers every post with the same body, London to Paris unless given
+    # bytes or a payload, and records what it was asked for.
+    def __init__(self, content=None, status_code=200, delay=0):
+        self.content = load_body() if content is None else content
+        self.status_code = status_code
+        self.delay = delay
+        self.urls = []
+        self.requests = []
+        self.calls = 0
+        self.called = threading.Event()
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def respond(self, url):
+        return FakeResponse(self.content, self.status_code)
+
+    def post(self, url, **kwargs):
+        with self.lock:
+            self.urls.append(url)
+            self.requests.append(kwargs)
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        self.called.set()
+        try:
+            # Retry tests count backoff waits through a patched time.sleep.
+            if self.delay:
+                time.sleep(self.delay)
+            return self.respond(url)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+class ScriptedSession(FakeSession):
+    # Answers each post with the next response in turn, raising exceptions.
+    def __init__(self, responses):
+        super().__init__(b"")
+        self.responses = list(responses)
+
+    def respond(self, url):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+class FakeAsyncClient:
+    def __init__(self, payloads=None, delay=0):
+        body = load_body()
+        self.payloads = payloads or (lambda url: body)
+        self.delay = delay
+        self.calls = 0
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method, url, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        yield httpx.Response(200, content=self.payloads(url))
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def session(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(Google_API_Handler, "get_session", lambda: session)
+    return session